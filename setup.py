@@ -1,13 +1,13 @@
 import setuptools
-from ws_tool_name._version import __version__
+from ws_top10_rejected_libs._version import __version__
 
-tool_name = 'ws_top10_rejected_libs'
+tool_name = 'top10_rejected_libs'
 
 setuptools.setup(
     name=f"ws_{tool_name}",
     entry_points={
         'console_scripts': [
-            f'{tool_name}=ws_{tool_name}.{tool_name}:main'
+            f'ws_{tool_name}=ws_{tool_name}.top10_rejected:main'
         ]},
     version=__version__,
     author="Tidhar Meltzer",
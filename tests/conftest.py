@@ -0,0 +1,100 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from typing import Callable, Dict, List
+
+import pytest
+
+from ws_top10_rejected_libs.benchmark import AlertsStubServer, _ThreadingHTTPServer, iter_payload_chunks
+
+
+class Truncated(list):
+    """Alerts of a response whose connection breaks off halfway through the body"""
+
+
+class ScriptedServer(AlertsStubServer):
+    """API stub answering each request with the next scripted (status, body, headers) response.
+
+    The last response is repeated once the script is exhausted. A list body is streamed as an alerts response, a
+    callable body is called with the request payload first and any other body is sent as JSON. The payloads of the
+    requests received are kept in `payloads`.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.payloads: List[dict] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+                server.payloads.append(payload)
+                status, body, headers = server.script[min(len(server.payloads), len(server.script)) - 1]
+                if callable(body):
+                    body = body(payload)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if not isinstance(body, list):
+                    data = json.dumps(body).encode()
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                data = b"".join(iter_payload_chunks(body))
+                if isinstance(body, Truncated):
+                    data = data[:len(data) // 2]
+                    self.close_connection = True
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                if not isinstance(body, Truncated):
+                    self.wfile.write(b"0\r\n\r\n")
+
+        self.server = _ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+
+def make_alert(lib: int, date: str = "2021-01-01", project: int = 0) -> dict:
+    return {
+        "type": "REJECTED_BY_POLICY_RESOURCE",
+        "library": {"filename": "lib-{}.jar".format(lib), "keyUuid": "uuid-{}".format(lib), "type": "Java",
+                    "groupId": "org.group", "artifactId": "lib-{}".format(lib), "version": "1.0"},
+        "project": "project-{}".format(project),
+        "projectId": project,
+        "date": date
+    }
+
+
+def dated_alerts(alerts: List[dict]) -> Callable[[dict], List[dict]]:
+    # A response body of the alerts dated within the request's period
+    return lambda payload: [alert for alert in alerts
+                            if payload.get("fromDate", "") <= alert["date"][:10] <= payload.get("toDate", "9999")]
+
+
+def products_responder(alerts_by_product: Dict[str, List[dict]]) -> Callable[[dict], object]:
+    # A response body for getAllProducts, and of the product's alerts for product alert requests
+    def respond(payload: dict):
+        if payload["requestType"] == "getAllProducts":
+            return {"products": [{"productName": token.upper(), "productToken": token} for token in alerts_by_product]}
+        return dated_alerts(alerts_by_product[payload["productToken"]])(payload)
+    return respond
+
+
+@pytest.fixture
+def scripted_server():
+    servers = []
+
+    def start(*script) -> ScriptedServer:
+        server = ScriptedServer(script)
+        servers.append(server.__enter__())
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
@@ -0,0 +1,142 @@
+import random
+
+import pytest
+
+from ws_top10_rejected_libs.aggregation import BUCKET_MONTH, BUCKET_WEEK, DELTA_DOWN, DELTA_DROPPED, DELTA_NEW, \
+    DELTA_UNCHANGED, DELTA_UP, DistinctCounter, ExactCounter, HyperLogLog, SpaceSavingCounter, TrendCounter, \
+    bucket_key, iter_buckets, make_counter, rank_deltas
+
+
+def zipf_stream(count, keys, seed=0):
+    rnd = random.Random(seed)
+    return rnd.choices(range(keys), weights=[1 / (k + 1) for k in range(keys)], k=count)
+
+
+def counter(counts) -> ExactCounter:
+    occs = ExactCounter()
+    for key, count in counts.items():
+        occs.add(key, count)
+    return occs
+
+
+def test_make_counter():
+    assert type(make_counter()) is ExactCounter
+    assert type(make_counter(10)) is SpaceSavingCounter
+
+
+def test_space_saving_bounds():
+    stream = zipf_stream(20000, 1000)
+    exact, approx = ExactCounter(), SpaceSavingCounter(50)
+    exact.update(stream)
+    approx.update(stream)
+    assert len(approx) == 50
+    for key, count in approx.items():
+        true_count = exact.counts.get(key, 0)
+        # Over-estimated by at most the inherited count, which never exceeds total / capacity
+        assert true_count <= count <= true_count + approx.errors.get(key, 0)
+        assert approx.errors.get(key, 0) <= len(stream) / 50
+    for key, count in exact.items():
+        if count > len(stream) / 50:
+            assert key in approx.counts
+    assert [key for key, _ in approx.top(5)] == [key for key, _ in exact.top(5)]
+
+
+def test_space_saving_under_capacity_is_exact():
+    stream = zipf_stream(5000, 20)
+    exact, approx = ExactCounter(), SpaceSavingCounter(20)
+    exact.update(stream)
+    approx.update(stream)
+    assert approx.counts == exact.counts
+    assert not approx.errors
+
+
+@pytest.mark.parametrize("cardinality", [10, 1000, 50000])
+def test_hyperloglog_error(cardinality):
+    sketch = HyperLogLog(precision=10)
+    sketch.update(range(cardinality))
+    sketch.update(range(cardinality // 2))
+    assert abs(len(sketch) - cardinality) <= max(1, 0.1 * cardinality)
+
+
+def test_hyperloglog_merge():
+    left, right, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    left.update(range(0, 6000))
+    right.update(range(4000, 10000))
+    both.update(range(10000))
+    left.merge(right)
+    assert left.registers == both.registers
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+def test_distinct_counter(approximate):
+    occs = DistinctCounter(approximate=approximate, sketch_threshold=8)
+    for project in range(100):
+        occs.add(("many", project), 1)
+    for _ in range(500):
+        occs.add(("few", 1))
+    other = DistinctCounter(approximate=approximate, sketch_threshold=8)
+    for project in range(50, 200):
+        other.add(("many", project))
+    occs.merge(other)
+    assert occs.counts == {"many": 250, "few": 500}
+    assert occs.distinct_count("few") == 1
+    assert abs(occs.distinct_count("many") - 200) <= (20 if approximate else 0)
+    assert isinstance(occs.members["many"], HyperLogLog if approximate else set)
+    assert [key for key, _ in occs.ranked()] == ["many", "few"]
+    assert occs.top(1) == [("many", 250)]
+
+
+@pytest.mark.parametrize("date, bucket, key", [
+    ("2021-01-31", BUCKET_MONTH, "2021-01"), ("2021-02-01", BUCKET_MONTH, "2021-02"),
+    ("2021-03-07", BUCKET_WEEK, "2021-03-01"), ("2021-03-08", BUCKET_WEEK, "2021-03-08"),
+    ("2021-01-01", BUCKET_WEEK, "2020-12-28"), ("2020-12-31", BUCKET_WEEK, "2020-12-28")])
+def test_bucket_key(date, bucket, key):
+    assert bucket_key(date, bucket) == key
+
+
+def test_iter_buckets():
+    assert list(iter_buckets("2020-11-30", "2021-02-01")) == ["2020-11", "2020-12", "2021-01", "2021-02"]
+    assert list(iter_buckets("2021-01-31", "2021-01-31")) == ["2021-01"]
+    # Weeks starting before `start` or on `end` are included
+    assert list(iter_buckets("2020-12-31", "2021-01-11", BUCKET_WEEK)) == ["2020-12-28", "2021-01-04", "2021-01-11"]
+    assert list(iter_buckets("2021-01-04", "2021-01-10", BUCKET_WEEK)) == ["2021-01-04"]
+    assert list(iter_buckets("2021-01-10", "2021-01-04", BUCKET_WEEK)) == []
+
+
+def test_trend_counter():
+    occs = TrendCounter()
+    occs.add(("2021-01", "a"), 2)
+    occs.add(("2021-02", "a"))
+    occs.add(("2021-02", "b"))
+    other = TrendCounter()
+    other.add(("2021-02", "b"), 3)
+    occs.merge(other)
+    assert occs.counts == {"a": 3, "b": 4}
+    assert occs.trend(["a", "b"], ["2021-01", "2021-02", "2021-03"]) == \
+        [("2021-01", [2, 0]), ("2021-02", [1, 4]), ("2021-03", [0, 0])]
+    assert occs.bucket_counter("2021-02").counts == {"a": 1, "b": 4}
+    with pytest.raises(TypeError):
+        occs.merge(ExactCounter())
+
+
+def test_rank_deltas():
+    previous = counter({"a": 50, "b": 40, "c": 30, "d": 20, "e": 10})
+    current = counter({"b": 60, "a": 45, "c": 25, "f": 22, "d": 5})
+    deltas = {delta.lib: delta for delta in rank_deltas(current, previous, top_n=3)}
+    assert [(lib, delta.status) for lib, delta in deltas.items()] == \
+        [("b", DELTA_UP), ("a", DELTA_DOWN), ("c", DELTA_UNCHANGED)]
+    assert deltas["b"].rank_change == 1
+    assert deltas["a"].rank_change == -1
+    assert deltas["a"].occurrence_change == -5
+
+    deltas = rank_deltas(current, previous, top_n=4)
+    assert [(delta.lib, delta.status) for delta in deltas] == \
+        [("b", DELTA_UP), ("a", DELTA_DOWN), ("c", DELTA_UNCHANGED), ("f", DELTA_NEW), ("d", DELTA_DROPPED)]
+    new, dropped = deltas[3], deltas[4]
+    assert (new.rank, new.previous_rank, new.rank_change, new.occurrence_change) == (4, 0, 0, 22)
+    assert (dropped.rank, dropped.previous_rank, dropped.occurrences, dropped.previous_occurrences) == (5, 4, 5, 20)
+
+
+def test_rank_deltas_without_previous_period():
+    deltas = rank_deltas(counter({"a": 2, "b": 1}), ExactCounter(), top_n=10)
+    assert [delta.status for delta in deltas] == [DELTA_NEW, DELTA_NEW]
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from ws_top10_rejected_libs.alert_cache import AlertCache, group_day_ranges, iter_days
+
+LIB_A = ("a.jar", "uuid-a", "Java", "org.a", "a", "1.0")
+LIB_B = ("b.jar", "uuid-b", "Java", "org.b", "b", "2.0")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with AlertCache(str(tmp_path / "cache.db"), "org") as alert_cache:
+        yield alert_cache
+
+
+def days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def test_iter_days():
+    assert list(iter_days("2021-02-27", "2021-03-02")) == ["2021-02-27", "2021-02-28", "2021-03-01", "2021-03-02"]
+    assert list(iter_days("2021-03-02", "2021-03-01")) == []
+
+
+def test_group_day_ranges():
+    assert group_day_ranges(["2021-01-30", "2021-01-31", "2021-02-01", "2021-02-03", "2021-02-05", "2021-02-06"]) == \
+        [("2021-01-30", "2021-02-01"), ("2021-02-03", "2021-02-03"), ("2021-02-05", "2021-02-06")]
+    assert group_day_ranges([]) == []
+
+
+def test_missing_days(cache):
+    cache.store("2021-01-02", "2021-01-03", {("2021-01-02", LIB_A): 2})
+    assert cache.missing_days("2021-01-01", "2021-01-04") == ["2021-01-01", "2021-01-04"]
+    assert cache.missing_days("2021-01-01", "2021-01-04", refresh=True) == list(iter_days("2021-01-01", "2021-01-04"))
+
+
+def test_missing_days_per_org(cache, tmp_path):
+    cache.store("2021-01-01", "2021-01-01", {("2021-01-01", LIB_A): 1})
+    with AlertCache(str(tmp_path / "cache.db"), "other org") as other_cache:
+        assert other_cache.missing_days("2021-01-01", "2021-01-01") == ["2021-01-01"]
+        assert list(other_cache.lib_occurrences("2021-01-01", "2021-01-01")) == []
+
+
+def test_recent_days_go_stale(tmp_path):
+    with AlertCache(str(tmp_path / "cache.db"), "org", ttl_hours=0) as cache:
+        old, recent = days_ago(30), days_ago(1)
+        cache.store(old, old, {})
+        cache.store(recent, recent, {})
+        # A day fetched once it settled is final, a recent one is refetched after the TTL
+        assert cache.missing_days(old, old) == []
+        assert cache.missing_days(recent, recent) == [recent]
+    with AlertCache(str(tmp_path / "cache.db"), "org", ttl_hours=24) as cache:
+        assert cache.missing_days(recent, recent) == []
+
+
+def test_days_fetched_before_their_end_go_stale(tmp_path):
+    with AlertCache(str(tmp_path / "cache.db"), "org", ttl_hours=24) as cache:
+        today, old = days_ago(0), days_ago(30)
+        cache.store(today, today, {})
+        cache.store(old, old, {})
+        assert cache.missing_days(today, today) == [today]
+        assert cache.missing_days(old, old) == []
+        # A day fetched while it was under way is incomplete, however long it has settled since
+        with cache.conn:
+            cache.conn.execute("UPDATE fetched_days SET fetched_at = ? WHERE day = ?",
+                               (datetime.strptime(old, '%Y-%m-%d').timestamp() + 3600, old))
+        assert cache.missing_days(old, old) == [old]
+
+
+def test_store_replaces_days(cache):
+    cache.store("2021-01-01", "2021-01-02", {("2021-01-01", LIB_A): 2, ("2021-01-02", LIB_A): 1,
+                                             ("2021-01-02", LIB_B): 5})
+    cache.store("2021-01-02", "2021-01-02", {("2021-01-02", LIB_B): 3})
+    assert dict(cache.lib_occurrences("2021-01-01", "2021-01-02")) == {LIB_A: 2, LIB_B: 3}
+    assert dict(cache.lib_occurrences("2021-01-02", "2021-01-02")) == {LIB_B: 3}
+    assert list(cache.day_lib_occurrences("2021-01-01", "2021-01-02")) == \
+        [("2021-01-01", LIB_A, 2), ("2021-01-02", LIB_B, 3)]
+
+
+def test_evict_before(cache):
+    cache.store("2021-01-01", "2021-01-03", {("2021-01-01", LIB_A): 1, ("2021-01-02", LIB_A): 2,
+                                             ("2021-01-03", LIB_B): 4})
+    cache.evict_before("2021-01-03")
+    assert cache.missing_days("2021-01-01", "2021-01-03") == ["2021-01-01", "2021-01-02"]
+    assert dict(cache.lib_occurrences("2021-01-01", "2021-01-03")) == {LIB_B: 4}
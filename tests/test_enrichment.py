@@ -0,0 +1,76 @@
+import pytest
+
+from ws_top10_rejected_libs import enrichment
+from ws_top10_rejected_libs.aggregation import LibDetails, LibKey
+from ws_top10_rejected_libs.enrichment import DetailsCache, LibraryEnricher
+from ws_top10_rejected_libs.ws_client import WsClient
+
+DETAILS_A = LibDetails(("Policy A",), ("Product",), ("Project 1", "Project 2"))
+DETAILS_B = LibDetails(("Policy B",), ("Product",), ("Project 1",))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = Clock()
+    monkeypatch.setattr(enrichment, "time", fake_clock)
+    return fake_clock
+
+
+def library_alerts(payload) -> list:
+    key_uuid = payload["libraryUuid"]
+    return [{"type": "REJECTED_BY_POLICY_RESOURCE", "description": "Policy " + key_uuid, "product": "Product",
+             "project": "Project " + key_uuid}]
+
+
+def test_details_cache_ttl(tmp_path, clock):
+    with DetailsCache(str(tmp_path / "cache.db"), "org", ttl_hours=1) as cache:
+        cache.put({"a": DETAILS_A})
+        clock.now += 3599
+        assert cache.get(["a", "b"]) == {"a": DETAILS_A}
+        clock.now += 2
+        assert cache.get(["a"]) == {}
+    with DetailsCache(str(tmp_path / "cache.db"), "other org", ttl_hours=1) as cache:
+        assert cache.get(["a"]) == {}
+
+
+def test_details_cache_drops_least_recently_used(tmp_path, clock):
+    with DetailsCache(str(tmp_path / "cache.db"), "org", max_entries=2) as cache:
+        cache.put({"a": DETAILS_A})
+        clock.now += 1
+        cache.put({"b": DETAILS_B})
+        clock.now += 1
+        assert cache.get(["a"]) == {"a": DETAILS_A}
+        clock.now += 1
+        cache.put({"c": DETAILS_B})
+        assert cache.get(["a", "b", "c"]) == {"a": DETAILS_A, "c": DETAILS_B}
+
+
+def test_enricher_fetches_each_library_once(scripted_server, tmp_path):
+    server = scripted_server((200, library_alerts, {}))
+    libs = [LibKey("a-1.0.jar", "a", "Java", "org.a", "a", "1.0"), LibKey("a.jar", "a", "Java", "org.a", "a", ""),
+            LibKey("b.jar", "b", "Java", "org.b", "b", "2.0"), LibKey("", "", "", "org.c", "", "")]
+    cache_file = str(tmp_path / "cache.db")
+    with WsClient(server.api_url, retries=1) as client:
+        enricher = LibraryEnricher(client, "user", "org", cache_file=cache_file, workers=4)
+        details = enricher.enrich(libs)
+        assert details == {"a": LibDetails(("Policy a",), ("Product",), ("Project a",)),
+                           "b": LibDetails(("Policy b",), ("Product",), ("Project b",))}
+        assert enricher.fetched == 2
+        assert sorted(payload["libraryUuid"] for payload in server.payloads) == ["a", "b"]
+        # A repeat run finds every library in the cache file
+        repeat = LibraryEnricher(client, "user", "org", cache_file=cache_file)
+        assert repeat.enrich(libs) == details
+        assert repeat.fetched == 0
+        assert len(server.payloads) == 2
+        # Without a cache file, every run fetches the details
+        assert LibraryEnricher(client, "user", "org").enrich(libs) == details
+        assert len(server.payloads) == 4
+    assert [path.name for path in tmp_path.iterdir()] == ["cache.db"]
@@ -0,0 +1,89 @@
+import csv
+import gzip
+import io
+import json
+import os
+import stat
+
+import pytest
+
+from ws_top10_rejected_libs.aggregation import LibDetails, LibKey
+from ws_top10_rejected_libs.exports import atomic_output, write_csv, write_jsonl_gz
+
+LIB_URL = "https://saas.whitesourcesoftware.com/Wss/WSS.html#!libraryDetails;uuid="
+LIB_A = LibKey("a.jar", "uuid-a", "Java", "org.a", "a", "1.0")
+LIB_B = LibKey("b.jar", "", "Java", "org.b", "b", "2.0")
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(str(path)).st_mode)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_atomic_output_new_file_mode(tmp_path):
+    output = tmp_path / "report.csv"
+    umask = os.umask(0o027)
+    try:
+        with atomic_output(str(output)) as f:
+            f.write(b"report")
+    finally:
+        os.umask(umask)
+    assert output.read_bytes() == b"report"
+    assert mode(output) == 0o640
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_atomic_output_keeps_replaced_file_mode(tmp_path):
+    output = tmp_path / "report.csv"
+    output.write_bytes(b"old report")
+    os.chmod(str(output), 0o664)
+    with atomic_output(str(output)) as f:
+        f.write(b"new report")
+    assert output.read_bytes() == b"new report"
+    assert mode(output) == 0o664
+
+
+def test_atomic_output_failure_keeps_replaced_file(tmp_path):
+    output = tmp_path / "report.csv"
+    output.write_bytes(b"old report")
+    with pytest.raises(RuntimeError):
+        with atomic_output(str(output)) as f:
+            f.write(b"partial")
+            raise RuntimeError("write failed")
+    assert output.read_bytes() == b"old report"
+    assert os.listdir(str(tmp_path)) == ["report.csv"]
+
+
+def test_write_csv(tmp_path):
+    output = tmp_path / "report.csv"
+    assert write_csv(str(output), iter([(LIB_A, 5), (LIB_B, 3)]), LIB_URL) == 2
+    with open(str(output), newline='', encoding='utf-8') as f:
+        assert list(csv.reader(f)) == [
+            ["Rank", "Name", "Type", "Group", "Artifact", "Version", "Occurrences", "URL"],
+            ["1", "a.jar", "Java", "org.a", "a", "1.0", "5", LIB_URL + "uuid-a"],
+            ["2", "b.jar", "Java", "org.b", "b", "2.0", "3", ""]]
+
+
+def test_write_csv_extra_columns():
+    output = io.BytesIO()
+    details = {"uuid-a": LibDetails(("Policy",), ("P1", "P2"))}
+    assert write_csv(output, [(LIB_A, 5), (LIB_B, 3)], LIB_URL, details=details,
+                     product_occs={LIB_A: {"P1": 1, "P2": 4}}, distinct={LIB_A: 2},
+                     distinct_header="Distinct Products") == 2
+    header, first, second = csv.reader(io.StringIO(output.getvalue().decode('utf-8')))
+    assert header[8:] == ["Distinct Products", "Policies", "Products", "Projects", "Occurrences per Product"]
+    assert first[8:] == ["2", "Policy", "P1; P2", "", "P2 (4); P1 (1)"]
+    assert second[8:] == ["0", "", "", "", ""]
+
+
+def test_write_jsonl_gz(tmp_path):
+    output = tmp_path / "report.jsonl.gz"
+    assert write_jsonl_gz(str(output), iter([(LIB_A, 5), (LIB_B, 3)]), LIB_URL, details={},
+                          product_occs={LIB_A: {"P1": 5}}, distinct={LIB_A: 2}) == 2
+    with gzip.open(str(output), 'rt', encoding='utf-8') as f:
+        first, second = [json.loads(line) for line in f]
+    assert first == {"rank": 1, "name": "a.jar", "uuid": "uuid-a", "type": "Java", "group": "org.a", "artifact": "a",
+                     "version": "1.0", "occurrences": 5, "url": LIB_URL + "uuid-a", "distinct_projects": 2,
+                     "policies": [], "products": [], "projects": [], "product_occurrences": {"P1": 5}}
+    assert (second["rank"], second["url"], second["distinct_projects"], second["product_occurrences"]) == \
+        (2, "", 0, {})
@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ws_top10_rejected_libs.aggregation import GROUP_BY_ARTIFACT, RANK_BY_PROJECTS, lib_key
+from ws_top10_rejected_libs.alert_cache import AlertCache
+from ws_top10_rejected_libs.fetcher import SCOPE_AUTO, SCOPE_PRODUCT, AlertFetcher, alerts_payload, \
+    previous_period, split_date_range
+from ws_top10_rejected_libs.metrics import STAGE_API_REQUEST, STAGE_JSON_DECODE, Metrics
+from ws_top10_rejected_libs.ws_client import WsClient
+
+from tests.conftest import dated_alerts, make_alert, products_responder
+
+ALERTS = [make_alert(1, "2021-01-01", 1), make_alert(1, "2021-01-02", 2), make_alert(2, "2021-01-02", 1),
+          make_alert(1, "2021-01-05 10:30:00", 1), make_alert(3, "2021-01-07", 3)]
+PAYLOAD = alerts_payload("user", "org", "2021-01-01", "2021-01-07")
+
+
+def lib(index: int):
+    return lib_key(make_alert(index))
+
+
+def fetcher(server, **kwargs) -> AlertFetcher:
+    return AlertFetcher(WsClient(server.api_url, retries=1), **kwargs)
+
+
+def test_split_date_range():
+    assert split_date_range("2021-01-01", "2021-01-07", 3) == \
+        [("2021-01-01", "2021-01-03"), ("2021-01-04", "2021-01-06"), ("2021-01-07", "2021-01-07")]
+    assert split_date_range("2021-01-01", "2021-01-07", 0) == [("2021-01-01", "2021-01-07")]
+
+
+def test_previous_period():
+    assert previous_period("2021-03-01", "2021-03-31") == ("2021-01-29", "2021-02-28")
+
+
+@pytest.mark.parametrize("window_days", [0, 1, 2, 7])
+def test_windows_count_every_alert_once(scripted_server, window_days):
+    # The stub ignores the requested dates, every window receives all alerts
+    server = scripted_server((200, ALERTS, {}))
+    occs = fetcher(server, window_days=window_days, workers=3).lib_occurrences(PAYLOAD)
+    assert occs.counts == {lib(1): 3, lib(2): 1, lib(3): 1}
+    assert len(server.payloads) == len(split_date_range("2021-01-01", "2021-01-07", window_days))
+
+
+def test_group_by_artifact(scripted_server):
+    other_version = dict(make_alert(1), library=dict(make_alert(1)["library"], version="2.0"))
+    server = scripted_server((200, ALERTS + [other_version], {}))
+    occs = fetcher(server, group_by=GROUP_BY_ARTIFACT).lib_occurrences(PAYLOAD)
+    assert sorted(occ for _, occ in occs.items()) == [1, 1, 4]
+
+
+def test_rank_by_projects(scripted_server):
+    server = scripted_server((200, ALERTS, {}))
+    occs = fetcher(server, window_days=2, rank_by=RANK_BY_PROJECTS).lib_occurrences(PAYLOAD)
+    assert occs.distinct_count(lib(1)) == 2
+    assert occs.ranked()[0] == (lib(1), 3)
+
+
+def test_compare_previous(scripted_server):
+    previous_alerts = [make_alert(2, "2020-12-26"), make_alert(2, "2020-12-31"), make_alert(1, "2020-12-25")]
+    server = scripted_server((200, dated_alerts(ALERTS + previous_alerts), {}))
+    alert_fetcher = fetcher(server, window_days=3, compare_previous=True)
+    occs = alert_fetcher.lib_occurrences(PAYLOAD)
+    assert occs.counts == {lib(1): 3, lib(2): 1, lib(3): 1}
+    assert alert_fetcher.previous_occs.counts == {lib(1): 1, lib(2): 2}
+    assert min(p["fromDate"] for p in server.payloads) == "2020-12-25"
+
+
+def test_product_scope(scripted_server):
+    server = scripted_server((200, products_responder({"p1": ALERTS[:2], "p2": ALERTS[2:]}), {}))
+    alert_fetcher = fetcher(server, window_days=3, scope=SCOPE_PRODUCT)
+    occs = alert_fetcher.lib_occurrences(PAYLOAD)
+    assert occs.counts == {lib(1): 3, lib(2): 1, lib(3): 1}
+    assert alert_fetcher.product_occs[lib(1)] == {"P1": 2, "P2": 1}
+
+
+def test_auto_scope_falls_back_to_products(scripted_server):
+    respond = products_responder({"p1": ALERTS[:2], "p2": ALERTS[2:]})
+
+    def respond_or_fail(payload):
+        return respond(payload) if "orgToken" not in payload or payload["requestType"] == "getAllProducts" \
+            else {"errorCode": 5001, "errorMessage": "Response too large"}
+    server = scripted_server((200, respond_or_fail, {}))
+    occs = fetcher(server, scope=SCOPE_AUTO).lib_occurrences(PAYLOAD)
+    assert occs.counts == {lib(1): 3, lib(2): 1, lib(3): 1}
+
+
+def test_cached_fetches_missing_days_only(scripted_server, tmp_path):
+    server = scripted_server((200, dated_alerts(ALERTS), {}))
+    with AlertCache(str(tmp_path / "cache.db"), "org") as cache:
+        alert_fetcher = fetcher(server, window_days=2)
+        first = alert_fetcher.lib_occurrences_cached(alerts_payload("user", "org", "2021-01-01", "2021-01-03"), cache)
+        assert first.counts == {lib(1): 2, lib(2): 1}
+        requests = len(server.payloads)
+        occs = alert_fetcher.lib_occurrences_cached(PAYLOAD, cache)
+        assert occs.counts == {lib(1): 3, lib(2): 1, lib(3): 1}
+        assert sorted((p["fromDate"], p["toDate"]) for p in server.payloads[requests:]) == \
+            [("2021-01-04", "2021-01-05"), ("2021-01-06", "2021-01-07")]
+
+
+def test_fetchers_sharing_a_client_measure_their_own_transfer(scripted_server):
+    alerts_by_type = {"A": ALERTS * 200, "B": ALERTS[:1]}
+    server = scripted_server((200, lambda payload: alerts_by_type[payload["alertType"]], {}))
+    ws_client = WsClient(server.api_url, retries=1)
+    fetchers = {alert_type: AlertFetcher(ws_client, window_days=1, metrics=Metrics([lambda record: None]))
+                for alert_type in alerts_by_type}
+
+    def fetch(alert_type):
+        return fetchers[alert_type].lib_occurrences(alerts_payload("user", "org", "2021-01-01", "2021-01-07",
+                                                                   alert_type))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(fetch, alerts_by_type))
+    assert sum(f.transfer.bytes_received for f in fetchers.values()) == ws_client.transfer.bytes_received
+    assert fetchers["A"].transfer.bytes_received > 100 * fetchers["B"].transfer.bytes_received
+    for alert_fetcher in fetchers.values():
+        records = alert_fetcher.metrics.records
+        assert records[STAGE_API_REQUEST]["bytes_received"] == alert_fetcher.transfer.bytes_received
+        assert records[STAGE_JSON_DECODE]["seconds"] >= 0
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from ws_top10_rejected_libs.json_stream import iter_object_array
+
+DOCUMENT = json.dumps({
+    "errorCode": 0,
+    "alerts": [
+        {"library": {"filename": "a-1.0.jar", "keyUuid": "u1"}, "vulnerability": {"score": 7.5, "cvss3": 1.5e10}},
+        1.5e10, -0.25, 12, 3E-2, True, False, None, "text with é and \"quotes\"", [], {},
+        {"nested": [1, [2.5, {"deep": -1e-3}]]}
+    ],
+    "total": 12
+}, ensure_ascii=False).encode()
+
+
+def chunked(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize("size", range(1, len(DOCUMENT) + 1))
+def test_any_chunk_size(size):
+    header = {}
+    alerts = list(iter_object_array(chunked(DOCUMENT, size), "alerts", header))
+    expected = json.loads(DOCUMENT)
+    assert alerts == expected["alerts"]
+    assert header == {"errorCode": 0, "total": 12}
+
+
+@pytest.mark.parametrize("size", range(1, 8))
+def test_number_split_at_fraction_and_exponent(size):
+    assert list(iter_object_array(chunked(b'{"alerts":[1.5e10, 2.25E-3,7]}', size), "alerts")) == [1.5e10, 2.25e-3, 7]
+
+
+def test_missing_array_keeps_header():
+    header = {}
+    assert list(iter_object_array([b'{"errorCode": 5001, "errorMessage": "bad token"}'], "alerts", header)) == []
+    assert header == {"errorCode": 5001, "errorMessage": "bad token"}
+
+
+def test_unterminated_array():
+    with pytest.raises(ValueError):
+        list(iter_object_array([b'{"alerts": [1, 2'], "alerts"))
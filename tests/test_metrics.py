@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from ws_top10_rejected_libs.metrics import RECORD_FIELDS, STAGE_COUNTING, STAGE_ENRICHMENT, JsonLinesExporter, \
+    Metrics, PrometheusTextfileExporter, StageTimer
+
+
+def test_metrics_accumulate_stages():
+    records = []
+    metrics = Metrics([records.append])
+    metrics.add(STAGE_COUNTING, 0.5, alerts=10)
+    metrics.add(STAGE_COUNTING, 0.25, alerts=5)
+    metrics.set(STAGE_COUNTING, unique_libraries=3)
+    metrics.emit(STAGE_COUNTING)
+    record, = records
+    assert {key: value for key, value in record.items() if key != "peak_rss_mb"} == \
+        {"stage": STAGE_COUNTING, "seconds": 0.75, "alerts": 15, "unique_libraries": 3}
+    assert record["peak_rss_mb"] > 0
+
+
+def test_metrics_stage():
+    records = []
+    metrics = Metrics([records.append])
+    with pytest.raises(RuntimeError):
+        with metrics.stage(STAGE_ENRICHMENT, api_requests=2):
+            raise RuntimeError("enrichment failed")
+    # The stage is published even if its block fails
+    assert [(record["stage"], record["api_requests"]) for record in records] == [(STAGE_ENRICHMENT, 2)]
+    assert records[0]["seconds"] >= 0
+    assert not Metrics().enabled and metrics.enabled
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    assert list(timer.iterate(range(3))) == [0, 1, 2]
+    assert timer.wrap(lambda value: value * 2)(4) == 8
+    assert timer.seconds > 0
+
+
+def test_json_lines_exporter(tmp_path, capsys):
+    output = tmp_path / "metrics.jsonl"
+    exporter = JsonLinesExporter(str(output))
+    exporter({"stage": "a", "seconds": 1.0})
+    exporter({"stage": "b", "seconds": 2.0, "alerts": 3})
+    assert [json.loads(line) for line in output.read_text().splitlines()] == \
+        [{"stage": "a", "seconds": 1.0}, {"stage": "b", "seconds": 2.0, "alerts": 3}]
+    JsonLinesExporter()({"stage": "a", "seconds": 1.0})
+    assert capsys.readouterr().out == '{"seconds": 1.0, "stage": "a"}\n'
+
+
+def test_prometheus_textfile_exporter(tmp_path):
+    output = tmp_path / "top10.prom"
+    exporter = PrometheusTextfileExporter(str(output), prefix="top10")
+    exporter({"stage": "a", "seconds": 1.0, "alerts": 3})
+    exporter({"stage": "b", "seconds": 2.0})
+    exporter({"stage": "a", "seconds": 4.0})
+    lines = output.read_text().splitlines()
+    assert lines[:3] == ['# TYPE top10_stage_seconds gauge', 'top10_stage_seconds{stage="a"} 4.0',
+                         'top10_stage_seconds{stage="b"} 2.0']
+    # The latest record of each stage replaces its previous one
+    assert 'top10_stage_alerts{stage="a"} 3' not in lines
+    assert [line for line in lines if line.startswith("# TYPE")] == \
+        ["# TYPE top10_stage_{} gauge".format(field) for field in RECORD_FIELDS]
+    assert [path.name for path in tmp_path.iterdir()] == ["top10.prom"]
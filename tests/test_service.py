@@ -0,0 +1,101 @@
+import io
+import threading
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from ws_top10_rejected_libs.aggregation import lib_key
+from ws_top10_rejected_libs.fetcher import SCOPE_AUTO, SCOPE_ORG, SCOPE_PRODUCT, AlertFetcher
+from ws_top10_rejected_libs.service import TopService, xlsx_content_type
+from ws_top10_rejected_libs.ws_client import WsClient
+
+from tests.conftest import dated_alerts, make_alert, products_responder
+
+
+def days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+LIB_URL = "https://saas.whitesourcesoftware.com/Wss/WSS.html#!libraryDetails;uuid="
+ALERTS = {"p1": [make_alert(1, days_ago(1)), make_alert(2, days_ago(3))],
+          "p2": [make_alert(1, days_ago(2)), make_alert(1, days_ago(20))]}
+
+
+def org_or_products_responder(payload):
+    # Organization alert requests are answered with the alerts of all products
+    if "orgToken" in payload and payload["requestType"] != "getAllProducts":
+        return dated_alerts(ALERTS["p1"] + ALERTS["p2"])(payload)
+    return products_responder(ALERTS)(payload)
+
+
+def service(server, **kwargs) -> TopService:
+    alert_fetcher = AlertFetcher(WsClient(server.api_url, retries=1), window_days=2, **kwargs)
+    return TopService(alert_fetcher, "user", "org", LIB_URL, period_days=10)
+
+
+@pytest.mark.parametrize("scope", [SCOPE_ORG, SCOPE_PRODUCT, SCOPE_AUTO])
+def test_refresh_in_scope(scripted_server, scope):
+    server = scripted_server((200, org_or_products_responder, {}))
+    top_service = service(server, scope=scope)
+    top_service.refresh()
+    occs = top_service.index.lib_occurrences(days_ago(10), days_ago(0))
+    assert occs.counts == {lib_key(make_alert(1)): 2, lib_key(make_alert(2)): 1}
+    assert all(("productToken" in payload) == (scope == SCOPE_PRODUCT) for payload in server.payloads
+               if payload["requestType"] != "getAllProducts")
+
+
+def test_refresh_falls_back_to_products(scripted_server):
+    server = scripted_server((200, org_or_products_responder, {}))
+    top_service = service(server, scope=SCOPE_AUTO, max_response_bytes=100)
+    top_service.refresh()
+    occs = top_service.index.lib_occurrences(days_ago(10), days_ago(0))
+    assert occs.counts == {lib_key(make_alert(1)): 2, lib_key(make_alert(2)): 1}
+    assert any("productToken" in payload for payload in server.payloads)
+
+
+@pytest.fixture
+def service_url(scripted_server):
+    # The URL of a refreshed service's HTTP server, listening on a free port
+    top_service = service(scripted_server((200, org_or_products_responder, {})), scope=SCOPE_ORG)
+    top_service.refresh()
+    server = top_service.make_server(port=0)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield "http://{}:{}".format(*server.server_address[:2])
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_top(service_url):
+    response = requests.get(service_url + "/top", params={"n": "1", "from": days_ago(2), "to": days_ago(0)})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/json"
+    top = response.json()
+    assert (top["from"], top["to"], top["group_by"]) == (days_ago(2), days_ago(0), "gav")
+    assert [(lib["rank"], lib["name"], lib["occurrences"]) for lib in top["libraries"]] == [(1, "lib-1.jar", 2)]
+    assert [lib["rank"] for lib in requests.get(service_url + "/top").json()["libraries"]] == [1, 2]
+
+
+@pytest.mark.parametrize("query", [{"n": "ten"}, {"from": "2021-13-01"}, {"group_by": "vendor"}])
+def test_http_invalid_query(service_url, query):
+    response = requests.get(service_url + "/top", params=query)
+    assert response.status_code == 400
+    assert response.json()["error"].startswith("Invalid")
+
+
+def test_http_spreadsheet(service_url):
+    response = requests.get(service_url + "/spreadsheet", params={"n": "5", "from": days_ago(10), "to": days_ago(0)})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == xlsx_content_type
+    assert response.headers["Content-Disposition"] == \
+        'attachment; filename="Top 5 Rejected Libraries - {}-{}.xlsx"'.format(days_ago(10), days_ago(0))
+    with zipfile.ZipFile(io.BytesIO(response.content)) as workbook:
+        assert workbook.testzip() is None
+
+
+def test_http_health(service_url):
+    health = requests.get(service_url + "/health").json()
+    assert (health["from"], health["to"]) == (days_ago(10), days_ago(0))
+    assert health["last_refresh"].startswith(days_ago(0))
+    assert requests.get(service_url + "/other").status_code == 404
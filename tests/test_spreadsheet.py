@@ -0,0 +1,110 @@
+import io
+import re
+import zipfile
+
+from ws_top10_rejected_libs import spreadsheet
+from ws_top10_rejected_libs.aggregation import LibKey
+from ws_top10_rejected_libs.spreadsheet import render_spreadsheet, write_spreadsheet
+
+LIBS = [(LibKey("lib-{}.jar".format(lib), "uuid-{}".format(lib), "Java", "org.group", "lib-{}".format(lib), "1.0"),
+         10 - lib) for lib in range(5)]
+LIB_URL = "https://saas.whitesourcesoftware.com/Wss/WSS.html#!libraryDetails;uuid="
+
+
+def test_render_spreadsheet():
+    xlsx = render_spreadsheet("Top", LIBS, LIB_URL)
+    with zipfile.ZipFile(io.BytesIO(xlsx)) as workbook:
+        assert workbook.testzip() is None
+        assert "xl/workbook.xml" in workbook.namelist()
+        assert 'name="Top"' in workbook.read("xl/workbook.xml").decode()
+        assert any(name.startswith("xl/media/") for name in workbook.namelist())
+    assert render_spreadsheet("Top", LIBS, LIB_URL, include_header_image=False).startswith(b"PK")
+
+
+def sheet_xml(xlsx, part: str = "xl/worksheets/sheet1.xml") -> str:
+    with zipfile.ZipFile(xlsx if isinstance(xlsx, str) else io.BytesIO(xlsx)) as workbook:
+        return workbook.read(part).decode()
+
+
+def column_widths(xml: str) -> list:
+    # The fitted widths, without the padding xlsxwriter adds
+    return [round(float(width)) - 1 for width in re.findall(r'<col [^>]*width="([0-9.]+)"', xml)]
+
+
+def test_write_spreadsheet_constant_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(spreadsheet, "max_sheet_rows", 5)
+    monkeypatch.setattr(spreadsheet, "max_sheet_urls", 2)
+    monkeypatch.setattr(spreadsheet, "max_col_width", 12)
+    libs = [(lib._replace(group="org.group.with.a.long.name") if rank == 2 else lib, occ)
+            for rank, (lib, occ) in enumerate(LIBS)]
+    output = str(tmp_path / "report.xlsx")
+    # The rows up to the sheet's last (the header and 4 libraries) are written, linking the first 2 libraries
+    assert write_spreadsheet(output, "Top", iter(libs), LIB_URL, include_header_image=False,
+                             constant_memory=True) == 4
+    xml = sheet_xml(output)
+    assert re.findall(r'<row r="(\d+)"', xml) == ["1", "2", "3", "4", "5"]
+    assert "lib-3.jar" in xml and "lib-4.jar" not in xml
+    assert re.findall(r'<hyperlink ref="(\w+)"', xml) == ["A2", "A3"]
+    assert re.findall(r'location="[^"]*uuid=([^"]+)"', xml) == ["uuid-0", "uuid-1"]
+    # Fitted to the longest value of each column, up to the cap
+    assert column_widths(xml) == [9, 4, 12, 8, 7, 11]
+
+
+def sheet_names(xlsx: bytes) -> list:
+    return re.findall(r'<sheet name="([^"]+)"', sheet_xml(xlsx, "xl/workbook.xml"))
+
+
+def test_trend_sheet(monkeypatch):
+    monkeypatch.setattr(spreadsheet, "max_chart_series", 2)
+    trend_libs = [lib for lib, _ in LIBS[:3]]
+    xlsx = render_spreadsheet("Top", LIBS, LIB_URL, include_header_image=False, trend_libs=trend_libs,
+                              trend=[("2021-01", [1, 2, 3]), ("2021-02", [0, 4, 0]), ("2021-03", [5, 0, 0])])
+    assert sheet_names(xlsx) == ["Top", "Trend"]
+    # A row per period with a column per library, up to the chart's series limit
+    xml = sheet_xml(xlsx, "xl/worksheets/sheet2.xml")
+    assert re.findall(r'<c r="([A-Z]+\d+)"', xml) == ["A1", "B1", "C1", "A2", "B2", "C2", "A3", "B3", "C3",
+                                                      "A4", "B4", "C4"]
+    assert re.findall(r'<c r="[BC][2-4]"><v>(\d+)</v>', xml) == ["1", "2", "0", "4", "5", "0"]
+    chart = sheet_xml(xlsx, "xl/charts/chart1.xml")
+    assert re.findall(r'<c:tx><c:strRef><c:f>([^<]+)</c:f>', chart) == ["Trend!$B$1", "Trend!$C$1"]
+    assert re.findall(r'<c:val><c:numRef><c:f>([^<]+)</c:f>', chart) == ["Trend!$B$2:$B$4", "Trend!$C$2:$C$4"]
+    assert set(re.findall(r'<c:cat><c:strRef><c:f>([^<]+)</c:f>', chart)) == {"Trend!$A$2:$A$4"}
+
+
+def sheet_rows(xlsx: bytes, sheet: int) -> list:
+    # The values of a sheet's rows with values, resolving shared strings
+    with zipfile.ZipFile(io.BytesIO(xlsx)) as workbook:
+        shared = re.findall(r'<si><t[^>]*>([^<]*)</t></si>', workbook.read("xl/sharedStrings.xml").decode())
+        xml = workbook.read("xl/worksheets/sheet{}.xml".format(sheet)).decode()
+    rows = []
+    for row in re.findall(r'<row [^>]*>(.*?)</row>', xml):
+        rows.append([shared[int(value)] if kind else int(value)
+                     for kind, value in re.findall(r'<c r="\w+"(?: s="\d+")?( t="s")?><v>([^<]*)</v></c>', row)])
+    return rows
+
+
+def test_alert_type_sheets():
+    lib_a, lib_b = LIBS[0][0], LIBS[1][0]
+    alert_types = ["REJECTED_BY_POLICY_RESOURCE", "SECURITY_VULNERABILITY"] + \
+        ["A_VERY_LONG_ALERT_TYPE_NAME_NUMBER_{}".format(n) for n in range(22)]
+    type_occs = {alert_type: {lib_a: 1} for alert_type in alert_types}
+    type_occs["SECURITY_VULNERABILITY"] = {lib_a: 2, lib_b: 3}
+    xlsx = render_spreadsheet("Top", [(lib_b, 3), (lib_a, 3)], LIB_URL, type_occs=type_occs,
+                              type_sheets=[(alert_type, sorted(occs.items(), key=lambda item: -item[1]))
+                                           for alert_type, occs in type_occs.items()])
+    names = sheet_names(xlsx)
+    assert names[:3] == ["Top", "REJECTED_BY_POLICY_RESOURCE", "SECURITY_VULNERABILITY"]
+    # Names cut to Excel's limit stay unique
+    assert names[3:6] == ["A_VERY_LONG_ALERT_TYPE_NAME_NUM", "A_VERY_LONG_ALERT_TYPE_NAME (2)",
+                          "A_VERY_LONG_ALERT_TYPE_NAME (3)"]
+    assert len(set(names)) == len(names) == 25 and max(len(name) for name in names) == 31
+
+    # The combined sheet has a column of occurrences per type, below the header image spanning all columns
+    top = sheet_rows(xlsx, 1)
+    assert top[0] == ["Name", "Type", "Group", "Artifact", "Version", "Occurrences"] + alert_types
+    assert top[1][:8] == ["lib-1.jar", "Java", "org.group", "lib-1", "1.0", 3, 0, 3]
+    assert top[2][5:9] == [3, 1, 2, 1]
+    assert '<mergeCell ref="A1:AD1"/>' in sheet_xml(xlsx)
+    assert sheet_rows(xlsx, 3) == [["Name", "Type", "Group", "Artifact", "Version", "Occurrences"],
+                                   ["lib-1.jar", "Java", "org.group", "lib-1", "1.0", 3],
+                                   ["lib-0.jar", "Java", "org.group", "lib-0", "1.0", 2]]
@@ -0,0 +1,153 @@
+import configparser
+import io
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from ws_top10_rejected_libs import top10_rejected
+from ws_top10_rejected_libs.metrics import STAGE_API_REQUEST, STAGE_CONFIG_LOAD, STAGE_COUNTING, STAGE_ENRICHMENT, \
+    STAGE_GAV_EXTRACTION, STAGE_JSON_DECODE, STAGE_TOTAL, STAGE_WORKBOOK_WRITE, Metrics
+from ws_top10_rejected_libs.top10_rejected import OrgSettings, get_arg_parser, get_enricher, get_pool_size, run_batch
+from ws_top10_rejected_libs.ws_client import WsClient
+
+from tests.conftest import dated_alerts, make_alert
+
+ALERTS = [make_alert(lib, "2021-01-0{}".format(1 + lib % 7)) for lib in range(20)]
+
+
+def test_pool_size():
+    parser = get_arg_parser()
+    assert get_pool_size(parser.parse_args(["-workers", "4", "-enrichWorkers", "16"])) == 4
+    assert get_pool_size(parser.parse_args(["-workers", "4", "-enrich", "-enrichWorkers", "16"])) == 16
+    assert get_pool_size(parser.parse_args(["-workers", "4", "-alertTypes", "REJECTED_BY_POLICY_RESOURCE,"
+                                            "SECURITY_VULNERABILITY", "-enrich", "-enrichWorkers", "6"])) == 8
+
+
+def test_enricher_persists_details_with_cache_only():
+    parser = get_arg_parser()
+    assert get_enricher(None, "user", "org", parser.parse_args([])) is None
+    assert get_enricher(None, "user", "org", parser.parse_args(["-enrich"])).cache_file == ""
+    assert get_enricher(None, "user", "org", parser.parse_args(["-enrich", "-cache", "alerts.db"])).cache_file == \
+        "alerts.db"
+
+
+def test_batch_organizations_sharing_a_client_measure_their_own_transfer(scripted_server, tmp_path, monkeypatch):
+    alerts_by_org = {"big": ALERTS * 100, "small": ALERTS[:2], "medium": ALERTS * 10}
+    server = scripted_server((200, lambda payload: alerts_by_org[payload["orgToken"]], {}))
+    clients = []
+
+    def client(*args, **kwargs):
+        clients.append(WsClient(*args, **kwargs))
+        return clients[-1]
+    monkeypatch.setattr(top10_rejected, "get_ws_api_url", lambda ws_url: server.api_url)
+    monkeypatch.setattr("ws_top10_rejected_libs.ws_client.WsClient", client)
+    args = get_arg_parser().parse_args(["-f", "csv", "-w", "1", "-batchWorkers", "3", "-retries", "1"])
+    metrics = Metrics([lambda record: None])
+    orgs = [OrgSettings(org, org, "user", "saas", "Company") for org in alerts_by_org]
+
+    assert run_batch(orgs, args, "Company", "Top", "2021-01-01", "2021-01-07", "", str(tmp_path), "", False,
+                     metrics) == 0
+    assert len(clients) == 1
+    assert metrics.records[STAGE_API_REQUEST]["bytes_received"] == clients[0].transfer.bytes_received
+    assert metrics.records[STAGE_API_REQUEST]["seconds"] <= clients[0].transfer.request_seconds + 1e-6
+    assert metrics.records[STAGE_JSON_DECODE]["seconds"] >= 0
+
+
+def write_config(tmp_path, monkeypatch):
+    cfg = configparser.ConfigParser()
+    cfg.optionxform = str
+    cfg[top10_rejected.SEC_WS] = {top10_rejected.ORG_NAME: "org", top10_rejected.ORG_TOKEN: "key",
+                                  top10_rejected.USER_KEY: "user", top10_rejected.ORG_ENV: "saas"}
+    cfg[top10_rejected.SEC_ST] = {top10_rejected.COMP_NAME: "Company", top10_rejected.DFLT_PRD: "3"}
+    cfg_file = tmp_path / "top10_rejected.config"
+    with open(str(cfg_file), "w") as f:
+        cfg.write(f)
+    monkeypatch.setattr(top10_rejected, "cfg_file", str(cfg_file))
+
+
+@pytest.mark.parametrize("options", [["-approx", "100", "-bucket", "month"], ["-approx", "100", "-comparePrevious"],
+                                     ["-approx", "100", "-rankBy", "projects"]])
+def test_approx_capacity_requires_plain_counts(tmp_path, monkeypatch, capsys, options):
+    write_config(tmp_path, monkeypatch)
+    assert top10_rejected.main(["-s", "2021-01-01", "-e", "2021-01-31"] + options) == 1
+    assert "cannot be combined" in capsys.readouterr().out
+
+
+def test_report_to_stdout(scripted_server, tmp_path, monkeypatch, capfdbinary):
+    server = scripted_server((200, ALERTS, {}))
+    write_config(tmp_path, monkeypatch)
+    monkeypatch.setattr(top10_rejected, "get_ws_api_url", lambda ws_url: server.api_url)
+    monkeypatch.chdir(str(tmp_path))
+    assert top10_rejected.main(["-s", "2021-01-01", "-e", "2021-01-07", "-out", "-"]) == 0
+    out, err = capfdbinary.readouterr()
+    # Only the workbook is written to stdout, the progress is printed to stderr
+    with zipfile.ZipFile(io.BytesIO(out)) as workbook:
+        assert workbook.testzip() is None
+        assert "xl/workbook.xml" in workbook.namelist()
+    assert b"Generating spreadsheet: -" in err
+    assert not os.path.exists(str(tmp_path / "files"))
+
+
+def test_metrics_records_every_stage(scripted_server, tmp_path, monkeypatch):
+    server = scripted_server((200, dated_alerts(ALERTS), {}))
+    write_config(tmp_path, monkeypatch)
+    monkeypatch.setattr(top10_rejected, "get_ws_api_url", lambda ws_url: server.api_url)
+    monkeypatch.chdir(str(tmp_path))
+    assert top10_rejected.main(["-s", "2021-01-01", "-e", "2021-01-07", "-w", "3", "-enrich",
+                               "-metrics", "metrics.jsonl"]) == 0
+    with open(str(tmp_path / "metrics.jsonl")) as f:
+        records = {record["stage"]: record for record in map(json.loads, f)}
+    assert list(records) == [STAGE_CONFIG_LOAD, STAGE_API_REQUEST, STAGE_JSON_DECODE, STAGE_GAV_EXTRACTION,
+                             STAGE_COUNTING, STAGE_ENRICHMENT, STAGE_WORKBOOK_WRITE, STAGE_TOTAL]
+    assert all(record["seconds"] >= 0 and record["peak_rss_mb"] > 0 for record in records.values())
+    assert records[STAGE_API_REQUEST]["bytes_received"] == records[STAGE_TOTAL]["bytes_received"] > 0
+    assert records[STAGE_GAV_EXTRACTION]["alerts"] == records[STAGE_TOTAL]["alerts"] == len(ALERTS)
+    assert records[STAGE_COUNTING]["unique_libraries"] == records[STAGE_TOTAL]["unique_libraries"] == len(ALERTS)
+    assert (records[STAGE_ENRICHMENT]["unique_libraries"], records[STAGE_ENRICHMENT]["api_requests"]) == (10, 10)
+    assert records[STAGE_TOTAL]["seconds"] >= records[STAGE_WORKBOOK_WRITE]["seconds"]
+
+
+def run_batch_main(server, tmp_path, monkeypatch, argv) -> int:
+    # Run main in batch mode in `tmp_path`, against the stub and with the config file of `tmp_path`
+    monkeypatch.setattr(top10_rejected, "get_ws_api_url", lambda ws_url: server.api_url)
+    monkeypatch.setattr(top10_rejected, "cfg_file", str(tmp_path / "top10_rejected.config"))
+    monkeypatch.chdir(str(tmp_path))
+    return top10_rejected.main(["-s", "2021-01-01", "-e", "2021-01-07", "-f", "csv"] + argv)
+
+
+def test_batch_orgs_file_without_config(scripted_server, tmp_path, monkeypatch):
+    server = scripted_server((200, ALERTS, {}))
+    with open(str(tmp_path / "orgs.csv"), "w") as f:
+        f.write("OrganizationName,ApiKey,UserKey,Domain\nOrg A,key-a,user,saas\nOrg B,key-b,user,saas\n")
+    # Prompting for a config would read the test's stdin, which fails
+    assert run_batch_main(server, tmp_path, monkeypatch, ["-orgs", "orgs.csv"]) == 0
+    assert not os.path.exists(str(tmp_path / "top10_rejected.config"))
+    files = os.listdir(str(tmp_path / "files"))
+    assert "Org A - Top 10 Rejected Libraries - 2021-01-01-2021-01-07.csv" in files
+    assert "Org B - Top 10 Rejected Libraries - 2021-01-01-2021-01-07.csv" in files
+    assert len([name for name in files if "Summary" in name]) == 1
+    assert {payload["orgToken"] for payload in server.payloads} == {"key-a", "key-b"}
+
+
+def test_batch_config_of_organization_sections_only(scripted_server, tmp_path, monkeypatch):
+    server = scripted_server((200, ALERTS, {}))
+    with open(str(tmp_path / "top10_rejected.config"), "w") as f:
+        f.write("[WhiteSource:Org A]\nApiKey=key-a\nUserKey=user\nDomain=saas\nCompanyName=Company\n\n"
+                "[WhiteSource:Org B]\nApiKey=key-b\nUserKey=user\nDomain=saas\nCompanyName=Company\n")
+    assert run_batch_main(server, tmp_path, monkeypatch, ["-batch"]) == 0
+    assert len(os.listdir(str(tmp_path / "files"))) == 3
+    assert {payload["orgToken"] for payload in server.payloads} == {"key-a", "key-b"}
+
+
+def test_arg_parser_loads_standard_library_only():
+    # Run in a fresh interpreter, as other tests already imported the HTTP client
+    code = ("import sys; from ws_top10_rejected_libs.top10_rejected import get_arg_parser; get_arg_parser(); "
+            "print(','.join(m for m in ('requests', 'urllib3', 'sqlite3', 'xlsxwriter') if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), os.environ.get("PYTHONPATH")))))
+    loaded = subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE, check=True).stdout
+    assert loaded.decode().strip() == ""
@@ -0,0 +1,101 @@
+import pytest
+
+from ws_top10_rejected_libs import fetcher
+from ws_top10_rejected_libs.fetcher import AlertFetcher, alerts_payload
+from ws_top10_rejected_libs.ws_client import TransferStats, WsApiError, WsClient, WsResponseTooLarge, \
+    WsStreamError, WsTransportError
+
+from tests.conftest import Truncated, make_alert
+
+ALERTS = [make_alert(lib) for lib in (1, 1, 2)]
+
+
+def client(server, retries=3) -> WsClient:
+    return WsClient(server.api_url, retries=retries, backoff=0, max_backoff=0)
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_retryable_status(scripted_server, status):
+    server = scripted_server((status, {}, {}), (status, {}, {}), (200, {"products": []}, {}))
+    with client(server) as ws_client:
+        assert ws_client.request({"requestType": "getAllProducts"}) == {"products": []}
+    assert len(server.payloads) == 3
+
+
+def test_gives_up_after_retries(scripted_server):
+    server = scripted_server((503, {}, {}))
+    with client(server, retries=2) as ws_client, pytest.raises(WsTransportError) as err:
+        ws_client.request({"requestType": "getAllProducts"})
+    assert err.value.status_code == 503
+    assert len(server.payloads) == 2
+
+
+def test_does_not_retry_client_errors(scripted_server):
+    server = scripted_server((400, {}, {}))
+    with client(server) as ws_client, pytest.raises(WsTransportError) as err:
+        ws_client.request({"requestType": "getAllProducts"})
+    assert err.value.status_code == 400
+    assert len(server.payloads) == 1
+
+
+def test_honours_retry_after(scripted_server):
+    server = scripted_server((429, {}, {"Retry-After": "0.01"}), (200, {}, {}))
+    ws_client = WsClient(server.api_url, retries=2, backoff=3600, max_backoff=3600)
+    assert ws_client._retry_delay(1) <= 3600
+    with ws_client:
+        assert ws_client.request({"requestType": "getAllProducts"}) == {}
+    assert len(server.payloads) == 2
+
+
+def test_error_code_raises_api_error(scripted_server):
+    server = scripted_server((200, {"errorCode": 2015, "errorMessage": "Invalid user key"}, {}))
+    with client(server) as ws_client:
+        with pytest.raises(WsApiError) as err:
+            ws_client.request({"requestType": "getAllProducts"})
+        assert err.value.error_code == 2015
+        assert err.value.error_message == "Invalid user key"
+        with pytest.raises(WsApiError):
+            list(ws_client.request_stream({"requestType": "getOrganizationAlertsByType"}, "alerts"))
+    assert len(server.payloads) == 2
+
+
+def test_request_stream(scripted_server):
+    server = scripted_server((200, ALERTS, {}))
+    with client(server) as ws_client:
+        transfer = TransferStats()
+        assert list(ws_client.request_stream({}, "alerts", transfer=transfer)) == ALERTS
+        assert transfer.bytes_received == ws_client.transfer.bytes_received > 0
+        assert transfer.request_seconds > 0
+
+
+def test_request_stream_max_bytes(scripted_server):
+    server = scripted_server((200, ALERTS, {}))
+    with client(server) as ws_client, pytest.raises(WsResponseTooLarge):
+        list(ws_client.request_stream({}, "alerts", max_bytes=100))
+
+
+def test_request_stream_broken_off(scripted_server):
+    server = scripted_server((200, Truncated(ALERTS), {}))
+    with client(server) as ws_client, pytest.raises(WsStreamError):
+        list(ws_client.request_stream({}, "alerts"))
+    assert len(server.payloads) == 1
+
+
+def fetch(server, retries=3):
+    alert_fetcher = AlertFetcher(client(server, retries), retries=retries)
+    return alert_fetcher.lib_occurrences(alerts_payload("user", "org", "2021-01-01", "2021-01-01"))
+
+
+def test_fetcher_requests_are_retried_in_one_layer(scripted_server):
+    server = scripted_server((503, {}, {}))
+    with pytest.raises(WsTransportError):
+        fetch(server)
+    assert len(server.payloads) == 3
+
+
+def test_fetcher_refetches_broken_off_window(scripted_server, monkeypatch):
+    monkeypatch.setattr(fetcher, "retry_backoff_seconds", 0)
+    server = scripted_server((200, Truncated(ALERTS), {}), (200, ALERTS, {}))
+    occs = fetch(server)
+    assert sorted(occ for _, occ in occs.items()) == [1, 2]
+    assert len(server.payloads) == 2
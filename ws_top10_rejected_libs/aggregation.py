@@ -0,0 +1,367 @@
+import heapq
+import itertools
+import math
+from datetime import datetime, timedelta
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, Hashable, Iterable, Iterator, List, NamedTuple, Sequence, Tuple, Union
+
+GROUP_BY_GAV = 'gav'
+GROUP_BY_ARTIFACT = 'artifact'
+GROUP_BY_GROUP = 'group'
+GROUP_BY_OPTIONS = (GROUP_BY_GAV, GROUP_BY_ARTIFACT, GROUP_BY_GROUP)
+max_names_length = 1000  # Cap of the joined policy/product/project names of a library
+BUCKET_MONTH = 'month'
+BUCKET_WEEK = 'week'
+BUCKET_OPTIONS = (BUCKET_MONTH, BUCKET_WEEK)
+RANK_BY_OCCURRENCES = 'occurrences'
+RANK_BY_PROJECTS = 'projects'
+RANK_BY_PRODUCTS = 'products'
+RANK_BY_OPTIONS = (RANK_BY_OCCURRENCES, RANK_BY_PROJECTS, RANK_BY_PRODUCTS)
+PERIOD_CURRENT = 'current'
+PERIOD_PREVIOUS = 'previous'
+DELTA_NEW = 'New'
+DELTA_UP = 'Up'
+DELTA_DOWN = 'Down'
+DELTA_UNCHANGED = 'Unchanged'
+DELTA_DROPPED = 'Dropped'
+default_sketch_threshold = 64  # Distinct members kept exactly per key before switching to a sketch
+default_sketch_precision = 10  # 1024 registers, about 3% relative error
+_MASK64 = (1 << 64) - 1
+
+
+class LibKey(NamedTuple):
+    """Library fields in spreadsheet order"""
+    name: str
+    uuid: str
+    type: str
+    group: str
+    artifact: str
+    version: str
+
+
+class RankDelta(NamedTuple):
+    """Rank and occurrences of a library in the current and the previous period (rank 0: not ranked)"""
+    lib: Hashable
+    rank: int
+    previous_rank: int
+    occurrences: int
+    previous_occurrences: int
+    status: str
+
+    @property
+    def rank_change(self) -> int:
+        # Positive when the library moved up, 0 when either rank is missing
+        return self.previous_rank - self.rank if self.rank and self.previous_rank else 0
+
+    @property
+    def occurrence_change(self) -> int:
+        return self.occurrences - self.previous_occurrences
+
+
+class LibDetails(NamedTuple):
+    """Rejecting policies and the products and projects using a library"""
+    policies: Tuple[str, ...] = ()
+    products: Tuple[str, ...] = ()
+    projects: Tuple[str, ...] = ()
+
+
+def join_names(names: Iterable[str], limit: int = max_names_length) -> str:
+    text = "; ".join(names)
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def product_breakdown(product_occs: Dict[str, int]) -> str:
+    # 'Product A (120); Product B (30)', most occurrences first
+    return join_names("{} ({})".format(product, occ) for product, occ in
+                      sorted(product_occs.items(), key=itemgetter(1), reverse=True))
+
+
+def lib_key(alert: dict) -> LibKey:
+    lib = alert["library"]
+    return LibKey(lib.get("filename") or "", lib.get("keyUuid") or "", lib.get("type") or "",
+                  lib.get("groupId") or "", lib.get("artifactId") or "", lib.get("version") or "")
+
+
+def group_key(key: LibKey, group_by: str = GROUP_BY_GAV) -> LibKey:
+    """Reduce a library key to its group: the full GAV, the artifact across versions or the group id.
+
+    Libraries without an artifact (or group) id keep their full key, as there is nothing to group them by.
+    """
+    if group_by == GROUP_BY_ARTIFACT and key.artifact:
+        return LibKey(key.artifact, "", key.type, key.group, key.artifact, "")
+    if group_by == GROUP_BY_GROUP and key.group:
+        return LibKey(key.group, "", key.type, key.group, "", "")
+    return key
+
+
+@lru_cache(maxsize=4096)
+def bucket_key(date: str, bucket: str = BUCKET_MONTH) -> str:
+    # The period of a 'yyyy-MM-dd' date: 'yyyy-MM' for months, the date of its week's Monday for weeks
+    if bucket == BUCKET_WEEK:
+        dt = datetime.strptime(date, '%Y-%m-%d')
+        return (dt - timedelta(days=dt.weekday())).strftime('%Y-%m-%d')
+    return date[:7]
+
+
+def iter_buckets(start: str, end: str, bucket: str = BUCKET_MONTH) -> Iterator[str]:
+    # Every bucket from the one of `start` to the one of `end`, in order
+    dt = datetime.strptime(start, '%Y-%m-%d')
+    dt_end = datetime.strptime(end, '%Y-%m-%d')
+    last = None
+    while dt <= dt_end:
+        key = bucket_key(dt.strftime('%Y-%m-%d'), bucket)
+        if key != last:
+            yield key
+            last = key
+        dt += timedelta(days=7 if bucket == BUCKET_WEEK else 1)
+    if last is not None and last != bucket_key(end, bucket):
+        yield bucket_key(end, bucket)
+
+
+class ExactCounter:
+    """Occurrences of every key, with heap based top-N selection"""
+
+    def __init__(self):
+        self.counts: Dict[Hashable, int] = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key: Hashable, count: int = 1):
+        self.counts[key] = self.counts.get(key, 0) + count
+
+    def update(self, keys: Iterable[Hashable]):
+        for key in keys:
+            self.add(key)
+
+    def merge(self, other: "ExactCounter"):
+        for key, count in other.items():
+            self.add(key, count)
+
+    def items(self) -> Iterator[Tuple[Hashable, int]]:
+        return iter(self.counts.items())
+
+    def top(self, n: int) -> List[Tuple[Hashable, int]]:
+        return heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+
+    def ranked(self) -> List[Tuple[Hashable, int]]:
+        # All keys, most common first
+        return sorted(self.counts.items(), key=itemgetter(1), reverse=True)
+
+
+class SpaceSavingCounter(ExactCounter):
+    """Approximate heavy hitters tracking at most `capacity` keys (Space-Saving algorithm).
+
+    When full, a new key replaces the key with the lowest count and inherits that count, so counts are
+    over-estimated by at most the evicted count (kept in `errors`). Any key occurring more than
+    total / capacity times is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.capacity = max(1, capacity)
+        self.errors: Dict[Hashable, int] = {}
+        self._heap: List[Tuple[int, int, Hashable]] = []  # Lazy min-heap of (count, seq, key), may hold stale entries
+        self._seq = itertools.count()
+
+    def _push(self, key: Hashable, count: int):
+        heapq.heappush(self._heap, (count, next(self._seq), key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, next(self._seq), k) for k, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[Hashable, int]:
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def add(self, key: Hashable, count: int = 1):
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = count
+        else:
+            min_key, min_count = self._pop_min()
+            del self.counts[min_key]
+            self.errors.pop(min_key, None)
+            self.counts[key] = min_count + count
+            self.errors[key] = min_count
+        self._push(key, self.counts[key])
+
+
+class TrendCounter(ExactCounter):
+    """Occurrences per time bucket and key, counted in a single pass.
+
+    Keys are added as (bucket, key) pairs; items(), top() and ranked() report the totals over all buckets.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buckets: Dict[str, Dict[Hashable, int]] = {}
+
+    def add(self, key: Tuple[str, Hashable], count: int = 1):
+        bucket, key = key
+        bucket_counts = self.buckets.get(bucket)
+        if bucket_counts is None:
+            bucket_counts = self.buckets[bucket] = {}
+        bucket_counts[key] = bucket_counts.get(key, 0) + count
+        self.counts[key] = self.counts.get(key, 0) + count
+
+    def merge(self, other: "ExactCounter"):
+        if not isinstance(other, TrendCounter):
+            raise TypeError("Only trend counters can be merged into a trend counter")
+        for bucket, bucket_counts in other.buckets.items():
+            for key, count in bucket_counts.items():
+                self.add((bucket, key), count)
+
+    def trend(self, keys: Sequence[Hashable], buckets: Iterable[str] = None) -> List[Tuple[str, List[int]]]:
+        # Occurrences of `keys` per bucket, as (bucket, [count of each key]), for `buckets` or the counted ones
+        buckets = sorted(self.buckets) if buckets is None else buckets
+        trend = []
+        for bucket in buckets:
+            bucket_counts = self.buckets.get(bucket, {})
+            trend.append((bucket, [bucket_counts.get(key, 0) for key in keys]))
+        return trend
+
+    def bucket_counter(self, bucket: str) -> ExactCounter:
+        # The occurrences of a single bucket
+        occs = ExactCounter()
+        occs.counts = dict(self.buckets.get(bucket, {}))
+        return occs
+
+
+def rank_deltas(current: ExactCounter, previous: ExactCounter, top_n: int) -> List[RankDelta]:
+    """Changes of the current period's top N libraries since the previous period, followed by the libraries of the
+    previous period's top N that dropped out of it.
+
+    Libraries without previous occurrences are 'New', the others moved 'Up', 'Down' or stayed 'Unchanged' in the
+    complete ranking of both periods.
+    """
+    current_ranked, previous_ranked = current.ranked(), previous.ranked()
+    current_ranks = {lib: rank for rank, (lib, _) in enumerate(current_ranked, start=1)}
+    previous_ranks = {lib: rank for rank, (lib, _) in enumerate(previous_ranked, start=1)}
+    deltas = []
+    for rank, (lib, occ) in enumerate(current_ranked[:top_n], start=1):
+        previous_rank = previous_ranks.get(lib, 0)
+        if not previous_rank:
+            status = DELTA_NEW
+        else:
+            status = DELTA_UP if previous_rank > rank else DELTA_DOWN if previous_rank < rank else DELTA_UNCHANGED
+        deltas.append(RankDelta(lib, rank, previous_rank, occ, previous.counts.get(lib, 0), status))
+    for previous_rank, (lib, previous_occ) in enumerate(previous_ranked[:top_n], start=1):
+        rank = current_ranks.get(lib, 0)
+        if not rank or rank > top_n:
+            deltas.append(RankDelta(lib, rank, previous_rank, current.counts.get(lib, 0), previous_occ, DELTA_DROPPED))
+    return deltas
+
+
+def _mix64(value: int) -> int:
+    # SplitMix64 finalizer, spreading (sequential) integer ids over 64 bits
+    z = (value + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+class HyperLogLog:
+    """Cardinality sketch of integer members in 2**precision one-byte registers"""
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision: int = default_sketch_precision):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, member: int):
+        h = _mix64(member)
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & _MASK64
+        rank = min(64 - rest.bit_length() + 1, 64 - self.precision + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, members: Iterable[int]):
+        for member in members:
+            self.add(member)
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __len__(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+
+class DistinctCounter(ExactCounter):
+    """Occurrences and distinct members (e.g. project ids) per key, ranked by the number of distinct members.
+
+    Keys are added as (key, member id) pairs; items() reports the occurrences, top() and ranked() order the
+    keys by distinct_count(). Members are kept in an integer set per key or, if `approximate`, in a set of at
+    most `sketch_threshold` members replaced by a HyperLogLog sketch beyond it, bounding the memory per key.
+    """
+
+    def __init__(self, approximate: bool = False, sketch_threshold: int = default_sketch_threshold,
+                 precision: int = default_sketch_precision):
+        super().__init__()
+        self.approximate = approximate
+        self.sketch_threshold = sketch_threshold
+        self.precision = precision
+        self.members: Dict[Hashable, Union[set, HyperLogLog]] = {}
+
+    def add(self, key: Tuple[Hashable, int], count: int = 1):
+        key, member = key
+        self.counts[key] = self.counts.get(key, 0) + count
+        members = self.members.get(key)
+        if members is None:
+            self.members[key] = {member}
+            return
+        members.add(member)
+        if self.approximate and type(members) is set and len(members) > self.sketch_threshold:
+            self.members[key] = self._sketch(members)
+
+    def _sketch(self, members: Iterable[int]) -> HyperLogLog:
+        sketch = HyperLogLog(self.precision)
+        sketch.update(members)
+        return sketch
+
+    def merge(self, other: "ExactCounter"):
+        if not isinstance(other, DistinctCounter):
+            raise TypeError("Only distinct counters can be merged into a distinct counter")
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+            members, other_members = self.members.get(key), other.members[key]
+            if members is None:
+                members = self.members[key] = set() if type(other_members) is set else HyperLogLog(self.precision)
+            if type(members) is set and type(other_members) is set:
+                members.update(other_members)
+                if self.approximate and len(members) > self.sketch_threshold:
+                    self.members[key] = self._sketch(members)
+                continue
+            if type(members) is set:
+                members = self.members[key] = self._sketch(members)
+            if type(other_members) is set:
+                members.update(other_members)
+            else:
+                members.merge(other_members)
+
+    def distinct_count(self, key: Hashable) -> int:
+        return len(self.members.get(key, ()))
+
+    def _distinct_key(self, item: Tuple[Hashable, int]) -> Tuple[int, int]:
+        return self.distinct_count(item[0]), item[1]
+
+    def top(self, n: int) -> List[Tuple[Hashable, int]]:
+        return heapq.nlargest(n, self.counts.items(), key=self._distinct_key)
+
+    def ranked(self) -> List[Tuple[Hashable, int]]:
+        return sorted(self.counts.items(), key=self._distinct_key, reverse=True)
+
+
+def make_counter(capacity: int = 0) -> ExactCounter:
+    """An exact counter, or a Space-Saving counter with a fixed memory budget of `capacity` keys"""
+    return SpaceSavingCounter(capacity) if capacity > 0 else ExactCounter()
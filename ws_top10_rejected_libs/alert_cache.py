@@ -0,0 +1,123 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Tuple
+
+from ws_top10_rejected_libs.defaults import default_ttl_hours
+
+LIB_FIELDS = ("filename", "key_uuid", "type", "group_id", "artifact_id", "version")
+default_settle_days = 7  # Days are considered final once fetched this many days after they ended
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fetched_days (
+    org_token TEXT NOT NULL,
+    day TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (org_token, day)
+);
+CREATE TABLE IF NOT EXISTS lib_occurrences (
+    org_token TEXT NOT NULL,
+    day TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    key_uuid TEXT NOT NULL,
+    type TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    artifact_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    occurrences INTEGER NOT NULL,
+    PRIMARY KEY (org_token, day, key_uuid, filename, type, group_id, artifact_id, version)
+);
+"""
+
+
+def iter_days(start: str, end: str) -> Iterator[str]:
+    dt = datetime.strptime(start, '%Y-%m-%d')
+    dt_end = datetime.strptime(end, '%Y-%m-%d')
+    while dt <= dt_end:
+        yield dt.strftime('%Y-%m-%d')
+        dt += timedelta(days=1)
+
+
+def group_day_ranges(days: Iterable[str]) -> List[Tuple[str, str]]:
+    # Merge sorted days into ranges of consecutive days (both ends inclusive)
+    ranges = []
+    for day in days:
+        if ranges and (datetime.strptime(ranges[-1][1], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d') == day:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+class AlertCache:
+    """Per organization and day library occurrences of fetched alerts, stored in a local SQLite file.
+
+    A cached day is refetched if it was fetched before it ended, or if it was fetched while still recent (less
+    than `settle_days` after it ended) and that fetch is older than `ttl_hours`.
+    """
+
+    def __init__(self, path: str, org_token: str, ttl_hours: float = default_ttl_hours,
+                 settle_days: int = default_settle_days):
+        self.org_token = org_token
+        self.ttl_seconds = ttl_hours * 3600
+        self.settle_days = settle_days
+        self.conn = sqlite3.connect(path, timeout=60)  # Batch mode writes to the same file from several threads
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _is_stale(self, day: str, fetched_at: float, now: float) -> bool:
+        ended_at = datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)
+        if fetched_at < ended_at.timestamp():
+            return True  # Alerts may have been added since
+        settled_at = (ended_at + timedelta(days=self.settle_days)).timestamp()
+        return fetched_at < settled_at and now - fetched_at > self.ttl_seconds
+
+    def missing_days(self, start: str, end: str, refresh: bool = False) -> List[str]:
+        days = list(iter_days(start, end))
+        if refresh:
+            return days
+        fetched = dict(self.conn.execute(
+            "SELECT day, fetched_at FROM fetched_days WHERE org_token = ? AND day BETWEEN ? AND ?",
+            (self.org_token, start, end)))
+        now = time.time()
+        return [day for day in days if day not in fetched or self._is_stale(day, fetched[day], now)]
+
+    def store(self, from_date: str, to_date: str, day_occs):
+        """Replace the cached occurrences of [from_date, to_date] with `day_occs` ((day, lib fields) -> count)"""
+        now = time.time()
+        with self.conn:
+            self.conn.execute("DELETE FROM lib_occurrences WHERE org_token = ? AND day BETWEEN ? AND ?",
+                              (self.org_token, from_date, to_date))
+            self.conn.executemany(
+                "INSERT INTO lib_occurrences VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((self.org_token, day) + tuple(lib) + (occ,) for (day, lib), occ in day_occs.items()))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO fetched_days VALUES (?, ?, ?)",
+                ((self.org_token, day, now) for day in iter_days(from_date, to_date)))
+
+    def lib_occurrences(self, start: str, end: str) -> Iterator[Tuple[tuple, int]]:
+        cursor = self.conn.execute(
+            "SELECT {0}, SUM(occurrences) FROM lib_occurrences WHERE org_token = ? AND day BETWEEN ? AND ? "
+            "GROUP BY {0}".format(", ".join(LIB_FIELDS)), (self.org_token, start, end))
+        for row in cursor:
+            yield tuple(row[:-1]), row[-1]
+
+    def day_lib_occurrences(self, start: str, end: str) -> Iterator[Tuple[str, tuple, int]]:
+        cursor = self.conn.execute(
+            "SELECT day, {}, occurrences FROM lib_occurrences WHERE org_token = ? AND day BETWEEN ? AND ? "
+            "ORDER BY day".format(", ".join(LIB_FIELDS)), (self.org_token, start, end))
+        for row in cursor:
+            yield row[0], tuple(row[1:-1]), row[-1]
+
+    def evict_before(self, day: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM lib_occurrences WHERE org_token = ? AND day < ?", (self.org_token, day))
+            self.conn.execute("DELETE FROM fetched_days WHERE org_token = ? AND day < ?", (self.org_token, day))
@@ -0,0 +1,267 @@
+"""Performance benchmark with synthetic getOrganizationAlertsByType payloads served by a local API stub.
+
+Usage: python -m ws_top10_rejected_libs.benchmark [--sizes 10000,1000000,10000000] [--libraries 5000] [--skew 1.1]
+"""
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Callable, Dict, Iterable, Iterator, List
+
+from ws_top10_rejected_libs.metrics import peak_rss_mb
+
+default_sizes = (10000, 1000000, 10000000)
+default_libraries = 5000
+default_skew = 1.1
+chunk_size = 1 << 16
+startup_runs = 3
+
+
+def generate_libraries(count: int, seed: int = 0) -> List[dict]:
+    # Library records with the fields read by aggregation.lib_key
+    rnd = random.Random(seed)
+    libs = []
+    for i in range(count):
+        version = "{}.{}.{}".format(i % 7, i % 13, i % 3)
+        libs.append({
+            "keyUuid": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "filename": "artifact-{}-{}.jar".format(i, version),
+            "type": "Java",
+            "groupId": "org.example.group{}".format(i % max(1, count // 20)),
+            "artifactId": "artifact-{}".format(i // 3),
+            "version": version
+        })
+    return libs
+
+
+def generate_alerts(count: int, libraries: int = default_libraries, skew: float = default_skew,
+                    start_date: str = "2021-01-01", days: int = 90, seed: int = 0) -> Iterator[dict]:
+    """Yield `count` rejected-library alerts over `libraries` distinct libraries.
+
+    Library popularity follows a Zipf distribution with exponent `skew` (0 is uniform), alert dates are uniform
+    over `days` days from `start_date`.
+    """
+    rnd = random.Random(seed)
+    libs = generate_libraries(libraries, seed)
+    cum_weights = list(itertools.accumulate(1 / (i + 1) ** skew for i in range(libraries)))
+    dt_start = datetime.strptime(start_date, '%Y-%m-%d')
+    dates = [(dt_start + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(days)]
+    batch = 10000
+    for offset in range(0, count, batch):
+        n = min(batch, count - offset)
+        lib_ids = rnd.choices(range(libraries), cum_weights=cum_weights, k=n)
+        for i, lib_id in enumerate(lib_ids):
+            yield {
+                "type": "REJECTED_BY_POLICY_RESOURCE",
+                "level": "MAJOR",
+                "library": libs[lib_id],
+                "project": "project-{}".format(lib_id % 50),
+                "date": dates[(offset + i) % days],
+                "alertUuid": "{:032x}".format(offset + i)
+            }
+
+
+def iter_payload_chunks(alerts: Iterable[dict]) -> Iterator[bytes]:
+    # Serialize alerts as a getOrganizationAlertsByType response body, in chunks of about `chunk_size` bytes
+    parts = ['{"alerts":[']
+    size = 0
+    for i, alert in enumerate(alerts):
+        text = json.dumps(alert) if i == 0 else "," + json.dumps(alert)
+        parts.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield "".join(parts).encode()
+            parts, size = [], 0
+    parts.append(']}')
+    yield "".join(parts).encode()
+
+
+def write_payload(path: str, alerts: Iterable[dict]) -> int:
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in iter_payload_chunks(alerts):
+            f.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def iter_file_chunks(path: str) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        yield from iter(lambda: f.read(chunk_size), b"")
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class AlertsStubServer:
+    """Local HTTP stub of the WhiteSource API, answering every request with chunked streamed JSON.
+
+    `respond` receives the request payload and returns the response body chunks. Use as a context manager;
+    `api_url` is the URL to pass to WsClient.
+    """
+
+    def __init__(self, respond: Callable[[dict], Iterable[bytes]], host: str = "127.0.0.1", port: int = 0):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in respond(payload):
+                    if chunk:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.server = _ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def api_url(self) -> str:
+        return "http://{}:{}/api/v1.3".format(*self.server.server_address[:2])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def alerts_responder(alerts_factory: Callable[[], Iterable[dict]]) -> Callable[[dict], Iterator[bytes]]:
+    # Respond with the factory's alerts dated within the request's fromDate/toDate
+    def respond(payload: dict) -> Iterator[bytes]:
+        from_date, to_date = payload.get("fromDate", ""), payload.get("toDate", "9999-12-31")
+        return iter_payload_chunks(a for a in alerts_factory() if from_date <= a["date"][:10] <= to_date)
+    return respond
+
+
+def _stage(name: str, seconds: float, alerts: int, size: int) -> Dict[str, float]:
+    return {
+        "stage": name,
+        "seconds": round(seconds, 3),
+        "alerts_per_sec": round(alerts / seconds) if seconds else 0,
+        "mb_per_sec": round(size / (1 << 20) / seconds, 1) if seconds else 0,
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def time_startup(runs: int = startup_runs) -> float:
+    # Best wall time of a fresh interpreter importing the tool and printing its --help
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (package_root, os.environ.get("PYTHONPATH")))))
+    best = float("inf")
+    for _ in range(runs):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "ws_top10_rejected_libs.top10_rejected", "--help"], env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def run_benchmark(count: int, libraries: int = default_libraries, skew: float = default_skew, top_n: int = 10,
+                  group_by: str = "gav") -> dict:
+    """Time the startup, fetch, parse, aggregate and spreadsheet stages for `count` synthetic alerts.
+
+    Peak RSS is the process high-water mark after each stage, so run each size in a fresh process.
+    """
+    from ws_top10_rejected_libs.aggregation import group_key, lib_key, make_counter
+    from ws_top10_rejected_libs.fetcher import AlertFetcher, alerts_payload
+    from ws_top10_rejected_libs.json_stream import iter_object_array
+    from ws_top10_rejected_libs.spreadsheet import write_spreadsheet
+    from ws_top10_rejected_libs.ws_client import WsClient
+
+    stages = [_stage("startup", time_startup(), 0, 0)]
+    work_dir = tempfile.mkdtemp(prefix="top10_bench_")
+    try:
+        payload_file = os.path.join(work_dir, "alerts.json")
+        t = time.perf_counter()
+        size = write_payload(payload_file, generate_alerts(count, libraries, skew))
+        stages.append(_stage("generate", time.perf_counter() - t, count, size))
+
+        with AlertsStubServer(lambda payload: iter_file_chunks(payload_file)) as stub, \
+                WsClient(stub.api_url) as client:
+            t = time.perf_counter()
+            with client.session.post(stub.api_url, json={}, stream=True) as response:
+                received = sum(len(chunk) for chunk in response.iter_content(chunk_size=chunk_size))
+            stages.append(_stage("fetch", time.perf_counter() - t, count, received))
+
+            t = time.perf_counter()
+            parsed = sum(1 for _ in iter_object_array(iter_file_chunks(payload_file), "alerts"))
+            parse_seconds = time.perf_counter() - t
+            stages.append(_stage("parse", parse_seconds, parsed, size))
+
+            t = time.perf_counter()
+            occs = make_counter()
+            for alert in iter_object_array(iter_file_chunks(payload_file), "alerts"):
+                occs.add(group_key(lib_key(alert), group_by))
+            # Parsing is timed on its own above
+            stages.append(_stage("aggregate", max(time.perf_counter() - t - parse_seconds, 0), count, size))
+
+            t = time.perf_counter()
+            fetcher = AlertFetcher(client, group_by=group_by)
+            occs = fetcher.lib_occurrences(alerts_payload("", "", "2000-01-01", "2100-12-31"))
+            most_common = occs.top(top_n)
+            stages.append(_stage("end_to_end", time.perf_counter() - t, count, size))
+
+        t = time.perf_counter()
+        write_spreadsheet(os.path.join(work_dir, "top.xlsx"), "Top {} Rejected Libraries".format(top_n),
+                          most_common, stub.api_url + "#", include_header_image=False)
+        stages.append(_stage("spreadsheet", time.perf_counter() - t, len(most_common), 0))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"alerts": count, "libraries": libraries, "skew": skew, "payload_mb": round(size / (1 << 20), 1),
+            "unique_libraries": len(occs), "stages": stages}
+
+
+def main(argv: List[str] = None) -> int:
+    from argparse import ArgumentParser
+
+    argparser = ArgumentParser(prog="ws-top-10-rejected-libs-benchmark",
+                               description="Benchmark the report stages with synthetic alerts served by a local stub")
+    argparser.add_argument("--sizes", default=",".join(str(s) for s in default_sizes),
+                           help="Comma separated alert counts. Default: %(default)s.")
+    argparser.add_argument("--libraries", type=int, default=default_libraries,
+                           help="Number of distinct libraries. Default: %(default)s.")
+    argparser.add_argument("--skew", type=float, default=default_skew,
+                           help="Zipf exponent of library popularity (0 is uniform). Default: %(default)s.")
+    argparser.add_argument("--top", type=int, default=10, help="Number of libraries in the spreadsheet.")
+    argparser.add_argument("--group-by", default="gav", choices=("gav", "artifact", "group"))
+    argparser.add_argument("--json", action='store_true', help="Print one JSON record per size.")
+    args = argparser.parse_args(argv)
+
+    for count in (int(s) for s in args.sizes.split(",") if s):
+        # A fresh process per size, so peak RSS is not inherited from a previous (larger) run
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_benchmark, count, args.libraries, args.skew, args.top, args.group_by).result()
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print("{alerts} alerts, {libraries} libraries (skew {skew}), {payload_mb} MB payload, "
+              "{unique_libraries} unique".format(**result))
+        print("  {:<12}{:>10}{:>14}{:>10}{:>14}".format("stage", "seconds", "alerts/s", "MB/s", "peak RSS MB"))
+        for s in result["stages"]:
+            print("  {stage:<12}{seconds:>10}{alerts_per_sec:>14}{mb_per_sec:>10}{peak_rss_mb:>14}".format(**s))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,18 @@
+# Option values and defaults shared by the command line and the modules implementing them. Only the standard library
+# may be imported here, so building the argument parser (and --help) does not load the HTTP stack or SQLite.
+
+ALERT_TYPE_REJECTED = "REJECTED_BY_POLICY_RESOURCE"
+SCOPE_ORG = 'org'
+SCOPE_PRODUCT = 'product'
+SCOPE_AUTO = 'auto'
+SCOPE_OPTIONS = (SCOPE_AUTO, SCOPE_ORG, SCOPE_PRODUCT)
+
+default_connect_timeout = 10
+default_read_timeout = 300
+default_retries = 3
+
+default_cache_file = "top10_rejected.cache.db"
+default_ttl_hours = 24
+
+default_details_ttl_hours = 168
+default_enrich_workers = 8
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from ws_top10_rejected_libs.aggregation import LibDetails, LibKey
+from ws_top10_rejected_libs.defaults import ALERT_TYPE_REJECTED, default_details_ttl_hours, default_enrich_workers
+from ws_top10_rejected_libs.ws_client import WsClient
+
+default_max_cached_details = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lib_details (
+    org_token TEXT NOT NULL,
+    key_uuid TEXT NOT NULL,
+    details TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (org_token, key_uuid)
+);
+"""
+
+
+def library_alerts_payload(user_key: str, org_token: str, key_uuid: str) -> dict:
+    return {
+        "requestType": "getOrganizationAlertsByLibrary",
+        "userKey": user_key,
+        "orgToken": org_token,
+        "libraryUuid": key_uuid
+    }
+
+
+def details_from_alerts(alerts: Iterable[dict]) -> LibDetails:
+    # The rejecting policies (alert descriptions) and the products and projects of a library's rejection alerts
+    policies, products, projects = set(), set(), set()
+    for alert in alerts:
+        if alert.get("type", ALERT_TYPE_REJECTED) != ALERT_TYPE_REJECTED:
+            continue
+        for names, name in ((policies, alert.get("description")), (products, alert.get("product")),
+                            (projects, alert.get("project"))):
+            if name:
+                names.add(name)
+    return LibDetails(tuple(sorted(policies)), tuple(sorted(products)), tuple(sorted(projects)))
+
+
+class DetailsCache:
+    """Library details per organization, kept in a local SQLite file for `ttl_hours`.
+
+    At most `max_entries` libraries are kept, the least recently used are dropped first.
+    """
+
+    def __init__(self, path: str, org_token: str, ttl_hours: float = default_details_ttl_hours,
+                 max_entries: int = default_max_cached_details):
+        self.org_token = org_token
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, key_uuids: List[str]) -> Dict[str, LibDetails]:
+        now = time.time()
+        details = {}
+        for i in range(0, len(key_uuids), 500):
+            batch = key_uuids[i:i + 500]
+            cursor = self.conn.execute(
+                "SELECT key_uuid, details FROM lib_details WHERE org_token = ? AND fetched_at >= ? "
+                "AND key_uuid IN ({})".format(", ".join("?" * len(batch))),
+                [self.org_token, now - self.ttl_seconds] + batch)
+            for key_uuid, lib_details in cursor:
+                details[key_uuid] = LibDetails(*(tuple(names) for names in json.loads(lib_details)))
+        with self.conn:
+            self.conn.executemany("UPDATE lib_details SET used_at = ? WHERE org_token = ? AND key_uuid = ?",
+                                  ((now, self.org_token, key_uuid) for key_uuid in details))
+        return details
+
+    def put(self, details: Dict[str, LibDetails]):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO lib_details VALUES (?, ?, ?, ?, ?)",
+                ((self.org_token, key_uuid, json.dumps(lib_details), now, now)
+                 for key_uuid, lib_details in details.items()))
+            self.conn.execute(
+                "DELETE FROM lib_details WHERE org_token = ? AND key_uuid NOT IN (SELECT key_uuid FROM lib_details "
+                "WHERE org_token = ? ORDER BY used_at DESC LIMIT ?)", (self.org_token, self.org_token, self.max_entries))
+
+
+class LibraryEnricher:
+    """Fetches the details of libraries concurrently, once per library uuid, through a DetailsCache file if set"""
+
+    def __init__(self, client: WsClient, user_key: str, org_token: str, cache_file: str = "",
+                 cache_ttl: float = default_details_ttl_hours, workers: int = default_enrich_workers):
+        self.client = client
+        self.user_key = user_key
+        self.org_token = org_token
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        self.workers = max(1, workers)
+        self.fetched = 0
+
+    def fetch_details(self, key_uuid: str) -> LibDetails:
+        return details_from_alerts(self.client.request_stream(
+            library_alerts_payload(self.user_key, self.org_token, key_uuid), "alerts"))
+
+    def _fetch(self, key_uuids: List[str]) -> Dict[str, LibDetails]:
+        if not key_uuids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(key_uuids))) as executor:
+            fetched = dict(zip(key_uuids, executor.map(self.fetch_details, key_uuids)))
+        self.fetched += len(fetched)
+        return fetched
+
+    def enrich(self, libs: Iterable[LibKey]) -> Dict[str, LibDetails]:
+        # Details of the libraries by uuid; grouped libraries (without a uuid) have none
+        key_uuids = list(dict.fromkeys(lib.uuid for lib in libs if lib.uuid))
+        if not self.cache_file:
+            return self._fetch(key_uuids)
+        with DetailsCache(self.cache_file, self.org_token, self.cache_ttl) as cache:
+            details = cache.get(key_uuids)
+            fetched = self._fetch([key_uuid for key_uuid in key_uuids if key_uuid not in details])
+            cache.put(fetched)
+        details.update(fetched)
+        return details
@@ -0,0 +1,111 @@
+import csv
+import gzip
+import io
+import json
+import os
+import stat
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterable, Iterator, Tuple, Union
+
+from ws_top10_rejected_libs.aggregation import LibDetails, LibKey, join_names, product_breakdown
+
+FORMAT_XLSX = 'xlsx'
+FORMAT_CSV = 'csv'
+FORMAT_JSONL_GZ = 'jsonl.gz'
+EXPORT_FORMATS = (FORMAT_XLSX, FORMAT_CSV, FORMAT_JSONL_GZ)
+csv_headers = ["Rank", "Name", "Type", "Group", "Artifact", "Version", "Occurrences", "URL"]
+
+
+detail_csv_headers = ["Policies", "Products", "Projects"]
+product_occs_csv_header = "Occurrences per Product"
+
+
+def _create_temp_file(output: str) -> Tuple[int, str]:
+    # Create a new file with a random name next to `output`, with the permissions open() gives a new file
+    while True:
+        tmp_path = "{}.{}.tmp".format(output, os.urandom(6).hex())
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        except FileExistsError:
+            continue
+        return fd, tmp_path
+
+
+@contextmanager
+def atomic_output(output: Union[str, BinaryIO]) -> Iterator[BinaryIO]:
+    """A binary file object to write an output to.
+
+    For a path, this is a temporary file next to it, renamed over it once completely written, so concurrent runs
+    never see (or leave behind) a partial file. File objects (e.g. stdout's buffer or a BytesIO) are written as is.
+    """
+    if not isinstance(output, str):
+        yield output
+        return
+    fd, tmp_path = _create_temp_file(output)
+    try:
+        with open(fd, 'wb') as f:
+            try:
+                # Keep the permissions of the file being replaced
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(output).st_mode))
+            except FileNotFoundError:
+                pass
+            yield f
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def lib_record(rank: int, lib: LibKey, occ: int, ws_lib_url: str, details: Dict[str, LibDetails] = None,
+               product_occs: Dict[LibKey, Dict[str, int]] = None, distinct: Dict[LibKey, int] = None,
+               distinct_header: str = "Distinct Projects") -> dict:
+    record = dict(rank=rank, **lib._asdict(), occurrences=occ, url=ws_lib_url + lib.uuid if lib.uuid else "")
+    if distinct is not None:
+        record[distinct_header.lower().replace(" ", "_")] = distinct.get(lib, 0)
+    if details is not None:
+        record.update((field, list(names)) for field, names in details.get(lib.uuid, LibDetails())._asdict().items())
+    if product_occs:
+        record["product_occurrences"] = product_occs.get(lib, {})
+    return record
+
+
+def write_csv(csv_file: Union[str, BinaryIO], ranked_libs: Iterable[Tuple[LibKey, int]], ws_lib_url: str,
+              details: Dict[str, LibDetails] = None, product_occs: Dict[LibKey, Dict[str, int]] = None,
+              distinct: Dict[LibKey, int] = None, distinct_header: str = "Distinct Projects") -> int:
+    # Stream the ranked libraries to a CSV file, returning the number of rows written
+    rank = 0
+    with atomic_output(csv_file) as output:
+        f = io.TextIOWrapper(output, newline='', encoding='utf-8')
+        writer = csv.writer(f)
+        headers = list(csv_headers)
+        if distinct is not None:
+            headers.append(distinct_header)
+        if details is not None:
+            headers += detail_csv_headers
+        writer.writerow(headers + [product_occs_csv_header] if product_occs else headers)
+        for rank, (lib, occ) in enumerate(ranked_libs, start=1):
+            row = [rank, lib.name, lib.type, lib.group, lib.artifact, lib.version, occ,
+                   ws_lib_url + lib.uuid if lib.uuid else ""]
+            if distinct is not None:
+                row.append(distinct.get(lib, 0))
+            if details is not None:
+                row += [join_names(names) for names in details.get(lib.uuid, LibDetails())]
+            if product_occs:
+                row.append(product_breakdown(product_occs.get(lib, {})))
+            writer.writerow(row)
+        f.flush()
+        f.detach()  # Leave the output open, it is closed by its owner
+    return rank
+
+
+def write_jsonl_gz(jsonl_file: Union[str, BinaryIO], ranked_libs: Iterable[Tuple[LibKey, int]], ws_lib_url: str,
+                   details: Dict[str, LibDetails] = None, product_occs: Dict[LibKey, Dict[str, int]] = None,
+                   distinct: Dict[LibKey, int] = None, distinct_header: str = "Distinct Projects") -> int:
+    # Stream the ranked libraries to a gzip-compressed JSON lines file, returning the number of records written
+    rank = 0
+    with atomic_output(jsonl_file) as output, gzip.GzipFile(fileobj=output, mode='wb') as gz, \
+            io.TextIOWrapper(gz, encoding='utf-8') as f:
+        for rank, (lib, occ) in enumerate(ranked_libs, start=1):
+            f.write(json.dumps(lib_record(rank, lib, occ, ws_lib_url, details, product_occs, distinct,
+                                          distinct_header)) + "\n")
+    return rank
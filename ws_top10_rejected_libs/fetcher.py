@@ -0,0 +1,367 @@
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, Iterator, List, Tuple
+
+from ws_top10_rejected_libs.aggregation import (GROUP_BY_GAV, PERIOD_CURRENT, PERIOD_PREVIOUS, RANK_BY_OCCURRENCES,
+                                                RANK_BY_PROJECTS, DistinctCounter, ExactCounter, LibKey, TrendCounter,
+                                                bucket_key, group_key, lib_key, make_counter)
+from ws_top10_rejected_libs.alert_cache import AlertCache, group_day_ranges, iter_days
+from ws_top10_rejected_libs.defaults import ALERT_TYPE_REJECTED, SCOPE_AUTO, SCOPE_ORG, SCOPE_PRODUCT
+from ws_top10_rejected_libs.metrics import (STAGE_API_REQUEST, STAGE_COUNTING, STAGE_GAV_EXTRACTION, STAGE_JSON_DECODE,
+                                            Metrics, StageTimer)
+from ws_top10_rejected_libs.ws_client import TransferStats, WsClient, WsError, WsStreamError
+
+retry_backoff_seconds = 2  # Base delay between attempts of a failed window, doubled on every attempt
+
+
+def alerts_payload(user_key: str, org_token: str, start_date: str, end_date: str,
+                   alert_type: str = ALERT_TYPE_REJECTED) -> dict:
+    return {
+        "requestType": "getOrganizationAlertsByType",
+        "userKey": user_key,
+        "orgToken": org_token,
+        "alertType": alert_type,
+        "fromDate": start_date,
+        "toDate": end_date
+    }
+
+
+def product_alerts_payload(user_key: str, product_token: str, start_date: str, end_date: str,
+                           alert_type: str = ALERT_TYPE_REJECTED) -> dict:
+    return {
+        "requestType": "getProductAlertsByType",
+        "userKey": user_key,
+        "productToken": product_token,
+        "alertType": alert_type,
+        "fromDate": start_date,
+        "toDate": end_date
+    }
+
+
+def get_products(client: WsClient, user_key: str, org_token: str,
+                 transfer: TransferStats = None) -> List[Tuple[str, str]]:
+    # The organization's (product name, product token) pairs
+    r_json = client.request({"requestType": "getAllProducts", "userKey": user_key, "orgToken": org_token}, transfer)
+    return [(product.get("productName") or product["productToken"], product["productToken"])
+            for product in r_json.get("products", [])]
+
+
+def split_date_range(start: str, end: str, days: int) -> List[Tuple[str, str]]:
+    # Split [start, end] into consecutive non-overlapping windows of `days` days (both ends inclusive)
+    if days <= 0:
+        return [(start, end)]
+    dt_start = datetime.strptime(start, '%Y-%m-%d')
+    dt_end = datetime.strptime(end, '%Y-%m-%d')
+    windows = []
+    while dt_start <= dt_end:
+        dt_to = min(dt_start + timedelta(days=days - 1), dt_end)
+        windows.append((dt_start.strftime('%Y-%m-%d'), dt_to.strftime('%Y-%m-%d')))
+        dt_start = dt_to + timedelta(days=1)
+    return windows
+
+
+def previous_period(start: str, end: str) -> Tuple[str, str]:
+    # The period of as many days as [start, end] ending the day before `start`
+    dt_start = datetime.strptime(start, '%Y-%m-%d')
+    days = (datetime.strptime(end, '%Y-%m-%d') - dt_start).days + 1
+    return ((dt_start - timedelta(days=days)).strftime('%Y-%m-%d'),
+            (dt_start - timedelta(days=1)).strftime('%Y-%m-%d'))
+
+
+def get_alert_date(alert: dict) -> str:
+    # Alert dates are reported as 'yyyy-MM-dd' or 'yyyy-MM-dd HH:mm:ss'
+    return str(alert.get("date") or "")[:10]
+
+
+class AlertFetcher:
+    """Fetches the alerts of a payload's period in concurrent date windows and counts their libraries.
+
+    Every window is streamed into its own counter and retried on its own, so a failed window is refetched
+    without refetching (or double counting) the others. With a `bucket` ('month' or 'week'), occurrences are
+    also counted per period of the alert date, in the same pass (exact counts only).
+
+    The `scope` selects organization level requests, requests per product (sharded over the organization's
+    products), or organization level requests falling back to per product requests when they fail or their
+    response exceeds `max_response_bytes`. Per product requests also count the occurrences per product
+    (`product_occs`) of the libraries counted without the cache.
+
+    With `rank_by` 'projects' or 'products', the distinct projects (or products) of every library are counted
+    as well, exactly or (with `approx_distinct`) with bounded memory sketches.
+
+    With `compare_previous`, the fetched period is extended by the preceding period of equal length, counted in the
+    same pass apart from the requested one: the returned counter holds the requested period and `previous_occs`
+    the preceding one.
+    """
+
+    def __init__(self, client: WsClient, window_days: int = 0, workers: int = 4, retries: int = 3,
+                 group_by: str = GROUP_BY_GAV, approx_capacity: int = 0, metrics: Metrics = None, bucket: str = "",
+                 scope: str = SCOPE_ORG, max_response_bytes: int = 0, rank_by: str = RANK_BY_OCCURRENCES,
+                 approx_distinct: bool = False, compare_previous: bool = False):
+        self.client = client
+        self.window_days = window_days
+        self.workers = max(1, workers)
+        self.retries = max(1, retries)
+        self.group_by = group_by
+        self.approx_capacity = approx_capacity
+        self.metrics = metrics or Metrics()
+        self.bucket = bucket
+        self.scope = scope
+        self.max_response_bytes = max_response_bytes
+        self.product_occs: Dict[Hashable, Dict[str, int]] = {}
+        self.rank_by = rank_by
+        self.approx_distinct = approx_distinct
+        self._member_ids: Dict[str, int] = {}
+        self._member_ids_lock = threading.Lock()
+        self.compare_previous = compare_previous
+        self.previous_occs = ExactCounter()
+        self._current_from = ""
+        self.transfer = TransferStats()  # This fetcher's own transfer, as other fetchers may share the client
+
+    def new_counter(self) -> ExactCounter:
+        if self.rank_by != RANK_BY_OCCURRENCES:
+            return DistinctCounter(approximate=self.approx_distinct)
+        if self.bucket or self.compare_previous:
+            return TrendCounter()
+        return make_counter(self.approx_capacity)
+
+    def period_key(self, date: str) -> str:
+        # The trend bucket of an alert date, or whether it falls in the current or the previous period
+        if self.compare_previous:
+            return PERIOD_CURRENT if date >= self._current_from else PERIOD_PREVIOUS
+        return bucket_key(date, self.bucket)
+
+    def _extend_period(self, payload: dict) -> dict:
+        # The payload extended by the previous period when comparing with it
+        if not self.compare_previous:
+            return payload
+        self._current_from = payload["fromDate"]
+        return dict(payload, fromDate=previous_period(payload["fromDate"], payload["toDate"])[0])
+
+    def _split_periods(self, occs: ExactCounter) -> ExactCounter:
+        # The occurrences of the requested period, keeping those of the previous period in `previous_occs`
+        if not self.compare_previous:
+            return occs
+        self.previous_occs = occs.bucket_counter(PERIOD_PREVIOUS)
+        return occs.bucket_counter(PERIOD_CURRENT)
+
+    def member_id(self, alert: dict, payload: dict) -> int:
+        # The integer id of the alert's project (or product), interning names of alerts without one
+        if self.rank_by == RANK_BY_PROJECTS:
+            member_id, name = alert.get("projectId"), alert.get("project")
+        else:
+            member_id, name = alert.get("productId"), alert.get("product") or payload.get("productToken")
+        if isinstance(member_id, int):
+            return member_id
+        name = str(name or "")
+        member_id = self._member_ids.get(name)
+        if member_id is None:
+            with self._member_ids_lock:
+                # Negative, so interned names do not collide with the API's ids
+                member_id = self._member_ids.setdefault(name, -1 - len(self._member_ids))
+        return member_id
+
+    def fetch_window(self, payload: dict, from_date: str, to_date: str, by_day: bool = False) -> ExactCounter:
+        # Count the window's library occurrences, keyed by (alert day, library) rather than library group if `by_day`
+        window_payload = dict(payload, fromDate=from_date, toDate=to_date)
+        window_occs = ExactCounter() if by_day else self.new_counter()
+
+        def window_key(alert: dict, alert_date: str):
+            if by_day:
+                return alert_date if from_date <= alert_date <= to_date else from_date, lib_key(alert)
+            if self.bucket or self.compare_previous:
+                return (self.period_key(alert_date if from_date <= alert_date <= to_date else from_date),
+                        group_key(lib_key(alert), self.group_by))
+            if self.rank_by != RANK_BY_OCCURRENCES:
+                return group_key(lib_key(alert), self.group_by), self.member_id(alert, payload)
+            return group_key(lib_key(alert), self.group_by)
+
+        # The size limit applies to organization level responses, which per product requests can replace
+        max_bytes = self.max_response_bytes if self.scope == SCOPE_AUTO and "orgToken" in payload else 0
+        alerts = self.client.request_stream(window_payload, "alerts", max_bytes, self.transfer)
+        add = window_occs.add
+        timers = {stage: StageTimer() for stage in (STAGE_JSON_DECODE, STAGE_GAV_EXTRACTION, STAGE_COUNTING)}
+        if self.metrics.enabled:
+            # Iterating alerts includes the API request time, which is split out by _transfer_metrics
+            alerts = timers[STAGE_JSON_DECODE].iterate(alerts)
+            window_key = timers[STAGE_GAV_EXTRACTION].wrap(window_key)
+            add = timers[STAGE_COUNTING].wrap(add)
+        alerts_count = 0
+        for alert in alerts:
+            alert_date = get_alert_date(alert)
+            # An alert dated in a neighbouring window is counted by that window only
+            if alert_date and payload["fromDate"] <= alert_date <= payload["toDate"] \
+                    and not from_date <= alert_date <= to_date:
+                continue
+            add(window_key(alert, alert_date))
+            alerts_count += 1
+        for stage, timer in timers.items():
+            self.metrics.add(stage, timer.seconds)
+        self.metrics.add(STAGE_GAV_EXTRACTION, alerts=alerts_count)
+        return window_occs
+
+    def fetch_window_with_retry(self, payload: dict, from_date: str, to_date: str,
+                                by_day: bool = False) -> ExactCounter:
+        # The client retries failed requests, a window is fetched again only if its response broke off midway
+        for attempt in range(1, self.retries + 1):
+            try:
+                return self.fetch_window(payload, from_date, to_date, by_day)
+            except WsStreamError as fetch_err:
+                if attempt == self.retries:
+                    raise
+                delay = retry_backoff_seconds * 2 ** (attempt - 1)
+                print("Fetching alerts {} - {} failed ({}), retrying in {}s".format(from_date, to_date, fetch_err,
+                                                                                    delay))
+                time.sleep(delay)
+
+    def fetch_windows(self, payload: dict, windows: List[Tuple[str, str]],
+                      by_day: bool = False) -> Iterator[Tuple[str, str, ExactCounter]]:
+        # Fetch the date windows concurrently, yielding (from date, to date, occurrences) as each window completes
+        if not windows:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(windows))) as executor:
+            futures = {executor.submit(self.fetch_window_with_retry, payload, from_date, to_date, by_day):
+                       (from_date, to_date) for from_date, to_date in windows}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future] + (future.result(),)
+            finally:
+                # Windows not started yet are dropped when a window fails (or the caller stops early)
+                for future in futures:
+                    future.cancel()
+
+    def product_payloads(self, payload: dict) -> List[Tuple[str, dict]]:
+        # Per product copies of an organization level alerts payload, as (product name, payload)
+        products = get_products(self.client, payload["userKey"], payload["orgToken"], self.transfer)
+        return [(product_name, product_alerts_payload(payload["userKey"], product_token, payload["fromDate"],
+                                                      payload["toDate"], payload["alertType"]))
+                for product_name, product_token in products]
+
+    def fetch_product_windows(self, payload: dict, windows: List[Tuple[str, str]],
+                              by_day: bool = False) -> Iterator[Tuple[str, str, str, ExactCounter]]:
+        # Fetch the date windows of every product concurrently, yielding (product name, from date, to date, occurrences)
+        product_payloads = self.product_payloads(payload)
+        print("Fetching alerts of {} products".format(len(product_payloads)))
+        tasks = [(product_name, product_payload, window) for product_name, product_payload in product_payloads
+                 for window in windows]
+        if not tasks:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(tasks))) as executor:
+            futures = {executor.submit(self.fetch_window_with_retry, product_payload, from_date, to_date, by_day):
+                       (product_name, from_date, to_date) for product_name, product_payload, (from_date, to_date) in tasks}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future] + (future.result(),)
+            finally:
+                # Windows not started yet are dropped when a window fails (or the caller stops early)
+                for future in futures:
+                    future.cancel()
+
+    def _fall_back(self, fetch_err: WsError) -> bool:
+        # Whether a failed organization level fetch is retried per product
+        if self.scope != SCOPE_AUTO:
+            return False
+        print("Fetching organization alerts failed ({}), fetching them per product".format(fetch_err))
+        return True
+
+    def lib_occurrences(self, payload: dict) -> ExactCounter:
+        # Fetch the payload's period in date windows and merge the library occurrences of all windows
+        payload = self._extend_period(payload)
+        windows = split_date_range(payload["fromDate"], payload["toDate"], self.window_days)
+        if self.scope != SCOPE_PRODUCT:
+            occs = self.new_counter()
+            try:
+                with self._transfer_metrics():
+                    for _, _, window_occs in self.fetch_windows(payload, windows):
+                        t = time.perf_counter()
+                        occs.merge(window_occs)
+                        self.metrics.add(STAGE_COUNTING, time.perf_counter() - t)
+                occs = self._split_periods(occs)
+                self.metrics.set(STAGE_COUNTING, unique_libraries=len(occs))
+                return occs
+            except WsError as fetch_err:
+                if not self._fall_back(fetch_err):
+                    raise
+
+        occs = self.new_counter()
+        self.product_occs = {}
+        with self._transfer_metrics():
+            for product_name, _, _, window_occs in self.fetch_product_windows(payload, windows):
+                t = time.perf_counter()
+                occs.merge(window_occs)
+                if self.compare_previous:
+                    window_occs = window_occs.bucket_counter(PERIOD_CURRENT)
+                for lib, occ in window_occs.items():
+                    lib_products = self.product_occs.setdefault(lib, {})
+                    lib_products[product_name] = lib_products.get(product_name, 0) + occ
+                self.metrics.add(STAGE_COUNTING, time.perf_counter() - t)
+        occs = self._split_periods(occs)
+        self.metrics.set(STAGE_COUNTING, unique_libraries=len(occs))
+        return occs
+
+    @contextmanager
+    def _transfer_metrics(self):
+        # Split this fetcher's request time out of the time spent iterating alerts, which also includes decoding them
+        request_seconds, bytes_received = self.transfer.request_seconds, self.transfer.bytes_received
+        try:
+            yield
+        finally:
+            if self.metrics.enabled:
+                request_seconds = self.transfer.request_seconds - request_seconds
+                self.metrics.add(STAGE_API_REQUEST, request_seconds,
+                                 bytes_received=self.transfer.bytes_received - bytes_received)
+                self.metrics.add(STAGE_JSON_DECODE, -request_seconds)
+
+    def fetch_day_windows(self, payload: dict,
+                          windows: List[Tuple[str, str]]) -> Iterator[Tuple[str, str, ExactCounter]]:
+        """Fetch the (alert day, library) occurrences of the date windows in the fetcher's scope, yielding
+        (from date, to date, occurrences) once a window is complete.
+
+        When falling back to per product requests, only the windows not yielded yet are fetched again, and a window
+        is complete once the alerts of all products were fetched.
+        """
+        windows = list(windows)
+        fetch_products = self.scope == SCOPE_PRODUCT
+        if windows and not fetch_products:
+            try:
+                with self._transfer_metrics():
+                    for from_date, to_date, day_occs in self.fetch_windows(payload, windows, by_day=True):
+                        windows.remove((from_date, to_date))
+                        yield from_date, to_date, day_occs
+            except WsError as fetch_err:
+                fetch_products = self._fall_back(fetch_err)
+                if not fetch_products:
+                    raise
+        if windows and fetch_products:
+            window_occs = {window: ExactCounter() for window in windows}
+            with self._transfer_metrics():
+                for _, from_date, to_date, day_occs in self.fetch_product_windows(payload, windows, by_day=True):
+                    window_occs[(from_date, to_date)].merge(day_occs)
+            for (from_date, to_date), day_occs in window_occs.items():
+                yield from_date, to_date, day_occs
+
+    def lib_occurrences_cached(self, payload: dict, cache: AlertCache, refresh: bool = False) -> ExactCounter:
+        # Fetch only the days missing from the cache (or stale), then count the whole period from the cache
+        payload = self._extend_period(payload)
+        missing_days = cache.missing_days(payload["fromDate"], payload["toDate"], refresh=refresh)
+        windows = [window for from_date, to_date in group_day_ranges(missing_days)
+                   for window in split_date_range(from_date, to_date, self.window_days)]
+        if windows:
+            print("Fetching {} of {} days not found in cache".format(
+                len(missing_days), len(list(iter_days(payload["fromDate"], payload["toDate"])))))
+        for from_date, to_date, day_occs in self.fetch_day_windows(payload, windows):
+            cache.store(from_date, to_date, day_occs)
+        t = time.perf_counter()
+        occs = self.new_counter()
+        if self.bucket or self.compare_previous:
+            for day, lib, occ in cache.day_lib_occurrences(payload["fromDate"], payload["toDate"]):
+                occs.add((self.period_key(day), group_key(LibKey(*lib), self.group_by)), occ)
+        else:
+            for lib, occ in cache.lib_occurrences(payload["fromDate"], payload["toDate"]):
+                occs.add(group_key(LibKey(*lib), self.group_by), occ)
+        occs = self._split_periods(occs)
+        self.metrics.add(STAGE_COUNTING, time.perf_counter() - t)
+        self.metrics.set(STAGE_COUNTING, unique_libraries=len(occs))
+        return occs
@@ -0,0 +1,108 @@
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+_WS = " \t\r\n"
+_NUMBER_END = _WS + ",]}"  # Characters that may follow a complete number
+_decoder = json.JSONDecoder()
+compact_buffer_size = 1 << 16  # Drop consumed text from the buffer once this many characters were parsed
+
+
+class _ChunkReader:
+    """Incrementally decoded text buffer over an iterable of byte chunks"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def read_more(self) -> bool:
+        for chunk in self.chunks:
+            if not chunk:
+                continue
+            self.bytes_read += len(chunk)
+            text = self.text_decoder.decode(chunk)
+            if text:
+                if self.pos > compact_buffer_size:
+                    self.buf = self.buf[self.pos:]
+                    self.pos = 0
+                self.buf += text
+                return True
+        if not self.eof:
+            self.eof = True
+            tail = self.text_decoder.decode(b"", final=True)
+            if tail:
+                self.buf += tail
+                return True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.read_more():
+                return ""
+
+    def expect(self, char: str):
+        c = self.peek()
+        if c != char:
+            raise ValueError("Invalid JSON stream: expected '{}' but found '{}' at offset {}".format(
+                char, c, self.bytes_read))
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.read_more():
+                    continue
+                raise
+            # A number is complete once followed by a delimiter, otherwise it may continue in the next chunk
+            # (e.g. '1' of '1.5e10', as the decoder stops before an incomplete fraction or exponent)
+            if type(obj) in (int, float) and (end == len(self.buf) or self.buf[end] not in _NUMBER_END) \
+                    and self.read_more():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_object_array(chunks: Iterable[bytes], array_key: str, header: Dict[str, Any] = None) -> Iterator[Any]:
+    """Yield the elements of the top level `array_key` array of a JSON object one at a time.
+
+    Only a single array element is held in memory at any point. All other top level members are parsed
+    into `header` (if provided), so error members such as 'errorCode' can be checked once the generator is exhausted.
+    """
+    header = {} if header is None else header
+    reader = _ChunkReader(chunks)
+    reader.expect("{")
+    while True:
+        c = reader.peek()
+        if c == "}":
+            break
+        if c == ",":
+            reader.pos += 1
+            continue
+        key = reader.value()
+        reader.expect(":")
+        if key == array_key and reader.peek() == "[":
+            reader.pos += 1
+            while True:
+                c = reader.peek()
+                if c == "]":
+                    reader.pos += 1
+                    break
+                if c == ",":
+                    reader.pos += 1
+                    continue
+                if not c:
+                    raise ValueError("Invalid JSON stream: unterminated '{}' array".format(array_key))
+                yield reader.value()
+        else:
+            header[key] = reader.value()
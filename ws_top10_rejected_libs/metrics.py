@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, TextIO
+
+STAGE_CONFIG_LOAD = 'config_load'
+STAGE_API_REQUEST = 'api_request'
+STAGE_JSON_DECODE = 'json_decode'
+STAGE_GAV_EXTRACTION = 'gav_extraction'
+STAGE_COUNTING = 'counting'
+STAGE_ENRICHMENT = 'enrichment'
+STAGE_WORKBOOK_WRITE = 'workbook_write'
+STAGE_TOTAL = 'total'
+RECORD_FIELDS = ('seconds', 'bytes_received', 'alerts', 'unique_libraries', 'api_requests', 'peak_rss_mb')
+_END = object()
+
+
+def peak_rss_mb() -> float:
+    # High-water mark of the process resident set size
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / (1 << 10)
+
+
+class Metrics:
+    """Per-stage wall time and counters of a run, published to hooks as one record per stage.
+
+    A hook is any callable taking the record dict: {'stage', 'seconds', 'bytes_received', 'alerts',
+    'unique_libraries', 'api_requests', 'peak_rss_mb'}. Stages running interleaved over several threads (API request,
+    JSON decode, GAV extraction, counting) accumulate their time with add() and are published once with emit().
+    """
+
+    def __init__(self, hooks: List[Callable[[dict], None]] = None):
+        self.hooks = list(hooks or [])
+        self.records: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[dict], None]):
+        self.hooks.append(hook)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.hooks)
+
+    def add(self, stage: str, seconds: float = 0.0, **counters):
+        with self._lock:
+            record = self.records.setdefault(stage, {'stage': stage, 'seconds': 0.0})
+            record['seconds'] += seconds
+            for key, value in counters.items():
+                record[key] = record.get(key, 0) + value
+
+    def set(self, stage: str, **values):
+        with self._lock:
+            self.records.setdefault(stage, {'stage': stage, 'seconds': 0.0}).update(values)
+
+    def emit(self, stage: str):
+        with self._lock:
+            record = dict(self.records.get(stage, {'stage': stage, 'seconds': 0.0}))
+        record['seconds'] = round(record['seconds'], 6)
+        record['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        for hook in self.hooks:
+            hook(record)
+
+    @contextmanager
+    def stage(self, stage: str, **counters):
+        # Time a block as a stage of its own and publish it when the block ends
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t, **counters)
+            self.emit(stage)
+
+
+class StageTimer:
+    """Time spent in the wrapped iterator or callable, for stages interleaved with others in one loop"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def iterate(self, items: Iterable) -> Iterator:
+        items = iter(items)
+        while True:
+            t = time.perf_counter()
+            item = next(items, _END)
+            self.seconds += time.perf_counter() - t
+            if item is _END:
+                return
+            yield item
+
+    def wrap(self, func: Callable) -> Callable:
+        def timed(*args):
+            t = time.perf_counter()
+            result = func(*args)
+            self.seconds += time.perf_counter() - t
+            return result
+        return timed
+
+
+class JsonLinesExporter:
+    """Write each stage record as a JSON line to a stream, or appended to a file"""
+
+    def __init__(self, output: str = "-"):
+        self.output = output
+
+    def __call__(self, record: dict):
+        line = json.dumps(record, sort_keys=True)
+        if self.output == "-":
+            print(line, flush=True)
+        else:
+            with open(self.output, 'a') as f:
+                f.write(line + "\n")
+
+
+class PrometheusTextfileExporter:
+    """Keep a Prometheus node exporter textfile up to date with the stage records (rewritten atomically)"""
+
+    def __init__(self, path: str, prefix: str = "ws_top10_rejected_libs"):
+        self.path = path
+        self.prefix = prefix
+        self.records: Dict[str, dict] = {}
+
+    def _write(self, f: TextIO):
+        for field in RECORD_FIELDS:
+            metric = "{}_stage_{}".format(self.prefix, field)
+            f.write("# TYPE {} gauge\n".format(metric))
+            for stage, record in self.records.items():
+                if field in record:
+                    f.write('{}{{stage="{}"}} {}\n'.format(metric, stage, record[field]))
+
+    def __call__(self, record: dict):
+        self.records[record['stage']] = record
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            self._write(f)
+        os.replace(tmp_path, self.path)
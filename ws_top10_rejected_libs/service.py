@@ -0,0 +1,213 @@
+"""Service mode: a local HTTP endpoint answering top-N queries from an in-memory index of library occurrences per day.
+
+Endpoints (GET):
+    /top?n=10&from=yyyy-MM-dd&to=yyyy-MM-dd&group_by=gav    JSON ranking of the period's libraries
+    /spreadsheet?n=&from=&to=&group_by=                     The same ranking as an xlsx spreadsheet
+    /health                                                 Indexed period and last refresh
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from ws_top10_rejected_libs.aggregation import GROUP_BY_GAV, GROUP_BY_OPTIONS, ExactCounter, LibKey, group_key
+from ws_top10_rejected_libs.alert_cache import default_settle_days, iter_days
+from ws_top10_rejected_libs.exports import lib_record
+from ws_top10_rejected_libs.fetcher import AlertFetcher, alerts_payload, split_date_range
+
+default_port = 8080
+default_refresh_minutes = 60
+max_top_n = 10000
+xlsx_content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+logger = logging.getLogger(__name__)
+
+
+class QueryError(ValueError):
+    pass
+
+
+class DayIndex:
+    """Library occurrences per alert day, replaced a day at a time and summed over a period per query"""
+
+    def __init__(self):
+        self.days: Dict[str, Dict[LibKey, int]] = {}
+        self._lock = threading.Lock()
+
+    def store(self, from_date: str, to_date: str, day_occs: ExactCounter):
+        # Replace the days of [from_date, to_date] with `day_occs` ((day, library) -> count)
+        days = {day: {} for day in iter_days(from_date, to_date)}
+        for (day, lib), occ in day_occs.items():
+            days.setdefault(day, {})[lib] = occ
+        with self._lock:
+            self.days.update(days)
+
+    def evict_before(self, day: str):
+        with self._lock:
+            for old_day in [d for d in self.days if d < day]:
+                del self.days[old_day]
+
+    def period(self) -> Tuple[str, str]:
+        with self._lock:
+            return (min(self.days), max(self.days)) if self.days else ("", "")
+
+    def lib_occurrences(self, start: str, end: str, group_by: str = GROUP_BY_GAV) -> ExactCounter:
+        with self._lock:
+            day_counts = [counts for day, counts in self.days.items() if start <= day <= end]
+        occs = ExactCounter()
+        for counts in day_counts:
+            for lib, occ in counts.items():
+                occs.add(group_key(lib, group_by), occ)
+        return occs
+
+
+class TopService:
+    """Keeps a DayIndex of the organization's last `period_days` days, refreshed every `refresh_minutes`.
+
+    A refresh fetches only the days since the previous refresh, plus the `settle_days` before them, as recent
+    days may still receive alerts.
+    """
+
+    def __init__(self, fetcher: AlertFetcher, user_key: str, org_token: str, ws_lib_url: str, period_days: int,
+                 refresh_minutes: float = default_refresh_minutes, settle_days: int = default_settle_days,
+                 include_header_image: bool = False):
+        self.fetcher = fetcher
+        self.user_key = user_key
+        self.org_token = org_token
+        self.ws_lib_url = ws_lib_url
+        self.period_days = period_days
+        self.refresh_minutes = refresh_minutes
+        self.settle_days = settle_days
+        self.include_header_image = include_header_image
+        self.index = DayIndex()
+        self.last_refresh: Optional[datetime] = None
+        self._stop = threading.Event()
+
+    def refresh(self):
+        now = datetime.now()
+        start = (now - timedelta(days=self.period_days)).strftime('%Y-%m-%d')
+        from_date = start
+        if self.last_refresh:
+            from_date = max(start, (self.last_refresh - timedelta(days=self.settle_days)).strftime('%Y-%m-%d'))
+        to_date = now.strftime('%Y-%m-%d')
+        t = time.perf_counter()
+        payload = alerts_payload(self.user_key, self.org_token, from_date, to_date)
+        windows = split_date_range(from_date, to_date, self.fetcher.window_days)
+        for window_from, window_to, day_occs in self.fetcher.fetch_day_windows(payload, windows):
+            self.index.store(window_from, window_to, day_occs)
+        self.index.evict_before(start)
+        self.last_refresh = now
+        logger.info("Indexed alerts of %s - %s in %.1fs", from_date, to_date, time.perf_counter() - t)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_minutes * 60):
+            try:
+                self.refresh()
+            except Exception as refresh_err:
+                # Keep serving the current index, the next scheduled refresh covers the missed days
+                logger.error("Refreshing the index failed: %s", refresh_err)
+
+    def parse_query(self, query: Dict[str, list]) -> Tuple[int, str, str, str]:
+        def param(name: str, default: str) -> str:
+            return query.get(name, [default])[0] or default
+
+        first_day, last_day = self.index.period()
+        try:
+            top_n = min(max(1, int(param("n", "10"))), max_top_n)
+        except ValueError:
+            raise QueryError("Invalid n: {}".format(param("n", "")))
+        from_date, to_date = param("from", first_day), param("to", last_day)
+        for name, value in (("from", from_date), ("to", to_date)):
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise QueryError("Invalid {} date (expected yyyy-MM-dd): {}".format(name, value))
+        group_by = param("group_by", GROUP_BY_GAV)
+        if group_by not in GROUP_BY_OPTIONS:
+            raise QueryError("Invalid group_by (expected one of {}): {}".format(", ".join(GROUP_BY_OPTIONS), group_by))
+        return top_n, from_date, to_date, group_by
+
+    def top(self, top_n: int, from_date: str, to_date: str, group_by: str = GROUP_BY_GAV) -> dict:
+        most_common = self.index.lib_occurrences(from_date, to_date, group_by).top(top_n)
+        return {
+            "from": from_date,
+            "to": to_date,
+            "group_by": group_by,
+            "libraries": [lib_record(rank, lib, occ, self.ws_lib_url)
+                          for rank, (lib, occ) in enumerate(most_common, start=1)]
+        }
+
+    def spreadsheet(self, top_n: int, from_date: str, to_date: str, group_by: str = GROUP_BY_GAV) -> bytes:
+        from ws_top10_rejected_libs.spreadsheet import render_spreadsheet
+
+        most_common = self.index.lib_occurrences(from_date, to_date, group_by).top(top_n)
+        return render_spreadsheet("Top {} Rejected Libraries".format(top_n), most_common, self.ws_lib_url,
+                                  self.include_header_image)
+
+    def make_server(self, host: str = "127.0.0.1", port: int = default_port) -> HTTPServer:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                logger.debug(fmt, *args)
+
+            def _send(self, status: int, body: bytes, content_type: str, headers: Dict[str, str] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, obj: dict):
+                self._send(status, json.dumps(obj).encode(), "application/json")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                try:
+                    if url.path == "/health":
+                        first_day, last_day = service.index.period()
+                        self._send_json(200, {"from": first_day, "to": last_day, "last_refresh":
+                                              service.last_refresh.isoformat() if service.last_refresh else None})
+                    elif url.path == "/top":
+                        self._send_json(200, service.top(*service.parse_query(parse_qs(url.query))))
+                    elif url.path == "/spreadsheet":
+                        top_n, from_date, to_date, group_by = service.parse_query(parse_qs(url.query))
+                        filename = "Top {} Rejected Libraries - {}-{}.xlsx".format(top_n, from_date, to_date)
+                        self._send(200, service.spreadsheet(top_n, from_date, to_date, group_by), xlsx_content_type,
+                                   {"Content-Disposition": 'attachment; filename="{}"'.format(filename)})
+                    else:
+                        self._send_json(404, {"error": "Not found: {}".format(url.path)})
+                except QueryError as query_err:
+                    self._send_json(400, {"error": str(query_err)})
+
+        return _ThreadingHTTPServer((host, port), Handler)
+
+    def serve(self, host: str = "127.0.0.1", port: int = default_port):
+        # Build the index, then answer queries until interrupted while refreshing it in the background
+        self.refresh()
+        server = self.make_server(host, port)
+        refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        refresher.start()
+        logger.info("Serving top rejected libraries on http://%s:%s/top", *server.server_address[:2])
+        try:
+            server.serve_forever()
+        finally:
+            self._stop.set()
+            server.server_close()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    # '[HOST:]PORT' -> (host, port), listening on localhost by default
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port or default_port)
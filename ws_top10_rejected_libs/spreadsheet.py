@@ -0,0 +1,296 @@
+import base64
+import io
+import os
+import struct
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from ws_top10_rejected_libs.aggregation import LibDetails, LibKey, RankDelta, join_names, product_breakdown
+from ws_top10_rejected_libs.exports import atomic_output
+
+# spreadsheet settings
+# vba_org = False
+# ToDo - Add title_headers for VBA orgs if vba_org = True
+# title_headers = ["Creation Time", "Level", "Type", "Library", "Description", "Details", "Product", "Project",
+#                  "Impact Analysis Status", "Impact Analysis Results", "Library Type"]
+title_headers = ["Name", "Type", "Group", "Artifact", "Version", "Occurrences"]
+detail_headers = ["Policies", "Products", "Projects"]
+product_occs_header = "Occurrences per Product"
+
+default_include_header_image = True
+limit_image_height = 30  # Limit the header image row height. 0 will retain the original image height
+header_image_file = "header_image.png"
+max_col_width = 80  # Cap of the auto-fitted column widths
+max_sheet_urls = 65530  # Excel's limit of hyperlinks per worksheet
+max_sheet_rows = 1048576
+max_chart_series = 255  # Excel's limit of series per chart
+max_sheet_name_length = 31
+trend_sheet_name = "Trend"
+delta_sheet_name = "Change vs Previous Period"
+delta_headers = ["Name", "Type", "Group", "Artifact", "Version", "Rank", "Previous Rank", "Rank Change", "Occurrences",
+                 "Previous Occurrences", "Occurrence Change", "Status"]
+summary_org_headers = ["Organization", "Status", "Unique Libraries", "Occurrences", "Most Common Library",
+                       "Most Common Occurrences", "File"]
+default_image_b64 = "iVBORw0KGgoAAAANSUhEUgAAAMgAAAA5CAYAAABzlmQiAAAAAXNSR0IArs4c6QAAAARnQU1BAACxjwv8YQUAAAAJcEhZcwAACxEAAAsRAX9kX5EAABIxSURBVHhe7Z0JmBTFGYZrd8FFLuVQFETEAxTRiEHQKCLGK8YzqIh4G28jSVC8xROPRDwI4i1ivKKIqNEoXngLRFEQ5VAQUBBBkUOQBTbf293V9sz0zPTszq4Y6n2e7+mrure7pv6qv/6q7jUOh8PhcDgcDofD4XA41g5KgmXRab/DGSzqSGUSf2c1mjLxjjVaOhy/CIpiIIExNJB2k34j/UraStpYqi/VlX6QFktzpE+kcdJr0gxnNI61lWoZiAyDFmJv6STpd9IGUiFUSpOkR6ThMpQv2elwrC1UyUBkGLhNR0gXSzuyrwgslzCUa2QoM7w9DsfPTEEGErhSnaQhEu5UTYArdqN0gwxlhbfH4fiZSGwgQatxnnSFVI99NcwH0rEyksn+psNR+yQyEBkHHfBhEm5VbbJIOl5G8oy/6XDULrQKOZFx0PH+t0QnvLahperZvEXn2Qvnj//Q3+Vw1B45WxAZByHa/0jdvB0JKa+7xmzZgj53JktXlJnZCwr20Cok3K1/+ZsOR+2Q1UBkHKVaPCQd7e0ogK02WW4e7z8x2ErlnSkbmLPvbB9sFQSd931lJG/7mw5HzYMRZCDjYPEnqSDjKC2tNE0bUdnnpkRm2bRh/nRp0Jo9rHtr7m86HDVPrIGIDtJ1/moy2sqluvvsT83hXb8J9mSntKTSDOs72fTpPk/rwc5ktJFuDQzY4ahxMgxEhY8iO1ha39uRgC7bLDYPqMB3arsk2JOfBuVrTL9DZ5mLjphZqJHQqu3nrzocNUtcC3KgxPSRRLRv9YMZdPI007AecxELp+du882xe80NthLBPV8nQ84bgXM4qkuKgQSuyyXeRgLK1Oe4svfnpn551YzDcuYBX5rWzQsaNGc0H0N2OGqU9Baks5R4Csm+O31r2rUkuFQ9CAsf32NesJUInLJz/NW1A1UupVIrabNAzGDOi9KVSX2kqyRmQTvWIlK8f/1A9D0SF7w7zvzU639EGfLcZua1SU1yhnnPvbudefGKCaZJJJK1ZHmZ2f/KTmbFyjivLxZO3mrKxDtm+5vZ0XOdrYWdVMnU+ot13nf+5k8oHfnBVJpNpDFK8zD701E6KpJT/S2PEdJYian8dpBnB53PtP6c6Frna8HcM6ATt6POm8mGjhEP/yvrYpXUX8eW+ZvFQ3+nhRZ/kfaXeEWBQSye506JfNBi3SQsjUHhOMzfyk891fo7tV0abFWfRuuvNju2Keh61NCH+Kt5ob9yWiD8yH2lOHiHhRnKpBugPMnWzzlestfDUBZIYF8QQ0lDD7sHS2gk7eyverSU7N85RSqXikpghLybQyXC/LdB0mPSDtIr0kClSVxr/b8RffDtpM381fzQZ1ivTnHfc+rQuuDKcZ9gmY+RUnTg5eBgmc4fJAo5bCPRUqSgwsLx6LSbqVJ1psGMDpbwrfSev1rzBAX/Xoln2kUtxcnSTRL9UAz1aukCaZ3t70UNZNdgmYgmDWnxi0urZj8Ga4npqh85SU2N6/OOv+qxn85LqY2D6xzpb3mwHTdQuq1ES2MZoQJVnSjF7dJBUj+pq65Vmy+NbSnR5xykv/uptydA21QoV0oHSM+zb10kLFwqIDdr8Wd/Kz9d2y02Q89IyVOPFRWlpmJViecyxbFqdYlZ9mOZabz+Km9EPcroCU3NBcO3DrYSgZVurh8zb5xYz0ffij6WpbvOez1Y53g7LZhaH3WrZknbKN1Kf9NLR416vb/lvRHZRcfHa/+GWifSYA1ve4nWhZA5LRH7P5aeU/rQlwzO29zf8t7b5x6YIMq+XaR7JOAeaDG/97Z8pulaKZPedL2mWvSQyEie5SvpdaX7XMsUlJbXo9+SDtJxJqQWhM7nmXDRcA25r6m6TphXxSD4G/Qf+RvTdX1+kxAdp/Xjt2si4YJMSc+TdGLO+UTnxNbO0RakbbDMC64QI+dx0DfJZhxQp6zSbFA/0zigeeMKs/t2i3KenwYPmtQtfErK5WYdJaX3OSikFCIPZSyL33sbPtMl/PY4KDj/lV6QrpUul/Dtp+g60T4QNTQuGhoj0bfCpWHbGgesJ2HQNi0KJ7VRkKRrtErQ4gkJI+bv3i9N1bEnJDrjUTBoMrugyai6TjOJyma+xH28KX0kzdX+v0spr15re5xE3yYWHWsvfSt5LrOW90kPSgwIY9gEDF6WwvzQsUbSDVqlcuS1be6B3+Ib7R8mtdZ6CtpHHhGEodKInvO19t8k8VpHClEDIXqRiDMPmGP6H/5FsFU8Om25xAw+dapps1HOCiCdjYJlPnBdyGjLQcoQz0y1JB+i77p8Fiwh6mZRwLr4qx653Cven4l7HZmO9yj9zZ38zeqja2E8j0v0HZizlg6G31N6S2k39fb48GozBtxX+w/39uRB6XDLyMdjJKYjdZRotQhRYwQEE95VumgBxWDi7stC/lOb29B4Q4k+MYb+rER/iGlGXoQ1eAZcZgILQyWON5Nwfy+Sfit9oHS/1tJD6/x9npXjD0i06pxDS09lQrBljNI11jIkaiApPnkuvv+hjvnm+/VqTBWro7eVl5QHyoYKMu4QhchCJ9zWwGSsLcw0uX39VY/DlGl22g01nM0nrscPmA3ua6FEqPQmKWp0XC/XgCwt010SP6gFQ+SHZb8V1wd+9GiLyHMSkaQG5se3NQ59pyF6Hq9iCPKED27g1o3Q/pFSF4nDGWg/hexpifM76/zrpY+l76SJEi1WV4kCTouVaCwoCxTu+6TTdd0PpFkSLSGFg5aYymoP6XLtnyB9K+Fe0bJhrOQ3z8O9AKF0+tmEss9XuveDcyZL5NFeEuWAFlALn9DR0U7cgWiI8ZfC0XpAMiwvekZcJjIO1wzO07k0rTS7A/xdnivWS6KQ2lrwQKV7Xun4qIRtUehfdNB+rwXRsfQ+CC3WbjrujdPoOAZDk074FHBPcA+p2bkuUOBb6hzPj9c5FHoKJOAjc4xIV0hwXcZNqIGBvmQ/paPweygNfwOj4fem39Zex8M+iY5jsPQ/GXNhtjT3iVE/rXRhqFLpztWCVmJ37c8abVM6+kAvSScqHa4SefWK1mMtT8dpLTBSm8+893Oo1Frb5FOIjhHaHyX11LEnvZ0xKB2/HQb0qESrTWt5o865VMtYdA4tInmwidJ542TRqjrxXI+mTRuZTTdtGqu6dW3Zy00xrhGQfIak759Ho1kHK1NwP6LRq5HKHAqoLZjQW+kYAIyGlUmXq7N0i46Hg5haZ0SViJWFTqet3aoDUShrHPSxCBvTChDh86RtfG4EZG7YrwLd23KJwrGFdJaE20po/E2dT0troZ/Gt8xyhqJ1rVe1eF+ioqkqGFXc1HBC8Rg3FVlWyHvpEYmKgn4erdldHMsBhoe7GrrRUQNJPNfj+mtOMK++cG2stmyb3g+M56rL+8Sej7bbNvFwDKTUMLkIMivqZlF4qO2owYB5Mzaaw+i4hTAsxmHfReE6WWuvADqt6UQjMBhmelCgKlCoLRSC56R308RLZq0kS7QfEqL8WSbh09OvOEEi0vOqjKS1pFXPBXlXaVjPB0a0nc4ryF+OwL2ErWAE7mG8jhUyCIdrSaV3hu7n2mzS8WNJLOibeERvPiMMWBXqlWOA+Skrq2q+pUCNmXeqSRrRaBatAj6rdTWZVmH9egqVDR9TQ//NX/XATcMlzUWu1qWYVCUjc3oLyoNV0nCt0oehsFwmYcwYYNLJd7iEtFahG18kcGEL/RwUeYS65xGBE8Le4bBBNHMJe1WbDh0yomsZYBzt20UrtCpDq5e4BQlId7OokSxh66ICwg9MBMUSTfekjteGAcTVoOlEBxYxfNxFwsi5lCu4EKJnxE2iP9IteF7ym1YlCQwbzEuYT4UYEa7iFqrx/a1k4KrxN/bX/eyRQLiIHlEDwXKqzdFH7mnq1MntOfTovqNpqb5GEaC5T1KIQpSeRdTNslAr4Z5EiStI/L1EBawIRAcFaZrpbHqogJQEhYSWzs7RoYanFnxZz/lSVNrHvCpaR7YZr+B8+la8PZoLCrgtwFzjQJ2TM3Ko4wwZ4JLagkZgIZfvzeRQsK13LhgrwjXO6YfrHhjzsKFlxo8o6wVPmYkaCFGbRJ/8vOf+F815F97naeYXqRU4LcMF/Xqa0iyvCW7RZmMz4JLMGRz3DhsdXnPW7Pyv7QZE5zEVQvqgIbyhgvN1sG55Q0pvoXCvqFlrA34PO6eHDGUA7RiJ8QAGzohqMVGSMRcLId97lKa7xADcrhIzdekT0HLaKBru5UDpLh2PHaPQfvo3RILs+BHuKMGFG3QsWnZCgv23+FvGdlaofHvoWLaxNlo9KgNmGuQD14/K7GZdL7YmDu6BsO5YrVOxjJdwiXmlgGhjVnQ8JS/Ch1RGs8jX8fQYO26qefa5cZ7uH07llMpxfXqYoYPPMh23b+NFpEpKSkzjxvVN7157mkcf7G822ij1G9dfz19kbhvyTHjNRYsSTVrEBbId6kJhblZ6JCbj2ZUnjB+ktyqjtL+2+he4TxiphaknfGmGgkpwobcEhC5tUIDf9GSJaBNzgTAKQrN2ugsdUvtspwf7Ca12lLxajaXEOAQuJp1hbzq+ziEU219idjGGtbHEIQ+t0/n/p0S06xyl96btC6J33Bcf3bCtBel5F4Zr/VEaqvR5f3ilwc1jgJCBzYd0Pu/gcIjrIUL5GBEfHWEi5kqdQ6vPs9ICv6w0u0hh2dc690FAgU/qErkLDS9MFMBAVEEuy+LF8X227t06miceudCMGT3QvPT81eaNl69Xy9HbbLhhxmi+WbBgcaGhXXhRD25DlwWh81hE3SQiHNm+3hhNR97EuWc1QvDDUhgw6Di8qfJKxxco6VDTMmYzXgo6/Qm+eezt0PJFLRhvYJR6gjRJhQPDoian1SAMfYjSRfunGCej5QxEEtihwD0m4U7hhTCKjeFSSD10Pq0u+3gTlMG+0RIVEgZM1IyxCsaiEqHrUUn0kagkpkkUasZOqAwID9PPOlG6OfKstPoMEtJCUDlO1jlUDAzGTpF4Rs4jGBNGyFL8ICVmQdOd6J30Xkd0M5dd3CtvnyMJkz+Zbc44Z4iZ/03U7c4KBWc/PXRm85UQPSshWzv6vETXiu1XKB2uCD4heYVb9qjSZkxlVjqactLZzHhB6VIMWGnwm/kRgB+BAU5qNSIoQKvI9VNCmDqPSBLvoFDAaAUwGAoklUQ4OVDpWDAjAGOhM809UYNRaMgrRr0zKkCdR6EhlI3B0bwztkRhY6Aw9iWd4J6oxWnVWMfVo+AxPoTBZqBz6IdgKPSTGJykhaFieit6X0pHwW+gfdEgSQZKx71i4IxbYMzcN/fAfae+yRegc8gTfgNcR1o8KhTug37K2zovxfXO6CjoAhgHRpKXPr33MpdeeJTnQlWXGTO/NsedNMgsWBj7XOnQMSWyklKQHI5ik1H1N2/RmY4hfmnecN7ESTNNxarVZtcu24azcz/7fJ5pUL88Z6syW53w0tJSU17uT9WZ8+UCc9Kpt3p9kQRg8cfJOIo/W9LhSCOjFC+cPx4jYfSVjp6dV5SV9z+Y7vUfOu+8tXnplQnm5NNuNSOeets0a9ooY6xjxYoK07ff3WbgjY+roz/N7LvPTmbR98vMKaffZmbPsW+t5uU+Gcc/gnWHo0aJreZlJItkJIQ3E73z/d7YqearuQvN4NufNStXrjJLl64wDRvUM/vsnTqje8nS5eaSAQ+aNWsqzdx535mx46eZkaPeNdM/S/xdLDp1R+n+8NUdjhonPYoVhanGd/uruamsrDRPPvWOZxyF8OFHM8yUqdkCNBnQe++t1iNRL97hKAY5e9fqsONiEY4reASygVqQZs0YU/qJNasrvf5GFSBmz/TmdfbdaMfPQ97wk4yEECCx/5/ryxaEKXnnw/2XKUetkz3UFCB/v0L9EaZ+MwJa2y9UMfXjMBlHVaeUOBzVIq+BgIxktYyEQRumPvBqYt7oVhFgRJevbcS9V+Fw1AoFj/DJ5eJzMrdJNfU/C5n5ybQD5uYU1ut3OIpMlYbAZSScx3A9L9IwPaFK10mDUUI+cMBHzAp9x8PhqBGqVbBlKISJ6ZfwZQzmxBT6FhTzXpjzw0cLmIOUaCjd4agtilHze8hYmDfCu8x8RIBJdbwHTMfezq9nighfiuCNPqZN88Fk3hNYIMPImEDncKwNFM1A4pDRsAgHI2UIbnKhw+FwOBwOh8PhcDgcsRjzP0vKKJE+HE9oAAAAAElFTkSuQmCC"
+
+
+def get_image_type(img_file):
+    if os.path.isfile(img_file):
+        with open(img_file, 'rb') as f:
+            return image_type(f.read(8))
+    return ""
+
+
+def get_image_res(img_file):
+    if os.path.isfile(img_file):
+        with open(img_file, 'rb') as f:
+            return image_res(f.read())
+    return 0, 0
+
+
+def image_type(data: bytes) -> str:
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return "png"
+    if data.startswith(b'\xff\xd8'):
+        return "jpeg"
+    if data.startswith(b'BM'):
+        return "bmp"
+    return ""
+
+
+def image_res(data: bytes) -> Tuple[int, int]:
+    # Width and height of a png or bmp image, (0, 0) for jpeg images
+    img_type = image_type(data)
+    if img_type == "png":
+        width, height = struct.unpack('>LL', data[16:24])
+        return int(width), int(height)
+    elif img_type == "bmp":
+        width, height = struct.unpack('<ll', data[18:26])
+        return abs(width), abs(height)
+    elif img_type == "jpeg":
+        return 0, 0
+    raise ValueError('Image type is unsupported')
+
+
+@lru_cache(maxsize=4)
+def _load_header_image(path: str, mtime: float) -> Optional[Tuple[bytes, int, int]]:
+    # A custom header image and its dimensions, read again only once the file is modified
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not image_type(data):
+        print("Specified header image type is unsupported")
+        return None
+    return (data,) + image_res(data)
+
+
+@lru_cache(maxsize=1)
+def _default_header_image() -> Tuple[bytes, int, int]:
+    data = base64.b64decode(default_image_b64)
+    return (data,) + image_res(data)
+
+
+def get_header_image() -> Optional[Tuple[bytes, int, int]]:
+    """The header image (`header_image_file` if present, else the default logo) with its width and height.
+
+    Images are decoded once and kept in memory, so spreadsheets rendered concurrently share them without
+    writing any file.
+    """
+    if os.path.isfile(header_image_file):
+        return _load_header_image(header_image_file, os.path.getmtime(header_image_file))
+    return _default_header_image()
+
+
+def write_spreadsheet(spreadsheet_file: Union[str, BinaryIO], sheet_name: str, most_common: Iterable[Tuple[LibKey, int]],
+                      ws_lib_url: str, include_header_image: bool = default_include_header_image,
+                      constant_memory: bool = False, trend: List[Tuple[str, List[int]]] = None,
+                      trend_libs: Sequence[LibKey] = (), details: Dict[str, LibDetails] = None,
+                      product_occs: Dict[LibKey, Dict[str, int]] = None, distinct: Dict[LibKey, int] = None,
+                      distinct_header: str = "Distinct Projects", delta: Iterable[RankDelta] = None,
+                      type_occs: Dict[str, Dict[LibKey, int]] = None,
+                      type_sheets: Sequence[Tuple[str, Iterable[Tuple[LibKey, int]]]] = ()) -> int:
+    """Write the ranked libraries to a spreadsheet, returning the number of library rows written.
+
+    The spreadsheet is written to a binary file object, or to a path it replaces once complete (see atomic_output).
+    With `constant_memory`, rows are streamed to disk as they are written, so `most_common` can be an iterator
+    over the complete ranking. Column widths are fitted incrementally while writing.
+    A `trend` ((period, [occurrences of each of `trend_libs`]) rows) is added as a sheet with a line chart.
+    With library `details` (by uuid), their policies, products and projects are added as columns, and with
+    `product_occs`, the occurrences of each library per product. The `distinct` projects (or products) the
+    libraries are ranked by are added as a `distinct_header` column. The rank and occurrence changes since the
+    previous period (`delta`) are added as a sheet of their own. When several alert types are combined, the
+    occurrences of each type (`type_occs`) are added as a column per type, and the ranking of each type
+    (`type_sheets`, as (alert type, ranked libraries)) as a sheet per type.
+    """
+    import xlsxwriter
+    from xlsxwriter.utility import xl_col_to_name
+
+    with atomic_output(spreadsheet_file) as output:
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': constant_memory, 'in_memory': not constant_memory})
+        sheet = workbook.add_worksheet(sheet_name)
+        headers = list(title_headers)
+        if distinct is not None:
+            headers.append(distinct_header)
+        if details is not None:
+            headers += detail_headers
+        if product_occs:
+            headers.append(product_occs_header)
+        if type_occs:
+            headers += list(type_occs)
+
+        format_header = workbook.add_format({'bold': True})
+        # format_novuln = workbook.add_format({'color': '#969696'})
+        sheet.activate()
+
+        # Insert image
+        header_row = 0
+        header_image = get_header_image() if include_header_image else None
+        if header_image:
+            img_data, img_w, img_h = header_image
+            header_row += 1
+            img_scale = limit_image_height / img_h if limit_image_height > 0 and img_h else 1
+            img_row_height = limit_image_height if limit_image_height > 0 or not img_h else img_h
+            sheet.insert_image(0, 0, header_image_file, {'image_data': io.BytesIO(img_data), 'object_position': 1,
+                                                         'x_scale': img_scale, 'y_scale': img_scale})
+            sheet.set_row(0, img_row_height)
+            sheet.merge_range('A1:{}1'.format(xl_col_to_name(len(headers) - 1)), "")
+
+        max_col_widths: List[int] = []
+        # Populate headers
+        for h in range(len(headers)):
+            sheet.write(header_row, h, headers[h], format_header)
+            max_col_widths.append(len(headers[h]))
+
+        # Populate table
+        row = header_row + 1
+        for lib, occ in most_common:
+            if row == max_sheet_rows:
+                print("Spreadsheet row limit reached, libraries after row {} are omitted".format(row - header_row - 1))
+                break
+            row_values = [lib.name, lib.type, lib.group, lib.artifact, lib.version, occ]
+            if distinct is not None:
+                row_values.append(distinct.get(lib, 0))
+            if details is not None:
+                row_values += [join_names(names) for names in details.get(lib.uuid, LibDetails())]
+            if product_occs:
+                row_values.append(product_breakdown(product_occs.get(lib, {})))
+            if type_occs:
+                row_values += [occs.get(lib, 0) for occs in type_occs.values()]
+            for m in range(len(headers)):
+                if m == 0 and lib.uuid and row - header_row <= max_sheet_urls:
+                    sheet.write_url(row, m, ws_lib_url + lib.uuid, string=lib.name)
+                else:
+                    sheet.write(row, m, row_values[m])
+                max_col_widths[m] = max(len(str(row_values[m])), max_col_widths[m])
+            row += 1
+
+        for c in range(len(max_col_widths)):
+            sheet.set_column(c, c, min(max_col_widths[c], max_col_width))
+
+        sheet.freeze_panes(header_row + 1, 0)  # Freeze first row
+        if trend:
+            write_trend_sheet(workbook, trend, trend_libs, format_header)
+        if delta is not None:
+            write_delta_sheet(workbook, delta, ws_lib_url, format_header)
+        sheet_names = {worksheet.name.lower() for worksheet in workbook.worksheets()}
+        for alert_type, type_most_common in type_sheets:
+            _write_table(workbook.add_worksheet(unique_sheet_name(alert_type, sheet_names)), title_headers,
+                         ([lib.name, lib.type, lib.group, lib.artifact, lib.version, occ, lib.uuid]
+                          for lib, occ in type_most_common), format_header, ws_lib_url)
+        workbook.close()
+    return row - header_row - 1
+
+
+def unique_sheet_name(name: str, used: set) -> str:
+    # The name cut to Excel's length limit, suffixed with ' (2)', ' (3)'... while it is in the `used` lower case names
+    unique = name[:max_sheet_name_length]
+    n = 1
+    while unique.lower() in used:
+        n += 1
+        suffix = " ({})".format(n)
+        unique = name[:max_sheet_name_length - len(suffix)] + suffix
+    used.add(unique.lower())
+    return unique
+
+
+def render_spreadsheet(sheet_name: str, most_common: Iterable[Tuple[LibKey, int]], ws_lib_url: str,
+                       include_header_image: bool = default_include_header_image, **options) -> bytes:
+    # The spreadsheet as bytes, rendered in memory (`options` as for write_spreadsheet)
+    output = io.BytesIO()
+    write_spreadsheet(output, sheet_name, most_common, ws_lib_url, include_header_image, **options)
+    return output.getvalue()
+
+
+def write_trend_sheet(workbook, trend: List[Tuple[str, List[int]]], trend_libs: Sequence[LibKey], format_header=None):
+    # A row per period with the occurrences of each library, charted as a line per library
+    sheet = workbook.add_worksheet(trend_sheet_name)
+    trend_libs = trend_libs[:max_chart_series]
+    headers = ["Period"] + [lib.name for lib in trend_libs]
+    for c, header in enumerate(headers):
+        sheet.write(0, c, header, format_header)
+        sheet.set_column(c, c, min(max(len(header), 10), max_col_width))
+    for r, (period, counts) in enumerate(trend, start=1):
+        sheet.write(r, 0, period)
+        for c, count in enumerate(counts[:len(trend_libs)], start=1):
+            sheet.write_number(r, c, count)
+    sheet.freeze_panes(1, 1)
+
+    chart = workbook.add_chart({'type': 'line'})
+    for c in range(1, len(headers)):
+        chart.add_series({
+            'name': [trend_sheet_name, 0, c],
+            'categories': [trend_sheet_name, 1, 0, len(trend), 0],
+            'values': [trend_sheet_name, 1, c, len(trend), c],
+            'marker': {'type': 'circle'}
+        })
+    chart.set_title({'name': "Rejected Libraries Trend"})
+    chart.set_x_axis({'name': "Period"})
+    chart.set_y_axis({'name': "Occurrences"})
+    chart.set_legend({'position': 'bottom'})
+    chart.set_size({'width': 960, 'height': 480})
+    sheet.insert_chart(1, len(headers) + 1, chart)
+
+
+def write_delta_sheet(workbook, delta: Iterable[RankDelta], ws_lib_url: str, format_header=None):
+    # A row per library ranked in either period, leaving the ranks (and rank change) of unranked libraries blank
+    _write_table(workbook.add_worksheet(delta_sheet_name), delta_headers,
+                 ([d.lib.name, d.lib.type, d.lib.group, d.lib.artifact, d.lib.version, d.rank or "",
+                   d.previous_rank or "", d.rank_change if d.rank and d.previous_rank else "", d.occurrences,
+                   d.previous_occurrences, d.occurrence_change, d.status, d.lib.uuid]
+                  for d in delta), format_header, ws_lib_url)
+
+
+def write_summary_spreadsheet(spreadsheet_file: Union[str, BinaryIO], sheet_name: str, most_common: Iterable[Tuple[LibKey, int, int]],
+                              org_rows: Iterable[tuple], ws_lib_url: str):
+    """Write the cross-organization ranking ((library, occurrences, organizations) rows) and the per organization
+    status (`summary_org_headers` rows) to a summary spreadsheet
+    """
+    import xlsxwriter
+
+    with atomic_output(spreadsheet_file) as output:
+        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        format_header = workbook.add_format({'bold': True})
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.activate()
+        _write_table(sheet, title_headers + ["Organizations"],
+                     ([lib.name, lib.type, lib.group, lib.artifact, lib.version, occ, orgs, lib.uuid]
+                      for lib, occ, orgs in most_common), format_header, ws_lib_url)
+        _write_table(workbook.add_worksheet("Organizations"), summary_org_headers, (list(row) for row in org_rows),
+                     format_header)
+        workbook.close()
+
+
+def _write_table(sheet, headers: List[str], rows: Iterable[list], format_header, ws_lib_url: str = ""):
+    # Rows have a value per header, plus the library uuid linking the first column if `ws_lib_url` is set
+    widths = [len(header) for header in headers]
+    for c, header in enumerate(headers):
+        sheet.write(0, c, header, format_header)
+    for r, row in enumerate(rows, start=1):
+        for c, value in enumerate(row[:len(headers)]):
+            if c == 0 and ws_lib_url and len(row) > len(headers) and row[-1] and r <= max_sheet_urls:
+                sheet.write_url(r, c, ws_lib_url + row[-1], string=value)
+            else:
+                sheet.write(r, c, value)
+            widths[c] = max(widths[c], len(str(value)))
+    for c, width in enumerate(widths):
+        sheet.set_column(c, c, min(width, max_col_width))
+    sheet.freeze_panes(1, 0)
@@ -1,36 +1,16 @@
-from argparse import ArgumentParser, REMAINDER, SUPPRESS, RawTextHelpFormatter
-import base64
 import configparser
-from datetime import datetime, date, timedelta
-from dateutil.relativedelta import relativedelta
-from collections import Counter
-import getopt
-import imghdr
-import inspect
-import json
+from contextlib import redirect_stdout
+from datetime import datetime, date
 import logging
-import math
 import os
 import re
-import requests
-import rsa
-import shutil
-import struct
-import subprocess
 import sys
-from typing import Dict
-import xlsxwriter
+import time
+from typing import List, NamedTuple
 
-logging.basicConfig(level=logging.DEBUG if os.environ.get("DEBUG") else logging.INFO,
-                    handlers=[logging.StreamHandler(stream=sys.stdout)],
-                    format='%(levelname)s %(asctime)s %(thread)d %(name)s: %(message)s',
-                    datefmt='%y-%m-%d %H:%M:%S')
-
-today = datetime.today()
 default_period_months = 3
 prompt_date = True
 
-title = "Top 10 Rejected Libraries"
 cfg_file = "{}.config".format(__file__)
 agent_info = 'agentInfo'
 AGENT_NAME = 'top10-rejected-libs'
@@ -47,74 +27,40 @@ USER_KEY = 'UserKey'
 COMP_NAME = 'CompanyName'
 DFLT_PRD = 'DefaultPeriodMonths'
 HDR_IMG = 'IncludeHeaderImage'
-
-argparser = ArgumentParser(prog="ws-top-10-rejected-libs",
-                           description="Generate a spreadsheet listing the 10 most commonly used libraries "
-                                       "that violate organizational policies",
-                           epilog="WhiteSource Field Toolkit\nhttps://github.com/whitesource-ft\n",
-                           formatter_class=RawTextHelpFormatter)
-argparser.add_argument("-s", "--start", dest="start_date", default="", metavar="",
-                       help="Start date in format yyyy-MM-dd. Default: config file option '{}'.".format(DFLT_PRD))
-argparser.add_argument("-e", "--end", dest="end_date", default="", metavar="",
-                       help="End date in format yyyy-MM-dd. Default: 'Today()'.")
-argparser.add_argument("-o", "--organization", dest="org_name", default="", metavar="",
-                       help="WhiteSource Organization Name")
-argparser.add_argument("-c", "--company", dest="company_name", default="", metavar="",
-                       help="Company name. If not provided, WhiteSource Organization name will be used.")
-argparser.add_argument("-d", "--domain", dest="org_env", default="", metavar="",
-                       help="WhiteSource server domain prefix: 'https://DOMAIN.whitesourcesoftware.com' (e.g: 'saas')")
-argparser.add_argument("-apiKey", dest="api_key", default="", metavar="",
-                       help="WhiteSource API Key (Organization Token)")
-argparser.add_argument("-userKey", dest="user_key", default="", metavar="",
-                       help="WhiteSource User Key")
-argparser.add_argument("-debug", "--debug", dest="debug", action='store_true', help=SUPPRESS)
-argparser.set_defaults(debug=False)
-args = argparser.parse_args()
-# argparser.add_argument('args', nargs=REMAINDER)
-# args, unknown = argparser.parse_known_args()
-
-start_date = args.start_date
-end_date = args.end_date
-debug = args.debug
-
-s_args = sys.argv
+SEC_WS_ORG_PREFIX = SEC_WS + ':'  # Batch mode organization sections, e.g: [WhiteSource:Org Name]
 
 use_date_picker = False
 # ToDo - complete date picker implementation
-if use_date_picker:
-    import tkinter as tk
-    from tkcalendar import DateEntry
 
-# spreadsheet settings
-# vba_org = False
-# ToDo - Add title_headers for VBA orgs if vba_org = True
-# title_headers = ["Creation Time", "Level", "Type", "Library", "Description", "Details", "Product", "Project",
-#                  "Impact Analysis Status", "Impact Analysis Results", "Library Type"]
-title_headers = ["Name", "Type", "Group", "Artifact", "Version", "Occurrences"]
-
-default_include_header_image = True
-limit_image_height = 30  # Limit the header image row height. 0 will retain the original image height
-header_image_file = "header_image.png"
-default_image_b64 = "iVBORw0KGgoAAAANSUhEUgAAAMgAAAA5CAYAAABzlmQiAAAAAXNSR0IArs4c6QAAAARnQU1BAACxjwv8YQUAAAAJcEhZcwAACxEAAAsRAX9kX5EAABIxSURBVHhe7Z0JmBTFGYZrd8FFLuVQFETEAxTRiEHQKCLGK8YzqIh4G28jSVC8xROPRDwI4i1ivKKIqNEoXngLRFEQ5VAQUBBBkUOQBTbf293V9sz0zPTszq4Y6n2e7+mrure7pv6qv/6q7jUOh8PhcDgcDofD4XA41g5KgmXRab/DGSzqSGUSf2c1mjLxjjVaOhy/CIpiIIExNJB2k34j/UraStpYqi/VlX6QFktzpE+kcdJr0gxnNI61lWoZiAyDFmJv6STpd9IGUiFUSpOkR6ThMpQv2elwrC1UyUBkGLhNR0gXSzuyrwgslzCUa2QoM7w9DsfPTEEGErhSnaQhEu5UTYArdqN0gwxlhbfH4fiZSGwgQatxnnSFVI99NcwH0rEyksn+psNR+yQyEBkHHfBhEm5VbbJIOl5G8oy/6XDULrQKOZFx0PH+t0QnvLahperZvEXn2Qvnj//Q3+Vw1B45WxAZByHa/0jdvB0JKa+7xmzZgj53JktXlJnZCwr20Cok3K1/+ZsOR+2Q1UBkHKVaPCQd7e0ogK02WW4e7z8x2ErlnSkbmLPvbB9sFQSd931lJG/7mw5HzYMRZCDjYPEnqSDjKC2tNE0bUdnnpkRm2bRh/nRp0Jo9rHtr7m86HDVPrIGIDtJ1/moy2sqluvvsT83hXb8J9mSntKTSDOs72fTpPk/rwc5ktJFuDQzY4ahxMgxEhY8iO1ha39uRgC7bLDYPqMB3arsk2JOfBuVrTL9DZ5mLjphZqJHQqu3nrzocNUtcC3KgxPSRRLRv9YMZdPI007AecxELp+du882xe80NthLBPV8nQ84bgXM4qkuKgQSuyyXeRgLK1Oe4svfnpn551YzDcuYBX5rWzQsaNGc0H0N2OGqU9Baks5R4Csm+O31r2rUkuFQ9CAsf32NesJUInLJz/NW1A1UupVIrabNAzGDOi9KVSX2kqyRmQTvWIlK8f/1A9D0SF7w7zvzU639EGfLcZua1SU1yhnnPvbudefGKCaZJJJK1ZHmZ2f/KTmbFyjivLxZO3mrKxDtm+5vZ0XOdrYWdVMnU+ot13nf+5k8oHfnBVJpNpDFK8zD701E6KpJT/S2PEdJYian8dpBnB53PtP6c6Frna8HcM6ATt6POm8mGjhEP/yvrYpXUX8eW+ZvFQ3+nhRZ/kfaXeEWBQSye506JfNBi3SQsjUHhOMzfyk891fo7tV0abFWfRuuvNju2Keh61NCH+Kt5ob9yWiD8yH2lOHiHhRnKpBugPMnWzzlestfDUBZIYF8QQ0lDD7sHS2gk7eyverSU7N85RSqXikpghLybQyXC/LdB0mPSDtIr0kClSVxr/b8RffDtpM381fzQZ1ivTnHfc+rQuuDKcZ9gmY+RUnTg5eBgmc4fJAo5bCPRUqSgwsLx6LSbqVJ1psGMDpbwrfSev1rzBAX/Xoln2kUtxcnSTRL9UAz1aukCaZ3t70UNZNdgmYgmDWnxi0urZj8Ga4npqh85SU2N6/OOv+qxn85LqY2D6xzpb3mwHTdQuq1ES2MZoQJVnSjF7dJBUj+pq65Vmy+NbSnR5xykv/uptydA21QoV0oHSM+zb10kLFwqIDdr8Wd/Kz9d2y02Q89IyVOPFRWlpmJViecyxbFqdYlZ9mOZabz+Km9EPcroCU3NBcO3DrYSgZVurh8zb5xYz0ffij6WpbvOez1Y53g7LZhaH3WrZknbKN1Kf9NLR416vb/lvRHZRcfHa/+GWifSYA1ve4nWhZA5LRH7P5aeU/rQlwzO29zf8t7b5x6YIMq+XaR7JOAeaDG/97Z8pulaKZPedL2mWvSQyEie5SvpdaX7XMsUlJbXo9+SDtJxJqQWhM7nmXDRcA25r6m6TphXxSD4G/Qf+RvTdX1+kxAdp/Xjt2si4YJMSc+TdGLO+UTnxNbO0RakbbDMC64QI+dx0DfJZhxQp6zSbFA/0zigeeMKs/t2i3KenwYPmtQtfErK5WYdJaX3OSikFCIPZSyL33sbPtMl/PY4KDj/lV6QrpUul/Dtp+g60T4QNTQuGhoj0bfCpWHbGgesJ2HQNi0KJ7VRkKRrtErQ4gkJI+bv3i9N1bEnJDrjUTBoMrugyai6TjOJyma+xH28KX0kzdX+v0spr15re5xE3yYWHWsvfSt5LrOW90kPSgwIY9gEDF6WwvzQsUbSDVqlcuS1be6B3+Ib7R8mtdZ6CtpHHhGEodKInvO19t8k8VpHClEDIXqRiDMPmGP6H/5FsFU8Om25xAw+dapps1HOCiCdjYJlPnBdyGjLQcoQz0y1JB+i77p8Fiwh6mZRwLr4qx653Cven4l7HZmO9yj9zZ38zeqja2E8j0v0HZizlg6G31N6S2k39fb48GozBtxX+w/39uRB6XDLyMdjJKYjdZRotQhRYwQEE95VumgBxWDi7stC/lOb29B4Q4k+MYb+rER/iGlGXoQ1eAZcZgILQyWON5Nwfy+Sfit9oHS/1tJD6/x9npXjD0i06pxDS09lQrBljNI11jIkaiApPnkuvv+hjvnm+/VqTBWro7eVl5QHyoYKMu4QhchCJ9zWwGSsLcw0uX39VY/DlGl22g01nM0nrscPmA3ua6FEqPQmKWp0XC/XgCwt010SP6gFQ+SHZb8V1wd+9GiLyHMSkaQG5se3NQ59pyF6Hq9iCPKED27g1o3Q/pFSF4nDGWg/hexpifM76/zrpY+l76SJEi1WV4kCTouVaCwoCxTu+6TTdd0PpFkSLSGFg5aYymoP6XLtnyB9K+Fe0bJhrOQ3z8O9AKF0+tmEss9XuveDcyZL5NFeEuWAFlALn9DR0U7cgWiI8ZfC0XpAMiwvekZcJjIO1wzO07k0rTS7A/xdnivWS6KQ2lrwQKV7Xun4qIRtUehfdNB+rwXRsfQ+CC3WbjrujdPoOAZDk074FHBPcA+p2bkuUOBb6hzPj9c5FHoKJOAjc4xIV0hwXcZNqIGBvmQ/paPweygNfwOj4fem39Zex8M+iY5jsPQ/GXNhtjT3iVE/rXRhqFLpztWCVmJ37c8abVM6+kAvSScqHa4SefWK1mMtT8dpLTBSm8+893Oo1Frb5FOIjhHaHyX11LEnvZ0xKB2/HQb0qESrTWt5o865VMtYdA4tInmwidJ542TRqjrxXI+mTRuZTTdtGqu6dW3Zy00xrhGQfIak759Ho1kHK1NwP6LRq5HKHAqoLZjQW+kYAIyGlUmXq7N0i46Hg5haZ0SViJWFTqet3aoDUShrHPSxCBvTChDh86RtfG4EZG7YrwLd23KJwrGFdJaE20po/E2dT0troZ/Gt8xyhqJ1rVe1eF+ioqkqGFXc1HBC8Rg3FVlWyHvpEYmKgn4erdldHMsBhoe7GrrRUQNJPNfj+mtOMK++cG2stmyb3g+M56rL+8Sej7bbNvFwDKTUMLkIMivqZlF4qO2owYB5Mzaaw+i4hTAsxmHfReE6WWuvADqt6UQjMBhmelCgKlCoLRSC56R308RLZq0kS7QfEqL8WSbh09OvOEEi0vOqjKS1pFXPBXlXaVjPB0a0nc4ryF+OwL2ErWAE7mG8jhUyCIdrSaV3hu7n2mzS8WNJLOibeERvPiMMWBXqlWOA+Skrq2q+pUCNmXeqSRrRaBatAj6rdTWZVmH9egqVDR9TQ//NX/XATcMlzUWu1qWYVCUjc3oLyoNV0nCt0oehsFwmYcwYYNLJd7iEtFahG18kcGEL/RwUeYS65xGBE8Le4bBBNHMJe1WbDh0yomsZYBzt20UrtCpDq5e4BQlId7OokSxh66ICwg9MBMUSTfekjteGAcTVoOlEBxYxfNxFwsi5lCu4EKJnxE2iP9IteF7ym1YlCQwbzEuYT4UYEa7iFqrx/a1k4KrxN/bX/eyRQLiIHlEDwXKqzdFH7mnq1MntOfTovqNpqb5GEaC5T1KIQpSeRdTNslAr4Z5EiStI/L1EBawIRAcFaZrpbHqogJQEhYSWzs7RoYanFnxZz/lSVNrHvCpaR7YZr+B8+la8PZoLCrgtwFzjQJ2TM3Ko4wwZ4JLagkZgIZfvzeRQsK13LhgrwjXO6YfrHhjzsKFlxo8o6wVPmYkaCFGbRJ/8vOf+F815F97naeYXqRU4LcMF/Xqa0iyvCW7RZmMz4JLMGRz3DhsdXnPW7Pyv7QZE5zEVQvqgIbyhgvN1sG55Q0pvoXCvqFlrA34PO6eHDGUA7RiJ8QAGzohqMVGSMRcLId97lKa7xADcrhIzdekT0HLaKBru5UDpLh2PHaPQfvo3RILs+BHuKMGFG3QsWnZCgv23+FvGdlaofHvoWLaxNlo9KgNmGuQD14/K7GZdL7YmDu6BsO5YrVOxjJdwiXmlgGhjVnQ8JS/Ch1RGs8jX8fQYO26qefa5cZ7uH07llMpxfXqYoYPPMh23b+NFpEpKSkzjxvVN7157mkcf7G822ij1G9dfz19kbhvyTHjNRYsSTVrEBbId6kJhblZ6JCbj2ZUnjB+ktyqjtL+2+he4TxiphaknfGmGgkpwobcEhC5tUIDf9GSJaBNzgTAKQrN2ugsdUvtspwf7Ca12lLxajaXEOAQuJp1hbzq+ziEU219idjGGtbHEIQ+t0/n/p0S06xyl96btC6J33Bcf3bCtBel5F4Zr/VEaqvR5f3ilwc1jgJCBzYd0Pu/gcIjrIUL5GBEfHWEi5kqdQ6vPs9ICv6w0u0hh2dc690FAgU/qErkLDS9MFMBAVEEuy+LF8X227t06miceudCMGT3QvPT81eaNl69Xy9HbbLhhxmi+WbBgcaGhXXhRD25DlwWh81hE3SQiHNm+3hhNR97EuWc1QvDDUhgw6Di8qfJKxxco6VDTMmYzXgo6/Qm+eezt0PJFLRhvYJR6gjRJhQPDoian1SAMfYjSRfunGCej5QxEEtihwD0m4U7hhTCKjeFSSD10Pq0u+3gTlMG+0RIVEgZM1IyxCsaiEqHrUUn0kagkpkkUasZOqAwID9PPOlG6OfKstPoMEtJCUDlO1jlUDAzGTpF4Rs4jGBNGyFL8ICVmQdOd6J30Xkd0M5dd3CtvnyMJkz+Zbc44Z4iZ/03U7c4KBWc/PXRm85UQPSshWzv6vETXiu1XKB2uCD4heYVb9qjSZkxlVjqactLZzHhB6VIMWGnwm/kRgB+BAU5qNSIoQKvI9VNCmDqPSBLvoFDAaAUwGAoklUQ4OVDpWDAjAGOhM809UYNRaMgrRr0zKkCdR6EhlI3B0bwztkRhY6Aw9iWd4J6oxWnVWMfVo+AxPoTBZqBz6IdgKPSTGJykhaFieit6X0pHwW+gfdEgSQZKx71i4IxbYMzcN/fAfae+yRegc8gTfgNcR1o8KhTug37K2zovxfXO6CjoAhgHRpKXPr33MpdeeJTnQlWXGTO/NsedNMgsWBj7XOnQMSWyklKQHI5ik1H1N2/RmY4hfmnecN7ESTNNxarVZtcu24azcz/7fJ5pUL88Z6syW53w0tJSU17uT9WZ8+UCc9Kpt3p9kQRg8cfJOIo/W9LhSCOjFC+cPx4jYfSVjp6dV5SV9z+Y7vUfOu+8tXnplQnm5NNuNSOeets0a9ooY6xjxYoK07ff3WbgjY+roz/N7LvPTmbR98vMKaffZmbPsW+t5uU+Gcc/gnWHo0aJreZlJItkJIQ3E73z/d7YqearuQvN4NufNStXrjJLl64wDRvUM/vsnTqje8nS5eaSAQ+aNWsqzdx535mx46eZkaPeNdM/S/xdLDp1R+n+8NUdjhonPYoVhanGd/uruamsrDRPPvWOZxyF8OFHM8yUqdkCNBnQe++t1iNRL97hKAY5e9fqsONiEY4reASygVqQZs0YU/qJNasrvf5GFSBmz/TmdfbdaMfPQ97wk4yEECCx/5/ryxaEKXnnw/2XKUetkz3UFCB/v0L9EaZ+MwJa2y9UMfXjMBlHVaeUOBzVIq+BgIxktYyEQRumPvBqYt7oVhFgRJevbcS9V+Fw1AoFj/DJ5eJzMrdJNfU/C5n5ybQD5uYU1ut3OIpMlYbAZSScx3A9L9IwPaFK10mDUUI+cMBHzAp9x8PhqBGqVbBlKISJ6ZfwZQzmxBT6FhTzXpjzw0cLmIOUaCjd4agtilHze8hYmDfCu8x8RIBJdbwHTMfezq9nighfiuCNPqZN88Fk3hNYIMPImEDncKwNFM1A4pDRsAgHI2UIbnKhw+FwOBwOh8PhcDgcsRjzP0vKKJE+HE9oAAAAAElFTkSuQmCC"
+debug = False
 
 
 def s_line():
+    import inspect
     return "{0}:{1}".format(os.path.basename(__file__), str(inspect.currentframe().f_back.f_lineno))
 
 
 def fnm():
     # Return the name of the calling function
+    import inspect
     return inspect.stack()[1][3]
 
 
 def pnm():
     # Return the name of the calling function's parent
+    import inspect
     try:
         return inspect.stack()[2][3]
     except Exception as e:
         return 'np'
 
 
+def print_error(err_txt: str):
+    if debug:
+        err_txt = '[{}] [{}] {}'.format(s_line(), pnm(), err_txt)
+    print(err_txt)
+
+
 def set_config():
     c = configparser.ConfigParser()
     c.optionxform = str
@@ -139,8 +85,9 @@ def set_config():
         c.write(c_file, space_around_delimiters=False)
 
 
-def get_config():
-    if not os.path.isfile(cfg_file):
+def get_config(prompt: bool = True):
+    # Without `prompt`, a missing config file reads as an empty config instead of asking for its options
+    if prompt and not os.path.isfile(cfg_file):
         set_config()
     config = configparser.ConfigParser()
     config.read(cfg_file)
@@ -157,31 +104,6 @@ def update_config(section, key, value):
     return cfg
 
 
-def get_image_type(img_file):
-    if os.path.isfile(img_file):
-        return imghdr.what(img_file)
-    return ""
-
-
-def get_image_res(img_file):
-    if os.path.isfile(img_file):
-        with open(img_file, 'rb') as f:
-            data = f.read()
-            img_type = get_image_type(img_file)
-            if img_type == "png":
-                fw, fh = struct.unpack('>LL', data[16:24])
-                width = int(fw)
-                height = int(fh)
-                return width, height
-            elif img_type == "bmp":
-                pass
-            elif img_type == "jpeg":
-                pass
-            else:
-                raise ValueError('Image type is unsupported')
-        return 0, 0
-
-
 def validate_date(dt: str) -> str:
     try:
         darr = dt.split('-')
@@ -192,6 +114,10 @@ def validate_date(dt: str) -> str:
 
 
 def date_picker():
+    import tkinter as tk
+    from tkcalendar import DateEntry
+
+    today = datetime.today()
     # ret_date = None
     def get_selected_date(event):
         w = event.widget
@@ -212,213 +138,635 @@ def date_picker():
     return ""
 
 
-def api_request(payload: Dict[str, str]):
-    r = requests.post(ws_api_url, json=payload)
-    r_json = json.loads(r.text)
-    try:
-        if r_json['errorCode']:
-            if debug:
-                print('[{}] [{}] Error {}: {}'.format(s_line(), fnm(), r_json['errorCode'], r_json['errorMessage']))
-            else:
-                print('Error {}: {}'.format(r_json['errorCode'], r_json['errorMessage']))
-            exit(int(r_json['errorCode']))
-    except KeyError:
-        pass
-    return r_json
-
-
-try:
-    cfg = get_config()
-    cfg_ws = cfg[SEC_WS]
-    cfg_st = cfg[SEC_ST]
-    if not cfg_ws[ORG_NAME]:
-        cfg_ws[ORG_NAME] = input("Organization Name: ")
-        cfg = update_config(SEC_WS, ORG_NAME, cfg_ws[ORG_NAME])
-    if not cfg_ws[ORG_ENV]:
-        cfg_ws[ORG_ENV] = input("Domain: ")
-        cfg = update_config(SEC_WS, ORG_ENV, cfg_ws[ORG_ENV])
-    if not cfg_ws[ORG_TOKEN]:
-        cfg_ws[ORG_TOKEN] = input("API Key: ")
-        cfg = update_config(SEC_WS, ORG_TOKEN, cfg_ws[ORG_TOKEN])
-    if not cfg_ws[USER_KEY]:
-        cfg_ws[USER_KEY] = input("User Key: ")
-        cfg = update_config(SEC_WS, USER_KEY, cfg_ws[USER_KEY])
-    if not cfg_st[COMP_NAME]:
-        cfg_st[COMP_NAME] = cfg_ws[ORG_NAME]
-        cfg = update_config(SEC_ST, COMP_NAME, cfg_st[COMP_NAME])
-    if not cfg_st[DFLT_PRD]:
-        cfg_st[DFLT_PRD] = str(default_period_months)
-    if not end_date:
-        end_date = today.strftime('%Y-%m-%d')
-    if not start_date:
-        if prompt_date:
-            if use_date_picker:
-                start_date = date_picker()
-            else:
-                start_date = input("Start Date (yyyy-MM-dd): ")
-        else:
-            dt_end = datetime.strptime(end_date, '%Y-%m-%d')
-            dt_start = dt_end - relativedelta(months=int(cfg_st[DFLT_PRD]))
-            start_date = dt_start.strftime('%Y-%m-%d')
-
-    # Validate start and end dates
-    sdate_validation = validate_date(start_date)
-    if sdate_validation:
-        err_txt = 'Invalid Start Date: {}'.format(sdate_validation)
-        if debug:
-            err_txt = '[{}] [{}] {}'.format(s_line(), fnm(), err_txt)
-        print(err_txt)
-        exit(1)
-    edate_validation = validate_date(end_date)
-    if edate_validation:
-        err_txt = 'Invalid End Date: {}'.format(edate_validation)
-        if debug:
-            err_txt = '[{}] [{}] {}'.format(s_line(), fnm(), err_txt)
-        print(err_txt)
-        exit(1)
-
-    print("")
-    ws_url = "https://{0}.whitesourcesoftware.com".format(cfg_ws[ORG_ENV])
-    ws_api_url = "{0}/api/v1.3".format(ws_url)
-    ws_lib_url = "{0}/Wss/WSS.html#!libraryDetails;uuid=".format(ws_url)
-    output_title = "{} - {}".format(cfg_st[COMP_NAME], title)
+def get_arg_parser():
+    from argparse import ArgumentParser, SUPPRESS, RawTextHelpFormatter
+    from ws_top10_rejected_libs.aggregation import (BUCKET_OPTIONS, GROUP_BY_GAV, GROUP_BY_OPTIONS, RANK_BY_OCCURRENCES,
+                                                    RANK_BY_OPTIONS)
+    from ws_top10_rejected_libs.defaults import (ALERT_TYPE_REJECTED, SCOPE_AUTO, SCOPE_OPTIONS, default_cache_file,
+                                                 default_details_ttl_hours, default_enrich_workers,
+                                                 default_read_timeout, default_ttl_hours)
+    from ws_top10_rejected_libs.exports import EXPORT_FORMATS, FORMAT_XLSX
+
+    argparser = ArgumentParser(prog="ws-top-10-rejected-libs",
+                               description="Generate a spreadsheet listing the 10 most commonly used libraries "
+                                           "that violate organizational policies",
+                               epilog="WhiteSource Field Toolkit\nhttps://github.com/whitesource-ft\n",
+                               formatter_class=RawTextHelpFormatter)
+    argparser.add_argument("-s", "--start", dest="start_date", default="", metavar="",
+                           help="Start date in format yyyy-MM-dd. Default: config file option '{}'.".format(DFLT_PRD))
+    argparser.add_argument("-e", "--end", dest="end_date", default="", metavar="",
+                           help="End date in format yyyy-MM-dd. Default: 'Today()'.")
+    argparser.add_argument("-o", "--organization", dest="org_name", default="", metavar="",
+                           help="WhiteSource Organization Name")
+    argparser.add_argument("-c", "--company", dest="company_name", default="", metavar="",
+                           help="Company name. If not provided, WhiteSource Organization name will be used.")
+    argparser.add_argument("-d", "--domain", dest="org_env", default="", metavar="",
+                           help="WhiteSource server domain prefix: 'https://DOMAIN.whitesourcesoftware.com' (e.g: 'saas')")
+    argparser.add_argument("-apiKey", dest="api_key", default="", metavar="",
+                           help="WhiteSource API Key (Organization Token)")
+    argparser.add_argument("-userKey", dest="user_key", default="", metavar="",
+                           help="WhiteSource User Key")
+    argparser.add_argument("-n", "--top", dest="top_n", type=int, default=10, metavar="",
+                           help="Number of libraries to list. Default: 10.")
+    argparser.add_argument("-alertTypes", "--alert-types", dest="alert_types", type=parse_alert_types,
+                           default=ALERT_TYPE_REJECTED, metavar="",
+                           help="Comma separated alert types to rank the libraries of (e.g: SECURITY_VULNERABILITY),\n"
+                                "fetched concurrently into a sheet per type plus a combined sheet (xlsx format only).\n"
+                                "Default: '{}'.".format(ALERT_TYPE_REJECTED))
+    argparser.add_argument("-out", "--output", dest="output_file", default="", metavar="",
+                           help="Write the report to this file, or to stdout for '-'.\n"
+                                "Default: './files/<Company> - <Title> - <Period>.<format>'.")
+    argparser.add_argument("-all", "--all", dest="all_libs", action='store_true',
+                           help="List every rejected library, most common first (overrides --top).")
+    argparser.add_argument("-f", "--format", dest="output_format", choices=EXPORT_FORMATS, default=FORMAT_XLSX,
+                           metavar="", help="Output format: {}. Default: '{}'.".format(", ".join(EXPORT_FORMATS),
+                                                                                       FORMAT_XLSX))
+    argparser.add_argument("-g", "--group-by", dest="group_by", choices=GROUP_BY_OPTIONS, default=GROUP_BY_GAV, metavar="",
+                           help="Count occurrences per library version ('{}'), per artifact across versions ('{}')\n"
+                                "or per group ('{}'). Default: '{}'.".format(*GROUP_BY_OPTIONS, GROUP_BY_GAV))
+    argparser.add_argument("-rankBy", "--rank-by", dest="rank_by", choices=RANK_BY_OPTIONS, default=RANK_BY_OCCURRENCES,
+                           metavar="", help="Rank the libraries by their alert '{}', or by the number of distinct\n"
+                                            "'{}' or '{}' they were rejected in. Default: '{}'.".format(
+                                                *RANK_BY_OPTIONS, RANK_BY_OCCURRENCES))
+    argparser.add_argument("-approxDistinct", "--approx-distinct", dest="approx_distinct", action='store_true',
+                           help="Count the distinct projects/products of libraries found in many of them with\n"
+                                "HyperLogLog sketches (about 3%% error, bounded memory per library).")
+    argparser.add_argument("-bucket", "--bucket", dest="bucket", choices=BUCKET_OPTIONS, default="", metavar="",
+                           help="Add a trend sheet charting the top libraries per '{}' or '{}' of the period,\n"
+                                "counted in the same single fetch (xlsx format only).".format(*BUCKET_OPTIONS))
+    argparser.add_argument("-comparePrevious", "--compare-previous", dest="compare_previous", action='store_true',
+                           help="Add a sheet of the rank and occurrence changes since the preceding period of equal\n"
+                                "length, fetched in the same pass (xlsx format only).")
+    argparser.add_argument("-approx", "--approx-capacity", dest="approx_capacity", type=int, default=0, metavar="",
+                           help="Approximate the counts tracking at most this many libraries (fixed memory).\n"
+                                "Default: 0 (exact counts).")
+    argparser.add_argument("-w", "--window-days", dest="window_days", type=int, default=0, metavar="",
+                           help="Split the period into windows of this many days, fetched separately (e.g: 7 for weekly).\n"
+                                "Default: 0 (fetch the whole period in a single request).")
+    argparser.add_argument("-scope", "--scope", dest="scope", choices=SCOPE_OPTIONS, default=SCOPE_AUTO, metavar="",
+                           help="Fetch the alerts with organization level requests ('org'), per product ('product'),\n"
+                                "or per product only if the organization level requests fail or exceed\n"
+                                "-maxResponseMb ('auto'). Default: '{}'.".format(SCOPE_AUTO))
+    argparser.add_argument("-maxResponseMb", "--max-response-mb", dest="max_response_mb", type=float, default=0,
+                           metavar="", help="Largest organization level response processed with the 'auto' scope.\n"
+                                            "Default: 0 (no limit).")
+    argparser.add_argument("-workers", "--workers", dest="workers", type=int, default=4, metavar="",
+                           help="Maximum number of windows fetched concurrently. Default: 4.")
+    argparser.add_argument("-retries", "--retries", dest="retries", type=int, default=3, metavar="",
+                           help="Number of attempts of each request (with exponential backoff on connection errors,\n"
+                                "timeouts and HTTP 429/5xx), and of fetching a window again when its response breaks\n"
+                                "off midway. Default: 3.")
+    argparser.add_argument("-timeout", "--timeout", dest="timeout", type=float, default=default_read_timeout, metavar="",
+                           help="Seconds to wait for the WhiteSource API to respond. "
+                                "Default: {}.".format(default_read_timeout))
+    argparser.add_argument("-cache", "--cache", dest="cache_file", nargs="?", const=default_cache_file, default="", metavar="",
+                           help="Keep fetched alerts in a local cache file and only fetch days missing from it.\n"
+                                "Default file: '{}'.".format(default_cache_file))
+    argparser.add_argument("-cacheTtl", "--cache-ttl", dest="cache_ttl", type=float, default=default_ttl_hours, metavar="",
+                           help="Hours after which cached recent days are fetched again. "
+                                "Default: {}.".format(default_ttl_hours))
+    argparser.add_argument("-refresh", "--refresh", dest="refresh_cache", action='store_true',
+                           help="Fetch the whole period again, replacing its cached alerts.")
+    argparser.add_argument("-enrich", "--enrich", dest="enrich", action='store_true',
+                           help="Add the rejecting policies and the products and projects using each listed library,\n"
+                                "fetched once per library (and kept in the -cache file for -detailsTtl hours).")
+    argparser.add_argument("-enrichWorkers", "--enrich-workers", dest="enrich_workers", type=int,
+                           default=default_enrich_workers, metavar="",
+                           help="Maximum number of libraries enriched concurrently. "
+                                "Default: {}.".format(default_enrich_workers))
+    argparser.add_argument("-detailsTtl", "--details-ttl", dest="details_ttl", type=float,
+                           default=default_details_ttl_hours, metavar="",
+                           help="Hours after which cached library details are fetched again. "
+                                "Default: {}.".format(default_details_ttl_hours))
+    argparser.add_argument("-batch", "--batch", dest="batch", action='store_true',
+                           help="Report every organization of the config file's [{}<name>] sections concurrently,\n"
+                                "plus a cross-organization summary.".format(SEC_WS_ORG_PREFIX))
+    argparser.add_argument("-orgs", "--orgs-file", dest="orgs_file", default="", metavar="",
+                           help="Batch mode with the organizations of this CSV file, with the columns\n"
+                                "{}, {} and optionally {}, {}, {}.".format(ORG_NAME, ORG_TOKEN, USER_KEY,
+                                                                           ORG_ENV, COMP_NAME))
+    argparser.add_argument("-batchWorkers", "--batch-workers", dest="batch_workers", type=int, default=4, metavar="",
+                           help="Maximum number of organizations reported concurrently in batch mode. Default: 4.")
+    argparser.add_argument("-serve", "--serve", dest="serve", nargs="?", const="8080", default="", metavar="",
+                           help="Run as a service answering 'top?n=&from=&to=&group_by=' queries on [HOST:]PORT\n"
+                                "from an in-memory index of the period's alerts. Default: localhost:8080.")
+    argparser.add_argument("-refreshMinutes", "--refresh-minutes", dest="refresh_minutes", type=float, default=60,
+                           metavar="", help="Minutes between incremental refreshes of the service index. Default: 60.")
+    argparser.add_argument("-metrics", "--metrics", dest="metrics", nargs="?", const="-", default="", metavar="",
+                           help="Write a JSON record per stage (time, bytes received, alerts, unique libraries,\n"
+                                "peak memory) to this file. Default (when specified without a value): stdout.")
+    argparser.add_argument("-metricsTextfile", "--metrics-textfile", dest="metrics_textfile", default="", metavar="",
+                           help="Write the stage metrics to this Prometheus node exporter textfile.")
+    argparser.add_argument("-debug", "--debug", dest="debug", action='store_true', help=SUPPRESS)
+    argparser.set_defaults(debug=False)
+    return argparser
+
+
+def parse_alert_types(value: str) -> List[str]:
+    # 'TYPE_A, type_b' -> ['TYPE_A', 'TYPE_B'], without duplicates
+    alert_types = list(dict.fromkeys(alert_type.strip().upper() for alert_type in value.split(",")
+                                     if alert_type.strip()))
+    if not alert_types:
+        from argparse import ArgumentTypeError
+        raise ArgumentTypeError("no alert type given")
+    return alert_types
+
+
+def get_lib_occurrences(fetcher, payload: dict, cache_file: str = "", cache_ttl: float = None, refresh: bool = False,
+                        retain_from: str = ""):
+    # Fetch and count the payload's alerts, through the local cache if `cache_file` is set
+    if not cache_file:
+        return fetcher.lib_occurrences(payload)
+    from ws_top10_rejected_libs.alert_cache import AlertCache
+    from ws_top10_rejected_libs.defaults import ALERT_TYPE_REJECTED, default_ttl_hours
+
+    # Alerts of other types are cached apart, keeping the existing rejected alerts cache keys
+    cache_key = payload["orgToken"]
+    if payload["alertType"] != ALERT_TYPE_REJECTED:
+        cache_key = "{}:{}".format(cache_key, payload["alertType"])
+    with AlertCache(cache_file, cache_key,
+                    ttl_hours=default_ttl_hours if cache_ttl is None else cache_ttl) as alert_cache:
+        if retain_from:
+            alert_cache.evict_before(retain_from)
+        return fetcher.lib_occurrences_cached(payload, alert_cache, refresh=refresh)
+
+
+class OrgSettings(NamedTuple):
+    name: str
+    api_key: str
+    user_key: str
+    domain: str
+    company_name: str
+
+
+def get_batch_orgs(cfg: configparser.ConfigParser, orgs_file: str = "") -> List[OrgSettings]:
+    """Organizations of the CSV `orgs_file`, or of the [WhiteSource:<name>] sections of the config.
+
+    Missing user keys, domains and company names default to the [WhiteSource] and [Settings] options.
+    """
+    cfg_ws = cfg[SEC_WS] if cfg.has_section(SEC_WS) else {}
+    cfg_st = cfg[SEC_ST] if cfg.has_section(SEC_ST) else {}
+    if orgs_file:
+        import csv
+        with open(orgs_file, newline='') as f:
+            org_entries = [{k.strip(): (v or "").strip() for k, v in row.items() if k} for row in csv.DictReader(f)]
+    else:
+        org_entries = [dict({key: cfg[section].get(key, "") for key in (ORG_TOKEN, USER_KEY, ORG_ENV, COMP_NAME)},
+                            **{ORG_NAME: cfg[section].get(ORG_NAME) or section[len(SEC_WS_ORG_PREFIX):]})
+                       for section in cfg.sections() if section.startswith(SEC_WS_ORG_PREFIX)]
+    orgs = []
+    for entry in org_entries:
+        if not entry.get(ORG_NAME) or not entry.get(ORG_TOKEN):
+            continue
+        orgs.append(OrgSettings(entry[ORG_NAME], entry[ORG_TOKEN], entry.get(USER_KEY) or cfg_ws.get(USER_KEY, ""),
+                                entry.get(ORG_ENV) or cfg_ws.get(ORG_ENV, ""),
+                                entry.get(COMP_NAME) or cfg_st.get(COMP_NAME) or entry[ORG_NAME]))
+    return orgs
+
+
+def get_ws_url(domain: str) -> str:
+    return "https://{0}.whitesourcesoftware.com".format(domain)
+
+
+def get_ws_api_url(ws_url: str) -> str:
+    return "{0}/api/v1.3".format(ws_url)
+
+
+def get_ws_lib_url(ws_url: str) -> str:
+    return "{0}/Wss/WSS.html#!libraryDetails;uuid=".format(ws_url)
+
+
+def get_output_title(name: str, title: str, start_date: str, end_date: str) -> str:
+    output_title = "{} - {}".format(name, title)
     if start_date and end_date:
         output_title = "{} - {}-{}".format(output_title, start_date, end_date)
+    return re.sub(r'[\\/:*?"<>|]', '_', output_title)
+
+
+def get_pool_size(args) -> int:
+    # Connections a report uses at once: the windows of all alert types, then the library details requests
+    return max(max(1, args.workers) * len(args.alert_types), max(1, args.enrich_workers) if args.enrich else 0)
+
+
+def get_alert_fetcher(ws_client, args, metrics):
+    from ws_top10_rejected_libs.fetcher import AlertFetcher
+
+    top_n = max(1, args.top_n)
+    approx_capacity = max(args.approx_capacity, top_n) if args.approx_capacity > 0 else 0
+    return AlertFetcher(ws_client, window_days=args.window_days, workers=args.workers, retries=args.retries,
+                        group_by=args.group_by, approx_capacity=approx_capacity, metrics=metrics, bucket=args.bucket,
+                        scope=args.scope, max_response_bytes=int(args.max_response_mb * (1 << 20)),
+                        rank_by=args.rank_by, approx_distinct=args.approx_distinct,
+                        compare_previous=args.compare_previous)
+
+
+def get_type_lib_occurrences(ws_client, user_key: str, org_token: str, start_date: str, end_date: str, args, metrics,
+                             retain_from: str = ""):
+    """Fetch and count the alerts of every alert type concurrently, each with its own AlertFetcher.
+
+    Returns the fetcher, the library occurrences and the occurrences per alert type of a single type (None),
+    or no fetcher, the combined occurrences and the occurrences per alert type of several types.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from ws_top10_rejected_libs.aggregation import ExactCounter
+    from ws_top10_rejected_libs.fetcher import alerts_payload
+    from ws_top10_rejected_libs.metrics import STAGE_COUNTING
+
+    def fetch_type(alert_type: str):
+        fetcher = get_alert_fetcher(ws_client, args, metrics)
+        payload = alerts_payload(user_key, org_token, start_date, end_date, alert_type)
+        return fetcher, get_lib_occurrences(fetcher, payload, args.cache_file, args.cache_ttl, args.refresh_cache,
+                                            retain_from)
+
+    if len(args.alert_types) == 1:
+        fetcher, lib_occs = fetch_type(args.alert_types[0])
+        return fetcher, lib_occs, None
+    with ThreadPoolExecutor(max_workers=len(args.alert_types)) as executor:
+        fetched = list(executor.map(fetch_type, args.alert_types))
+    t = time.perf_counter()
+    lib_occs = ExactCounter()
+    for _, type_occs in fetched:
+        lib_occs.merge(type_occs)
+    metrics.add(STAGE_COUNTING, time.perf_counter() - t)
+    metrics.set(STAGE_COUNTING, unique_libraries=len(lib_occs))
+    return None, lib_occs, {alert_type: occs for alert_type, (_, occs) in zip(args.alert_types, fetched)}
+
+
+def get_fetched_breakdowns(fetcher, args) -> tuple:
+    # The occurrences per product and of the previous period kept by a single type's fetcher, if any
+    if not fetcher:
+        return None, None
+    return fetcher.product_occs, fetcher.previous_occs if args.compare_previous else None
+
+
+def get_enricher(ws_client, user_key: str, org_token: str, args):
+    # Library details are cached in the alert cache file, so without --cache no file is written
+    if not args.enrich:
+        return None
+    from ws_top10_rejected_libs.enrichment import LibraryEnricher
+
+    return LibraryEnricher(ws_client, user_key, org_token, cache_file=args.cache_file,
+                           cache_ttl=args.details_ttl, workers=args.enrich_workers)
+
+
+def write_report(lib_occs, report_file, args, title: str, ws_lib_url: str, include_header_image: bool,
+                 start_date: str, end_date: str, metrics, enricher=None, product_occs=None, previous_occs=None,
+                 type_occs=None) -> list:
+    """Write the top N (or all) counted libraries to `report_file` (a path or a binary file object) in the output
+    format, returning the top N.
+
+    With an `enricher`, the details of the top N libraries are fetched and added to the report, as are their
+    occurrences per product (`product_occs`) if the alerts were fetched per product. With the occurrences of the
+    previous period (`previous_occs`), the changes of the top N libraries since that period are added. With the
+    occurrences per alert type (`type_occs`), the ranking of every type is added next to the combined one.
+    """
+    from ws_top10_rejected_libs import exports
+    from ws_top10_rejected_libs.aggregation import RANK_BY_OCCURRENCES, iter_buckets, rank_deltas
+    from ws_top10_rejected_libs.metrics import STAGE_COUNTING, STAGE_ENRICHMENT, STAGE_WORKBOOK_WRITE
+    from ws_top10_rejected_libs.spreadsheet import max_chart_series, write_spreadsheet
+
+    top_n = max(1, args.top_n)
+    t = time.perf_counter()
+    most_common = lib_occs.ranked() if args.all_libs else lib_occs.top(top_n)
+    trend_libs, trend = [], None
+    if args.bucket:
+        trend_libs = [lib for lib, _ in most_common[:min(top_n, max_chart_series)]]
+        trend = lib_occs.trend(trend_libs, iter_buckets(start_date, end_date, args.bucket))
+    delta = rank_deltas(lib_occs, previous_occs, top_n) if previous_occs is not None else None
+    type_sheets = [(alert_type, occs.ranked() if args.all_libs else occs.top(top_n))
+                   for alert_type, occs in (type_occs or {}).items()]
+    metrics.add(STAGE_COUNTING, time.perf_counter() - t)
+
+    distinct = None
+    if args.rank_by != RANK_BY_OCCURRENCES:
+        distinct = {lib: lib_occs.distinct_count(lib) for lib, _ in most_common}
+
+    details = None
+    if enricher:
+        t = time.perf_counter()
+        fetched = enricher.fetched
+        details = enricher.enrich(lib for lib, _ in most_common[:top_n])
+        metrics.add(STAGE_ENRICHMENT, time.perf_counter() - t, unique_libraries=len(details),
+                    api_requests=enricher.fetched - fetched)
+
+    t = time.perf_counter()
+    distinct_header = "Distinct " + args.rank_by.capitalize()  # Apart from the detail Products/Projects columns
+    if args.output_format == exports.FORMAT_CSV:
+        exports.write_csv(report_file, most_common, ws_lib_url, details, product_occs, distinct, distinct_header)
+    elif args.output_format == exports.FORMAT_JSONL_GZ:
+        exports.write_jsonl_gz(report_file, most_common, ws_lib_url, details, product_occs, distinct, distinct_header)
+    else:
+        write_spreadsheet(report_file, title, most_common, ws_lib_url, include_header_image,
+                          constant_memory=args.all_libs, trend=trend, trend_libs=trend_libs, details=details,
+                          product_occs=product_occs, distinct=distinct, distinct_header=distinct_header, delta=delta,
+                          type_occs={alert_type: occs.counts for alert_type, occs in type_occs.items()}
+                          if type_occs else None, type_sheets=type_sheets)
+    metrics.add(STAGE_WORKBOOK_WRITE, time.perf_counter() - t)
+    return most_common[:top_n]
+
+
+def run_batch(orgs: List[OrgSettings], args, company_name: str, title: str, start_date: str, end_date: str,
+              retain_from: str, files_dir: str, ws_lib_url: str, include_header_image: bool, metrics) -> int:
+    """Report the organizations concurrently, each to its own file, followed by a cross-organization summary.
+
+    Organizations of the same domain share an HTTP session. A failed organization is reported in the summary
+    without affecting the others. Returns the number of failed organizations.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from ws_top10_rejected_libs.aggregation import ExactCounter
+    from ws_top10_rejected_libs.metrics import STAGE_COUNTING, STAGE_WORKBOOK_WRITE
+    from ws_top10_rejected_libs.spreadsheet import write_summary_spreadsheet
+    from ws_top10_rejected_libs.ws_client import WsClient
+
+    workers = max(1, min(args.batch_workers, len(orgs)))
+    clients = {domain: WsClient(get_ws_api_url(get_ws_url(domain)), agent_info_details, timeout=args.timeout,
+                                retries=args.retries, pool_size=workers * get_pool_size(args))
+               for domain in {org.domain for org in orgs}}
+
+    def report_org(org: OrgSettings):
+        org_lib_url = get_ws_lib_url(get_ws_url(org.domain))
+        name = org.name if org.company_name == org.name else "{} - {}".format(org.company_name, org.name)
+        report_filename = "{}.{}".format(get_output_title(name, title, start_date, end_date), args.output_format)
+        fetcher, lib_occs, type_occs = get_type_lib_occurrences(clients[org.domain], org.user_key, org.api_key,
+                                                                start_date, end_date, args, metrics, retain_from)
+        most_common = write_report(lib_occs, os.path.join(files_dir, report_filename), args, title, org_lib_url,
+                                   include_header_image, start_date, end_date, metrics,
+                                   get_enricher(clients[org.domain], org.user_key, org.api_key, args),
+                                   *get_fetched_breakdowns(fetcher, args), type_occs)
+        print("Generated: {}".format(report_filename))
+        return lib_occs, most_common, report_filename
+
+    all_occs, org_counts, org_rows = ExactCounter(), ExactCounter(), []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(report_org, org) for org in orgs]
+            for org, future in zip(orgs, futures):
+                try:
+                    lib_occs, most_common, report_filename = future.result()
+                except Exception as org_err:
+                    print_error("Error: Organization '{}' failed: {}".format(org.name, org_err))
+                    org_rows.append((org.name, "Failed: {}".format(org_err), 0, 0, "", 0, ""))
+                    continue
+                t = time.perf_counter()
+                total = 0
+                for lib, occ in lib_occs.items():
+                    all_occs.add(lib, occ)
+                    org_counts.add(lib)
+                    total += occ
+                metrics.add(STAGE_COUNTING, time.perf_counter() - t)
+                top_lib, top_occ = most_common[0] if most_common else (None, 0)
+                org_rows.append((org.name, "OK", len(lib_occs), total, top_lib.name if top_lib else "", top_occ,
+                                 report_filename))
+    finally:
+        for client in clients.values():
+            client.close()
+    metrics.set(STAGE_COUNTING, unique_libraries=len(all_occs))
+
+    summary_filename = "{}.xlsx".format(get_output_title(company_name, title + " Summary", start_date, end_date))
+    print("Generating summary: {}".format(summary_filename))
+    t = time.perf_counter()
+    most_common = all_occs.top(max(1, args.top_n))
+    write_summary_spreadsheet(os.path.join(files_dir, summary_filename), title,
+                              [(lib, occ, org_counts.counts[lib]) for lib, occ in most_common], org_rows, ws_lib_url)
+    metrics.add(STAGE_WORKBOOK_WRITE, time.perf_counter() - t)
+    return sum(1 for row in org_rows if row[1] != "OK")
+
+
+def run_service(args, cfg_ws, cfg_st, metrics) -> int:
+    # Index the period (from the start date, or the default period months) and serve queries until interrupted
+    from dateutil.relativedelta import relativedelta
+    from ws_top10_rejected_libs.service import TopService, parse_address
+    from ws_top10_rejected_libs.spreadsheet import default_include_header_image
+    from ws_top10_rejected_libs.ws_client import WsClient
+
+    today = datetime.today()
+    if args.start_date:
+        sdate_validation = validate_date(args.start_date)
+        if sdate_validation:
+            print_error('Invalid Start Date: {}'.format(sdate_validation))
+            return 1
+        dt_start = datetime.strptime(args.start_date, '%Y-%m-%d')
+    else:
+        dt_start = today - relativedelta(months=int(cfg_st[DFLT_PRD]))
+    ws_url = get_ws_url(cfg_ws[ORG_ENV])
+    with WsClient(get_ws_api_url(ws_url), agent_info_details, timeout=args.timeout, retries=args.retries,
+                  pool_size=args.workers) as ws_client:
+        service = TopService(get_alert_fetcher(ws_client, args, metrics), cfg_ws[USER_KEY], cfg_ws[ORG_TOKEN],
+                             get_ws_lib_url(ws_url), (today - dt_start).days, args.refresh_minutes,
+                             include_header_image=cfg_st.getboolean(HDR_IMG, fallback=default_include_header_image))
+        service.serve(*parse_address(args.serve))
+    return 0
+
+
+def main(argv: List[str] = None, metrics=None) -> int:
+    """Run the report from command line arguments, publishing stage metrics to `metrics` hooks (if provided)"""
+    args = get_arg_parser().parse_args(argv)
+    if args.output_file == "-":
+        # The report is streamed to stdout, everything else is printed to stderr
+        report_stream = sys.stdout.buffer
+        with redirect_stdout(sys.stderr):
+            rc = run_report(args, metrics, report_stream)
+        report_stream.flush()
+        return rc
+    return run_report(args, metrics)
+
+
+def run_report(args, metrics=None, report_stream=None) -> int:
+    # Run the report of parsed command line arguments, written to the binary `report_stream` if set
+    global debug
+    logging.basicConfig(level=logging.DEBUG if os.environ.get("DEBUG") else logging.INFO,
+                        handlers=[logging.StreamHandler(stream=sys.stdout)],
+                        format='%(levelname)s %(asctime)s %(thread)d %(name)s: %(message)s',
+                        datefmt='%y-%m-%d %H:%M:%S')
+    debug = args.debug
+    start_date = args.start_date
+    end_date = args.end_date
+    top_n = max(1, args.top_n)
+    today = datetime.today()
+    t_start = time.perf_counter()
+
+    from dateutil.relativedelta import relativedelta
+    from ws_top10_rejected_libs import exports
+    from ws_top10_rejected_libs.aggregation import RANK_BY_OCCURRENCES
+    from ws_top10_rejected_libs.defaults import ALERT_TYPE_REJECTED
+    from ws_top10_rejected_libs.fetcher import previous_period
+    from ws_top10_rejected_libs import metrics as stage_metrics
+    from ws_top10_rejected_libs.spreadsheet import default_include_header_image
+    from ws_top10_rejected_libs.ws_client import WsApiError, WsClient, WsError
+
+    libraries = "Rejected Libraries" if args.alert_types == [ALERT_TYPE_REJECTED] else "Alerted Libraries"
+    title = libraries if args.all_libs else "Top {} {}".format(top_n, libraries)
+    metrics = metrics or stage_metrics.Metrics()
+    if args.metrics:
+        metrics.add_hook(stage_metrics.JsonLinesExporter(args.metrics))
+    if args.metrics_textfile:
+        metrics.add_hook(stage_metrics.PrometheusTextfileExporter(args.metrics_textfile))
 
-    cwd = os.getcwd()
-    files_dir = os.path.join(cwd, "files")
-    if os.path.isdir(files_dir):
-        shutil.rmtree(files_dir)
-    spreadsheet_filename = "{}.xlsx".format(output_title)
-    spreadsheet_file = os.path.join(files_dir, spreadsheet_filename)
-    sheet_name = title
-
-    # Get all Policy Violation Alerts
-    payload_alerts = {
-        agent_info: agent_info_details,
-        "requestType": "getOrganizationAlertsByType",
-        "userKey": cfg_ws[USER_KEY],
-        "orgToken": cfg_ws[ORG_TOKEN],
-        "alertType": "REJECTED_BY_POLICY_RESOURCE",
-        "fromDate": start_date,
-        "toDate": end_date
-    }
-    res_alerts = api_request(payload_alerts)
-    alerts = res_alerts["alerts"]
-    alerts_count = len(alerts)
-
-    # Get list of unique GAVs
-    lib_gavs = []
-    for a in range(alerts_count):
-        alt = alerts[a]["library"]
-        try:
-            alt_g = alt["groupId"]
-        except KeyError:
-            alt_g = ""
-        try:
-            alt_a = alt["artifactId"]  # ["name"]
-        except KeyError:
-            alt_a = ""
-        try:
-            alt_v = alt["version"]
-        except KeyError:
-            alt_v = ""
-        try:
-            lib_n = alt["filename"]
-        except KeyError:
-            lib_n = ""
-        try:
-            lib_t = alt["type"]
-        except KeyError:
-            lib_t = ""
-        try:
-            lib_u = alt["keyUuid"]
-        except KeyError:
-            lib_u = ""
-        # gav = "{}|{}|{}".format(alt_g, alt_a, alt_v)
-        gav = "{}|{}|{}|{}|{}|{}".format(lib_n, lib_u, lib_t, alt_g, alt_a, alt_v)
-        lib_gavs.append(gav)
-    lib_gavs_count = len(lib_gavs)
-
-    # Find the number of occurrences of each GAV
-    lib_occs = Counter(lib_gavs)
-    # Get the top 10 from the list
-    most_common = lib_occs.most_common(10)
-
-    # Create a spreadsheet
-    print("Generating spreadsheet: {}".format(spreadsheet_filename))
-    os.mkdir(files_dir)
-    workbook = xlsxwriter.Workbook(spreadsheet_file)
-    sheet = workbook.add_worksheet(sheet_name)
-
-    format_header = workbook.add_format({'bold': True})
-    format_align_right = workbook.add_format({'align': 'right'})
-    format_url = workbook.get_default_url_format()
-    # format_novuln = workbook.add_format({'color': '#969696'})
-    sheet.activate()
-
-    # Insert image
-    header_row = 0
-    if cfg_st[HDR_IMG]:
-        if os.path.isfile(header_image_file):
-            if get_image_type(header_image_file) not in ["bmp", "jpeg", "png"]:
-                print("Specified header image type is unsupported")
-                include_header_image = False
+    try:
+        t_config = time.perf_counter()
+        batch_mode = args.batch or args.orgs_file
+        # Batch mode runs unattended and needs neither the config file nor its single organization sections
+        cfg = get_config(prompt=not batch_mode)
+        for section in (SEC_WS, SEC_ST):
+            if not cfg.has_section(section):
+                cfg.add_section(section)
+        cfg_ws = cfg[SEC_WS]
+        cfg_st = cfg[SEC_ST]
+        batch_orgs = []
+        if batch_mode:
+            batch_orgs = get_batch_orgs(cfg, args.orgs_file)
+            if not batch_orgs:
+                print_error("Error: No organizations found in {}".format(args.orgs_file or cfg_file))
+                return 1
+            if args.output_file:
+                print_error("Error: --output cannot be combined with batch mode, which writes a file per organization")
+                return 1
+            if not cfg_ws.get(ORG_ENV):
+                cfg_ws[ORG_ENV] = batch_orgs[0].domain
         else:
-            with open(header_image_file, "wb") as img:
-                image_b64 = default_image_b64
-                img.write(base64.decodebytes(image_b64.encode()))
-
-    if cfg_st[HDR_IMG]:
-        try:
-            img_w, img_h = get_image_res(header_image_file)
-            header_row += 1
-            img_scale = limit_image_height / img_h if limit_image_height > 0 else 1
-            img_row_height = limit_image_height if limit_image_height > 0 else img_h
-            sheet.insert_image(0, 0, header_image_file, {'object_position': 1, 'x_scale': img_scale, 'y_scale': img_scale})
-            sheet.set_row(0, img_row_height)
-            sheet.merge_range('A1:{}1'.format(chr(ord('@')+len(title_headers))), "")
-        except ValueError as val_err:
-            if debug:
-                print('[{}] [{}] Error: {}'.format(s_line(), fnm(), val_err))
-            else:
-                print('Error: {}'.format(val_err))
-            include_header_image = False
-
-    max_col_widths = []
-    # Populate headers
-    for h in range(len(title_headers)):
-        sheet.write(header_row, h, title_headers[h], format_header)
-        col_width = len(title_headers[h])
-        max_col_widths.append(col_width)
-
-    # Populate table
-    for t in range(len(title_headers)):
-        col_width = len(title_headers[t])
-
-    row = header_row + 1
-    for i, item in enumerate(most_common):
-        name, uuid, type, grp, art, ver = item[0].split('|')
-        occ = item[1]
-        lib_url = ws_lib_url + uuid
-        lib = [name, type, grp, art, ver, occ]
-        for m in range(len(title_headers)):
-            if m == 0:
-                sheet.write_url(row, m, lib_url, string=name)
+            if not cfg_ws[ORG_NAME]:
+                cfg_ws[ORG_NAME] = input("Organization Name: ")
+                cfg = update_config(SEC_WS, ORG_NAME, cfg_ws[ORG_NAME])
+            if not cfg_ws[ORG_ENV]:
+                cfg_ws[ORG_ENV] = input("Domain: ")
+                cfg = update_config(SEC_WS, ORG_ENV, cfg_ws[ORG_ENV])
+            if not cfg_ws[ORG_TOKEN]:
+                cfg_ws[ORG_TOKEN] = input("API Key: ")
+                cfg = update_config(SEC_WS, ORG_TOKEN, cfg_ws[ORG_TOKEN])
+            if not cfg_ws[USER_KEY]:
+                cfg_ws[USER_KEY] = input("User Key: ")
+                cfg = update_config(SEC_WS, USER_KEY, cfg_ws[USER_KEY])
+            if not cfg_st[COMP_NAME]:
+                cfg_st[COMP_NAME] = cfg_ws[ORG_NAME]
+                cfg = update_config(SEC_ST, COMP_NAME, cfg_st[COMP_NAME])
+        if not cfg_st.get(DFLT_PRD):
+            cfg_st[DFLT_PRD] = str(default_period_months)
+        if args.alert_types != [ALERT_TYPE_REJECTED] and (args.serve or args.enrich):
+            # The service index and library details are of rejected libraries
+            print_error('Error: --alert-types cannot be combined with --serve or --enrich')
+            return 1
+        if args.serve:
+            return run_service(args, cfg_ws, cfg_st, metrics)
+        if not end_date:
+            end_date = today.strftime('%Y-%m-%d')
+        if not start_date:
+            if prompt_date:
+                if use_date_picker:
+                    start_date = date_picker()
+                else:
+                    start_date = input("Start Date (yyyy-MM-dd): ")
             else:
-                sheet.write(row, m, lib[m])
-            max_col_widths[m] = max(len(str(lib[m])), max_col_widths[m])
-        row += 1
-
-    for c in range(len(max_col_widths)):
-        sheet.set_column(c, c, max_col_widths[c])
-
-    sheet.freeze_panes(header_row + 1, 0)  # Freeze first row
-    workbook.close()
-
-    if cfg_st[HDR_IMG] and os.path.isfile(header_image_file):
-        os.remove(header_image_file)
-
-    print("Done")
-except KeyboardInterrupt:
-    sys.exit(0)
+                dt_end = datetime.strptime(end_date, '%Y-%m-%d')
+                dt_start = dt_end - relativedelta(months=int(cfg_st[DFLT_PRD]))
+                start_date = dt_start.strftime('%Y-%m-%d')
+
+        # Validate start and end dates
+        sdate_validation = validate_date(start_date)
+        if sdate_validation:
+            print_error('Invalid Start Date: {}'.format(sdate_validation))
+            return 1
+        edate_validation = validate_date(end_date)
+        if edate_validation:
+            print_error('Invalid End Date: {}'.format(edate_validation))
+            return 1
+        if args.bucket and args.output_format != exports.FORMAT_XLSX:
+            print_error('Error: --bucket requires the {} format'.format(exports.FORMAT_XLSX))
+            return 1
+        if args.compare_previous and (args.output_format != exports.FORMAT_XLSX or args.bucket):
+            print_error('Error: --compare-previous requires the {} format and cannot be combined with --bucket'.format(
+                exports.FORMAT_XLSX))
+            return 1
+        if len(args.alert_types) > 1 and (args.output_format != exports.FORMAT_XLSX or args.bucket or
+                                          args.compare_previous or args.rank_by != RANK_BY_OCCURRENCES):
+            print_error('Error: Several --alert-types require the {} format and cannot be combined with --bucket, '
+                        '--compare-previous or --rank-by'.format(exports.FORMAT_XLSX))
+            return 1
+        if args.rank_by != RANK_BY_OCCURRENCES and (args.bucket or args.compare_previous or args.cache_file or
+                                                    args.approx_capacity):
+            # Trends, comparisons, the cache and Space-Saving counters only keep occurrences
+            print_error('Error: --rank-by {} cannot be combined with --bucket, --compare-previous, --cache or '
+                        '--approx-capacity'.format(args.rank_by))
+            return 1
+        if args.approx_capacity and (args.bucket or args.compare_previous):
+            # Trends and comparisons count occurrences per period, which Space-Saving counters do not keep
+            print_error('Error: --approx-capacity cannot be combined with --bucket or --compare-previous')
+            return 1
+        metrics.add(stage_metrics.STAGE_CONFIG_LOAD, time.perf_counter() - t_config)
+        metrics.emit(stage_metrics.STAGE_CONFIG_LOAD)
+
+        print("")
+        ws_url = get_ws_url(cfg_ws[ORG_ENV])
+        ws_lib_url = get_ws_lib_url(ws_url)
+        # Cached days older than both the requested (or compared) and the default period are dropped
+        first_date = previous_period(start_date, end_date)[0] if args.compare_previous else start_date
+        retain_from = min(datetime.strptime(first_date, '%Y-%m-%d'),
+                          today - relativedelta(months=int(cfg_st[DFLT_PRD]))).strftime('%Y-%m-%d')
+        include_header_image = cfg_st.getboolean(HDR_IMG, fallback=default_include_header_image)
+
+        # Reports replace their previous file atomically, so concurrent runs can share the files directory
+        cwd = os.getcwd()
+        files_dir = os.path.join(cwd, "files")
+
+        if batch_orgs:
+            os.makedirs(files_dir, exist_ok=True)
+            failed = run_batch(batch_orgs, args, cfg_st.get(COMP_NAME) or "Organizations", title, start_date, end_date,
+                               retain_from, files_dir, ws_lib_url, include_header_image, metrics)
+        else:
+            output_title = get_output_title(cfg_st[COMP_NAME], title, start_date, end_date)
+            spreadsheet_filename = "{}.{}".format(output_title, args.output_format)
+
+            # Get all alerts of the alert types (Policy Violation by default), streamed straight into the library
+            # occurrences count
+            with WsClient(get_ws_api_url(ws_url), agent_info_details, timeout=args.timeout, retries=args.retries,
+                          pool_size=get_pool_size(args)) as ws_client:
+                fetcher, lib_occs, type_occs = get_type_lib_occurrences(ws_client, cfg_ws[USER_KEY], cfg_ws[ORG_TOKEN],
+                                                                        start_date, end_date, args, metrics,
+                                                                        retain_from)
+
+                # Create a spreadsheet (or CSV/JSON lines export) of the top N (or all)
+                print("Generating {}: {}".format("spreadsheet" if args.output_format == exports.FORMAT_XLSX
+                                                 else "export", args.output_file or spreadsheet_filename))
+                report_file = report_stream if report_stream is not None else args.output_file
+                if not report_file:
+                    os.makedirs(files_dir, exist_ok=True)
+                    report_file = os.path.join(files_dir, spreadsheet_filename)
+                write_report(lib_occs, report_file, args, title, ws_lib_url,
+                             include_header_image, start_date, end_date, metrics,
+                             get_enricher(ws_client, cfg_ws[USER_KEY], cfg_ws[ORG_TOKEN], args),
+                             *get_fetched_breakdowns(fetcher, args), type_occs)
+            failed = 0
+
+        # In pipeline order
+        for stage in (stage_metrics.STAGE_API_REQUEST, stage_metrics.STAGE_JSON_DECODE,
+                      stage_metrics.STAGE_GAV_EXTRACTION, stage_metrics.STAGE_COUNTING,
+                      stage_metrics.STAGE_ENRICHMENT, stage_metrics.STAGE_WORKBOOK_WRITE):
+            if stage != stage_metrics.STAGE_ENRICHMENT or args.enrich:
+                metrics.emit(stage)
+        records = metrics.records
+        metrics.set(stage_metrics.STAGE_TOTAL, seconds=time.perf_counter() - t_start,
+                    bytes_received=records.get(stage_metrics.STAGE_API_REQUEST, {}).get('bytes_received', 0),
+                    alerts=records.get(stage_metrics.STAGE_GAV_EXTRACTION, {}).get('alerts', 0),
+                    unique_libraries=records.get(stage_metrics.STAGE_COUNTING, {}).get('unique_libraries', 0))
+        metrics.emit(stage_metrics.STAGE_TOTAL)
+
+        if failed:
+            print_error("Failed to report {} of {} organizations".format(failed, len(batch_orgs)))
+            return 1
+        print("Done")
+    except WsApiError as api_err:
+        print_error(str(api_err))
+        return int(api_err.error_code)
+    except WsError as ws_err:
+        # Transport errors, and responses too large to process under the organization scope
+        print_error('Error: {}'.format(ws_err))
+        return 1
+    except KeyboardInterrupt:
+        return 0
+    return 0
+
+
+if __name__ == '__main__':
+    if not __package__:
+        # Executed as a script from the package directory
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ws_top10_rejected_libs.defaults import default_connect_timeout, default_read_timeout, default_retries
+from ws_top10_rejected_libs.json_stream import iter_object_array
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+default_backoff = 1.0  # Base delay in seconds, doubled on every attempt
+default_max_backoff = 60.0
+stream_chunk_size = 1 << 16  # Size in bytes of the chunks read from streamed responses
+
+
+class WsError(Exception):
+    pass
+
+
+class WsApiError(WsError):
+    """The API answered with an 'errorCode'"""
+
+    def __init__(self, error_code, error_message: str):
+        super().__init__("Error {}: {}".format(error_code, error_message))
+        self.error_code = error_code
+        self.error_message = error_message
+
+
+class WsTransportError(WsError):
+    """The request could not be completed (connection failure, timeout, HTTP error or truncated response)"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class WsStreamError(WsTransportError):
+    """A streamed response failed after it started, which the client cannot retry on its own"""
+
+
+class WsResponseTooLarge(WsError):
+    """A streamed response exceeded the size the caller is willing to process"""
+
+    def __init__(self, message: str, max_bytes: int):
+        super().__init__(message)
+        self.max_bytes = max_bytes
+
+
+class TransferStats:
+    """Bytes received and time spent sending requests and waiting for response data, summed over threads"""
+
+    def __init__(self):
+        self.bytes_received = 0
+        self.request_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, count: int, seconds: float):
+        with self._lock:
+            self.bytes_received += count
+            self.request_seconds += seconds
+
+
+class WsClient:
+    """Pooled WhiteSource API client.
+
+    A single keep-alive session is shared by all calls (and threads). Connection errors, timeouts and
+    retryable HTTP statuses are retried with exponential backoff and full jitter, honouring 'Retry-After'.
+
+    The transfer of all calls is summed in `transfer`, and that of a single call in the `transfer` it is passed,
+    so callers sharing the client can tell their own transfer apart.
+    """
+
+    def __init__(self, api_url: str, agent_info: Dict[str, str] = None, timeout: float = default_read_timeout,
+                 connect_timeout: float = default_connect_timeout, retries: int = default_retries,
+                 backoff: float = default_backoff, max_backoff: float = default_max_backoff, pool_size: int = 10):
+        self.api_url = api_url
+        self.agent_info = agent_info
+        self.timeout = (connect_timeout, timeout)
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        self.session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.transfer = TransferStats()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _retry_delay(self, attempt: int, response: requests.Response = None) -> float:
+        if response is not None:
+            try:
+                return min(float(response.headers['Retry-After']), self.max_backoff)
+            except (KeyError, ValueError):
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def _post(self, payload: Dict[str, Any], stream: bool = False,
+              transfer: TransferStats = None) -> requests.Response:
+        if self.agent_info and 'agentInfo' not in payload:
+            payload = dict(payload, agentInfo=self.agent_info)
+        for attempt in range(1, self.retries + 1):
+            response = None
+            try:
+                t = time.perf_counter()
+                response = self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=stream)
+                self._add_transfer(transfer, 0, time.perf_counter() - t)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    if not response.ok:
+                        response.close()
+                        raise WsTransportError("HTTP {} from {}".format(response.status_code, self.api_url),
+                                               response.status_code)
+                    return response
+                response.close()
+                err = WsTransportError("HTTP {} from {}".format(response.status_code, self.api_url),
+                                       response.status_code)
+            except (requests.ConnectionError, requests.Timeout) as conn_err:
+                err = WsTransportError("{} request failed: {}".format(payload.get('requestType'), conn_err))
+            if attempt == self.retries:
+                raise err
+            delay = self._retry_delay(attempt, response)
+            logger.debug("%s (attempt %d/%d), retrying in %.1fs", err, attempt, self.retries, delay)
+            time.sleep(delay)
+
+    @staticmethod
+    def _check_error(r_json: dict):
+        if r_json.get('errorCode'):
+            raise WsApiError(r_json['errorCode'], r_json.get('errorMessage', ""))
+
+    def request(self, payload: Dict[str, Any], transfer: TransferStats = None) -> dict:
+        with self._post(payload, transfer=transfer) as response:
+            t = time.perf_counter()
+            content = response.content
+            self._add_transfer(transfer, len(content), time.perf_counter() - t)
+            try:
+                r_json = response.json()
+            except ValueError as json_err:
+                raise WsTransportError("Invalid response from {}: {}".format(self.api_url, json_err))
+        self._check_error(r_json)
+        return r_json
+
+    def request_stream(self, payload: Dict[str, Any], array_key: str, max_bytes: int = 0,
+                       transfer: TransferStats = None) -> Iterator[Any]:
+        """Yield the items of the response's `array_key` array without holding the whole response in memory.
+
+        Only the request itself is retried: a failure after items were yielded raises WsStreamError.
+        Reading more than `max_bytes` (if set) raises WsResponseTooLarge.
+        """
+        r_header = {}
+        with self._post(payload, stream=True, transfer=transfer) as response:
+            try:
+                yield from iter_object_array(self._iter_chunks(response, max_bytes, transfer), array_key, r_header)
+            except requests.RequestException as stream_err:
+                raise WsStreamError("Reading response from {} failed: {}".format(self.api_url, stream_err))
+            except ValueError as json_err:
+                raise WsTransportError("Invalid response from {}: {}".format(self.api_url, json_err))
+        self._check_error(r_header)
+
+    def _iter_chunks(self, response: requests.Response, max_bytes: int = 0,
+                     transfer: TransferStats = None) -> Iterator[bytes]:
+        chunks = response.iter_content(chunk_size=stream_chunk_size)
+        size = 0
+        while True:
+            t = time.perf_counter()
+            chunk = next(chunks, None)
+            self._add_transfer(transfer, len(chunk) if chunk else 0, time.perf_counter() - t)
+            if chunk is None:
+                return
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise WsResponseTooLarge("Response from {} exceeds {} bytes".format(self.api_url, max_bytes), max_bytes)
+            yield chunk
+
+    def _add_transfer(self, transfer: Optional[TransferStats], count: int, seconds: float):
+        self.transfer.add(count, seconds)
+        if transfer is not None:
+            transfer.add(count, seconds)